@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+"""
+Benchmark du temps d'import de l'application (démarrage, commandes manage.py).
+
+Lance dans un sous-processus `python -X importtime` le chargement de Django
+puis des modules de ocrapp (vues, URL, commandes), et rapporte le temps
+cumulé, les modules les plus coûteux et la mémoire (RSS). Échoue si une pile
+lourde (doctr/torch, docling, SDK LLM, reportlab, openpyxl...) est importée
+au chargement, ou si le temps total dépasse la référence enregistrée.
+
+Usage: python benchmark_import_time.py [--baseline benchmarks/import_baseline.json]
+       [--write-baseline] [--rounds 3] [--top 15]
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCHMARK_DIR = os.path.join(BASE_DIR, 'benchmarks')
+
+# Paquets qui ne doivent être chargés qu'au premier usage
+LAZY_MODULES = (
+    'torch', 'doctr', 'docling', 'openai', 'google.generativeai',
+    'reportlab', 'openpyxl', 'pytesseract', 'tesserocr', 'pdf2image',
+)
+
+IMPORT_SCRIPT = """
+import os, resource, sys
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ticketocr.settings')
+import django
+django.setup()
+import ocrapp.views, ocrapp.urls, ticketocr.urls
+import ocrapp.management.commands.ingest_tickets, ocrapp.management.commands.watch_tickets
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print('RSS_KB', rss // 1024 if sys.platform == 'darwin' else rss, file=sys.stderr)
+"""
+
+IMPORTTIME_RE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--baseline', default=os.path.join(BENCHMARK_DIR, 'import_baseline.json'))
+    parser.add_argument('--write-baseline', action='store_true', help="Enregistrer ce résultat comme référence")
+    parser.add_argument('--tolerance', type=float, default=0.30, help="Hausse du temps d'import tolérée (0.30 = +30 %%)")
+    parser.add_argument('--rounds', type=int, default=3, help="Mesures (la médiane est retenue)")
+    parser.add_argument('--top', type=int, default=15, help="Modules les plus coûteux à afficher")
+    return parser.parse_args()
+
+
+def measure_once():
+    """Un démarrage à froid : (modules {nom: (propre_us, cumulé_us, profondeur)}, rss_mb)"""
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', IMPORT_SCRIPT],
+        cwd=BASE_DIR, capture_output=True, text=True,
+    )
+    if process.returncode != 0:
+        raise RuntimeError(process.stderr.strip().splitlines()[-1] if process.stderr.strip() else "échec de l'import")
+    modules = {}
+    rss_mb = None
+    for line in process.stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules[name] = (int(self_us), int(cumulative_us), len(indent) // 2)
+        elif line.startswith('RSS_KB'):
+            rss_mb = round(int(line.split()[1]) / 1024, 1)
+    return modules, rss_mb
+
+
+def lazy_violations(modules):
+    """Paquets lourds chargés au démarrage, avec leur coût cumulé (ms)"""
+    found = {}
+    for name, (_, cumulative_us, _) in modules.items():
+        for package in LAZY_MODULES:
+            if name == package or name.startswith(package + '.'):
+                found[package] = max(found.get(package, 0), round(cumulative_us / 1000, 1))
+    return found
+
+
+def main():
+    args = parse_args()
+    runs = []
+    for _ in range(max(1, args.rounds)):
+        runs.append(measure_once())
+    modules, _ = runs[-1]
+    # Temps total : somme des temps propres (chaque module compté une fois)
+    totals = [round(sum(self_us for self_us, _, _ in mods.values()) / 1000, 1) for mods, _ in runs]
+    result = {
+        'total_ms': statistics.median(totals),
+        'rss_mb': statistics.median(rss for _, rss in runs if rss is not None) if any(rss for _, rss in runs) else None,
+        'modules': len(modules),
+        'lazy_violations': lazy_violations(modules),
+        'top': [
+            {'module': name, 'cumulative_ms': round(cumulative_us / 1000, 1)}
+            for name, (_, cumulative_us, _) in sorted(modules.items(), key=lambda item: -item[1][1])[:args.top]
+        ],
+        'ocrapp_ms': {
+            name: round(cumulative_us / 1000, 1)
+            for name, (_, cumulative_us, _) in sorted(modules.items())
+            if name.startswith('ocrapp')
+        },
+    }
+
+    print(f"Import de l'application : {result['total_ms']} ms (médiane de {len(runs)}), "
+          f"{result['modules']} modules, RSS {result['rss_mb']} Mo\n")
+    print("Modules les plus coûteux (cumulé) :")
+    for row in result['top']:
+        print(f"  {row['module']:<50} {row['cumulative_ms']:>9} ms")
+
+    status = 0
+    if result['lazy_violations']:
+        print("\n❌ Paquets lourds importés au démarrage :")
+        for package, ms in sorted(result['lazy_violations'].items(), key=lambda item: -item[1]):
+            print(f"  {package:<24} {ms:>9} ms")
+        status = 1
+    else:
+        print("\n✅ Aucune pile lourde chargée au démarrage")
+
+    if args.write_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"Référence enregistrée dans {args.baseline}")
+        return status
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            before = json.load(f).get('total_ms')
+        if before:
+            regression = result['total_ms'] > before * (1 + args.tolerance)
+            change = (result['total_ms'] - before) / before * 100
+            flag = "❌ RÉGRESSION" if regression else "✅"
+            print(f"Référence : {before} ms → {result['total_ms']} ms  {change:+.1f} %  {flag}")
+            if regression:
+                status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
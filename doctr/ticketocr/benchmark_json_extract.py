@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark et fuzzing de l'extraction JSON des réponses LLM.
+
+Trois volets :
+- corpus : chaque réponse de benchmarks/json_responses.json (Qwen3 avec blocs
+  <think>, format Gemini) doit donner l'objet attendu ;
+- fuzzing : mutations déterministes du corpus (prose et accolades parasites,
+  longs raisonnements, brouillons, troncatures, caractères aléatoires,
+  tableaux imbriqués sur DEEP_NESTING niveaux dans le ticket).
+  L'extraction ne doit jamais lever d'exception, et les mutations qui
+  conservent le ticket doivent redonner l'objet attendu ;
+- montée en charge : réponses de 10 k à 160 k caractères (raisonnement,
+  accolades dans la prose, centaines d'articles). Le temps par caractère doit
+  rester stable, ce qui montre un temps linéaire.
+
+Usage: python benchmark_json_extract.py [--corpus benchmarks/json_responses.json]
+       [--mutations 200] [--seed 0] [--rounds 5] [--max-growth 3]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+import django
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCHMARK_DIR = os.path.join(BASE_DIR, 'benchmarks')
+
+SIZES = (10_000, 20_000, 40_000, 80_000, 160_000)
+
+# Au-delà de la limite de récursion de json.loads
+DEEP_NESTING = 5000
+
+NOISE = (
+    "Exemple de format : {champ: valeur} puis {\"nom\": \"x\"}. ",
+    "Le total } semble correct { à vérifier. ",
+    "Il a écrit \"Total\" et 'Magasin' entre guillemets. ",
+    "<b>Note</b> : les montants sont en DT. ",
+)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--corpus', default=os.path.join(BENCHMARK_DIR, 'json_responses.json'))
+    parser.add_argument('--mutations', type=int, default=200, help="Mutations par réponse du corpus")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--rounds', type=int, default=5, help="Mesures par taille (la médiane est retenue)")
+    parser.add_argument('--max-growth', type=float, default=3.0,
+                        help="Rapport maximal du temps par caractère entre la plus grande et la plus petite taille")
+    return parser.parse_args()
+
+
+def load_corpus(path):
+    with open(path, encoding='utf-8') as f:
+        return {name: entry for name, entry in json.load(f).items() if not name.startswith('_')}
+
+
+# Mutations : (nom, conserve le ticket, fonction(réponse, rng))
+
+def add_prose(response, rng):
+    return "".join(rng.choice(NOISE) for _ in range(rng.randint(1, 5))) + response + "\n" + rng.choice(NOISE)
+
+
+def long_reasoning(response, rng):
+    lines = [
+        f"Article {i} : {{\"nom\": \"ARTICLE {i}\", \"prix\": \"{rng.randint(1, 99)}.{rng.randint(0, 999):03d} DT\"}}"
+        for i in range(rng.randint(20, 200))
+    ]
+    return "<think>\n" + "\n".join(lines) + "\n</think>\n" + response
+
+
+def draft_first(response, rng):
+    # Brouillon d'un seul champ : moins bien noté que le ticket complet
+    return f"Premier essai : {{\"Magasin\": \"BROUILLON {rng.randint(0, 99)}\"}}\nVersion finale :\n" + response
+
+
+def truncate(response, rng):
+    return response[:rng.randint(0, len(response))]
+
+
+def random_chars(response, rng):
+    chars = list(response)
+    for _ in range(rng.randint(1, 20)):
+        chars.insert(rng.randint(0, len(chars)), rng.choice('{}[]"\'\\<>:,'))
+    return "".join(chars)
+
+
+def deep_nesting(response, rng):
+    # Valeur adverse dans un objet du ticket : [[[...]]] sur DEEP_NESTING niveaux
+    openings = [i for i, char in enumerate(response) if char == '{']
+    if not openings:
+        return response + '[' * DEEP_NESTING
+    i = rng.choice(openings) + 1
+    return response[:i] + '"Imbrication": ' + '[' * DEEP_NESTING + ']' * DEEP_NESTING + ', ' + response[i:]
+
+
+MUTATIONS = (
+    ('prose', True, add_prose),
+    ('raisonnement', True, long_reasoning),
+    ('brouillon', True, draft_first),
+    ('troncature', False, truncate),
+    ('caracteres', False, random_chars),
+    ('imbrication', False, deep_nesting),
+)
+
+
+def check_corpus(corpus, extract):
+    failures = []
+    for name, entry in corpus.items():
+        if extract(entry['response']) != entry['expected']:
+            failures.append(name)
+    return failures
+
+
+def fuzz(corpus, extract, mutations, seed):
+    """Compteurs par mutation : essais, exceptions, tickets perdus (mutations qui le conservent)"""
+    rng = random.Random(seed)
+    results = {name: {'runs': 0, 'exceptions': 0, 'mismatches': 0} for name, _, _ in MUTATIONS}
+    for entry in corpus.values():
+        for _ in range(mutations):
+            name, preserves, mutate = rng.choice(MUTATIONS)
+            mutated = mutate(entry['response'], rng)
+            stats = results[name]
+            stats['runs'] += 1
+            try:
+                result = extract(mutated)
+            except Exception:
+                stats['exceptions'] += 1
+                continue
+            if preserves and result != entry['expected']:
+                stats['mismatches'] += 1
+    return results
+
+
+def long_response(size, rng):
+    """Réponse type Qwen3 d'environ `size` caractères : raisonnement, prose à accolades, gros ticket"""
+    articles = []
+    reasoning = []
+    prose = []
+    length = 0
+    i = 0
+    while length < size:
+        article = {"nom": f"ARTICLE {i}", "prix": f"{rng.randint(1, 99)}.{rng.randint(0, 999):03d} DT"}
+        articles.append(article)
+        reasoning.append(f"Ligne {i} : {json.dumps(article, ensure_ascii=False)} à vérifier.")
+        prose.append(rng.choice(NOISE))
+        length += 2 * len(reasoning[-1]) + len(prose[-1])
+        i += 1
+    ticket = {"Magasin": "AZIZA", "NumeroTicket": "10042", "Date": "18/01/2025", "Articles": articles, "Total": "1.000 DT"}
+    return ("<think>\n" + "\n".join(reasoning) + "\n</think>\n" + "".join(prose) + "\n"
+            + json.dumps(ticket, ensure_ascii=False, indent=2))
+
+
+def scaling(extract, rounds, seed):
+    rng = random.Random(seed)
+    rows = []
+    for size in SIZES:
+        text = long_response(size, rng)
+        timings = []
+        for _ in range(max(1, rounds)):
+            start = time.perf_counter()
+            result = extract(text)
+            timings.append(time.perf_counter() - start)
+        assert result and result.get('Magasin') == 'AZIZA', "ticket non retrouvé"
+        median = statistics.median(timings)
+        rows.append({
+            'chars': len(text),
+            'ms': round(median * 1000, 2),
+            'ns_per_char': round(median * 1e9 / len(text), 1),
+        })
+    return rows
+
+
+def main():
+    args = parse_args()
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ticketocr.settings')
+    django.setup()
+    from ocrapp.json_extract import extract_ticket_json
+
+    status = 0
+    corpus = load_corpus(args.corpus)
+    failures = check_corpus(corpus, extract_ticket_json)
+    print(f"Corpus : {len(corpus) - len(failures)}/{len(corpus)} réponses correctes")
+    for name in failures:
+        print(f"  ❌ {name}")
+    status |= int(bool(failures))
+
+    print(f"\nFuzzing ({args.mutations} mutations par réponse, graine {args.seed}) :")
+    for name, stats in fuzz(corpus, extract_ticket_json, args.mutations, args.seed).items():
+        flag = "❌" if stats['exceptions'] or stats['mismatches'] else "✅"
+        print(f"  {name:<14} essais={stats['runs']:>5}  exceptions={stats['exceptions']}  "
+              f"tickets perdus={stats['mismatches']}  {flag}")
+        status |= int(bool(stats['exceptions'] or stats['mismatches']))
+
+    print("\nMontée en charge :")
+    rows = scaling(extract_ticket_json, args.rounds, args.seed)
+    for row in rows:
+        print(f"  {row['chars']:>8} caractères  {row['ms']:>9} ms  {row['ns_per_char']:>7} ns/caractère")
+    growth = rows[-1]['ns_per_char'] / rows[0]['ns_per_char']
+    linear = growth <= args.max_growth
+    print(f"  Temps par caractère ×{growth:.2f} de {rows[0]['chars']} à {rows[-1]['chars']} caractères  "
+          f"{'✅ linéaire' if linear else '❌ croissance super-linéaire'}")
+    status |= int(not linear)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+"""
+Serveur LLM factice pour les benchmarks hors ligne.
+
+Répond aux protocoles utilisés par le pipeline :
+- Ollama : POST /api/generate, GET /api/tags
+- OpenAI (routeur HuggingFace) : POST /v1/chat/completions
+
+La réponse est un JSON de ticket déduit du texte OCR présent dans le prompt
+(magasin, date, total, numéro, articles) par expressions régulières, avec un
+bloc <think> comme Qwen3 et une latence simulée : le benchmark mesure le code
+du pipeline autour du LLM, sans réseau ni modèle.
+
+Avec une sortie contrainte (Ollama `format`, OpenAI `response_format`), la
+réponse est le JSON seul. En texte libre, --invalid-rate rend une part des
+réponses inexploitables (JSON tronqué), comme un modèle qui s'interrompt.
+
+Les réponses en flux (Ollama `stream`, OpenAI `stream`) sont découpées en
+jetons de quatre caractères au plus, espacés de --token-ms. Le serveur compte
+les jetons envoyés et les jetons économisés : bloc <think> omis sur
+`/no_think`, fin de réponse non envoyée quand le client ferme le flux.
+
+Usage: python benchmark_llm_stub.py [--port 11434] [--latency-ms 200] [--invalid-rate 0.2] [--token-ms 5]
+"""
+import argparse
+import json
+import re
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+AMOUNT = r'(\d{1,4}[.,]\d{3})'
+TOTAL_RE = re.compile(r'(?:total|net\s*a\s*payer|a\s*payer)[^\d\n]{0,20}' + AMOUNT, re.IGNORECASE)
+DATE_RE = re.compile(r'\b(\d{1,2})[/.-](\d{1,2})[/.-](\d{2,4})(?:\s+(\d{1,2}:\d{2}))?')
+TICKET_RE = re.compile(r'(?:ticket|n[°o]|num)\s*[:.]?\s*(\d{3,})', re.IGNORECASE)
+ARTICLE_RE = re.compile(r'^\s*([A-Za-z][^\n]{2,40}?)\s+' + AMOUNT + r'\s*(?:DT)?\s*$', re.IGNORECASE | re.MULTILINE)
+TIMBRE_RE = re.compile(r'timbre[^\n]*?(0[.,]\d{3})', re.IGNORECASE)
+TOKEN_RE = re.compile(r'\s*\S{1,4}|\s+$')
+
+THINK_BLOCK = (
+    "<think>\nLecture du ticket : repérer le magasin en en-tête, la date et le numéro, "
+    "puis les lignes d'articles avec leur prix, le timbre fiscal et le total à payer. "
+    "Vérifier que la somme des articles correspond au total.\n</think>\n"
+)
+TRAILER = "\n\nLes montants sont exprimés en dinars (DT)."
+
+SECTION_RE = re.compile(r'---\s*OCR\s+(\w+)\s*---\n(.*?)(?=\n---\s*OCR|\nTa t|\nExtrais|\Z)', re.DOTALL)
+
+
+def ocr_text_from_prompt(prompt):
+    """Texte OCR du prompt : section Doctr en priorité, sinon toutes les sections"""
+    sections = dict((name.lower(), text) for name, text in SECTION_RE.findall(prompt))
+    if sections.get('doctr', '').strip():
+        return sections['doctr']
+    return "\n".join(sections.values()) or prompt
+
+
+def amount(value):
+    return f"{float(value.replace(',', '.')):.3f} DT"
+
+
+def extract_ticket(text):
+    """Extraction déterministe des champs d'un ticket"""
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    magasin = next((line for line in lines if re.search(r'[A-Za-z]{3,}', line)), "")
+    date_match = DATE_RE.search(text)
+    date = ""
+    if date_match:
+        day, month, year, hour = date_match.groups()
+        year = year if len(year) == 4 else f"20{year}"
+        date = f"{int(day):02d}/{int(month):02d}/{year}" + (f" {hour}" if hour else "")
+    total = TOTAL_RE.search(text)
+    ticket = TICKET_RE.search(text)
+    articles = [
+        {"nom": "TIMBRE FISCAL" if name.strip().lower().startswith('timbre') else name.strip(), "prix": amount(price)}
+        for name, price in ARTICLE_RE.findall(text)
+        if not re.match(r'(total|net|a payer|especes|rendu|remise)', name.strip(), re.IGNORECASE)
+    ]
+    timbre = TIMBRE_RE.search(text)
+    if timbre and not any(a["nom"].upper() == "TIMBRE FISCAL" for a in articles):
+        articles.append({"nom": "TIMBRE FISCAL", "prix": amount(timbre.group(1))})
+    return {
+        "Magasin": magasin[:60],
+        "NumeroTicket": ticket.group(1) if ticket else "",
+        "Date": date,
+        "Articles": articles,
+        "Total": amount(total.group(1)) if total else "",
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    server_version = "TicketOCRStub/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, payload, status=200):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def _answer(self, prompt, constrained=False):
+        """(réponse, jetons de raisonnement omis sur /no_think)"""
+        self.server.record(constrained)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        ticket = extract_ticket(ocr_text_from_prompt(prompt))
+        if constrained:
+            return json.dumps(ticket, ensure_ascii=False), 0
+        content = json.dumps(ticket, ensure_ascii=False, indent=2)
+        # Part déterministe (selon le prompt) de réponses tronquées
+        if self.server.invalid_rate and zlib.crc32(prompt.encode('utf-8')) % 1000 < self.server.invalid_rate * 1000:
+            content = content[:len(content) // 2]
+        else:
+            content += TRAILER
+        if not self.server.think:
+            return content, 0
+        if '/no_think' in prompt:
+            return content, len(TOKEN_RE.findall(THINK_BLOCK))
+        return THINK_BLOCK + content, 0
+
+    def _stream(self, content, content_type, frame, end):
+        """Envoie la réponse jeton par jeton ; retourne le nombre de jetons envoyés"""
+        tokens = TOKEN_RE.findall(content)
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.end_headers()
+        sent = 0
+        try:
+            for token in tokens:
+                self.wfile.write(frame(token))
+                sent += 1
+                if self.server.token_delay:
+                    time.sleep(self.server.token_delay)
+            self.wfile.write(end(sent))
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        self.close_connection = True
+        return sent, len(tokens) - sent
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/api/tags':
+            return self._send({"models": [{"name": name} for name in ("mistral", "llama2")]})
+        if self.path.rstrip('/') == '/v1/models':
+            return self._send({"object": "list", "data": [{"id": "Qwen/Qwen3-30B-A3B:novita", "object": "model"}]})
+        self._send({"error": "not found"}, 404)
+
+    def do_POST(self):
+        data = self._read_json()
+        if self.path.rstrip('/') == '/api/generate':
+            content, saved = self._answer(data.get('prompt', ''), constrained=bool(data.get('format')))
+            model = data.get('model', '')
+            created_at = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+            # Comme Ollama, réponse en flux sauf "stream": false
+            if data.get('stream', True):
+                sent, unsent = self._stream(
+                    content, 'application/x-ndjson',
+                    lambda token: (json.dumps({"model": model, "created_at": created_at, "response": token,
+                                               "done": False}, ensure_ascii=False) + "\n").encode('utf-8'),
+                    lambda sent: (json.dumps({"model": model, "created_at": created_at, "response": "",
+                                              "done": True, "eval_count": sent}) + "\n").encode('utf-8'),
+                )
+                return self.server.record_tokens(sent, saved + unsent)
+            self.server.record_tokens(len(TOKEN_RE.findall(content)), saved)
+            return self._send({
+                "model": model,
+                "created_at": created_at,
+                "response": content,
+                "done": True,
+                "eval_count": len(TOKEN_RE.findall(content)),
+            })
+        if self.path.rstrip('/') in ('/v1/chat/completions', '/chat/completions'):
+            prompt = "\n".join(message.get('content', '') for message in data.get('messages', []))
+            content, saved = self._answer(prompt, constrained=bool(data.get('response_format')))
+            if data.get('stream'):
+                completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+                def chunk(delta, finish_reason=None):
+                    payload = {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": data.get('model', ''),
+                        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                    }
+                    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode('utf-8')
+
+                sent, unsent = self._stream(
+                    content, 'text/event-stream',
+                    lambda token: chunk({"content": token}),
+                    lambda sent: chunk({}, "stop") + b"data: [DONE]\n\n",
+                )
+                return self.server.record_tokens(sent, saved + unsent)
+            self.server.record_tokens(len(TOKEN_RE.findall(content)), saved)
+            return self._send({
+                "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": data.get('model', ''),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": len(prompt.split()), "completion_tokens": len(content.split()),
+                          "total_tokens": len(prompt.split()) + len(content.split())},
+            })
+        self._send({"error": "not found"}, 404)
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency_ms=0, think=True, invalid_rate=0.0, token_ms=0):
+        super().__init__(address, StubHandler)
+        self.latency = latency_ms / 1000
+        self.think = think
+        self.invalid_rate = invalid_rate
+        self.token_delay = token_ms / 1000
+        self.requests = 0
+        self.constrained_requests = 0
+        self.tokens = []  # (envoyés, économisés) par réponse
+        self._lock = threading.Lock()
+
+    def record(self, constrained=False):
+        with self._lock:
+            self.requests += 1
+            self.constrained_requests += int(constrained)
+
+    def record_tokens(self, sent, saved):
+        with self._lock:
+            self.tokens.append((sent, saved))
+
+    def token_stats(self):
+        with self._lock:
+            tokens = list(self.tokens)
+        if not tokens:
+            return {'responses': 0}
+        return {
+            'responses': len(tokens),
+            'tokens_sent': sum(sent for sent, _ in tokens),
+            'tokens_saved': sum(saved for _, saved in tokens),
+            'mean_sent_per_call': round(sum(sent for sent, _ in tokens) / len(tokens), 1),
+            'mean_saved_per_call': round(sum(saved for _, saved in tokens) / len(tokens), 1),
+        }
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def start_stub_server(host='127.0.0.1', port=0, latency_ms=0, think=True, invalid_rate=0.0, token_ms=0):
+    """Démarre le serveur dans un thread ; retourne le serveur (server.url, server.shutdown())"""
+    server = StubServer((host, port), latency_ms, think, invalid_rate, token_ms)
+    threading.Thread(target=server.serve_forever, name='llm-stub', daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11434)
+    parser.add_argument('--latency-ms', type=int, default=0, help="Latence simulée par réponse")
+    parser.add_argument('--no-think', action='store_true', help="Pas de bloc <think> dans les réponses")
+    parser.add_argument('--invalid-rate', type=float, default=0.0, help="Part des réponses en texte libre tronquées")
+    parser.add_argument('--token-ms', type=float, default=0, help="Délai entre deux jetons d'une réponse en flux")
+    args = parser.parse_args()
+
+    server = StubServer((args.host, args.port), args.latency_ms, not args.no_think, args.invalid_rate, args.token_ms)
+    print(f"Serveur LLM factice sur {server.url} (Ollama /api/generate, OpenAI /v1/chat/completions)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,476 @@
+#!/usr/bin/env python
+"""
+Benchmark hors ligne du pipeline OCR + extraction sur le corpus de tickets.
+
+Chaque moteur OCR puis le pipeline complet (étape OCR + analyse LLM) sont
+exécutés sur les images de tickets/ et ../tickets/. Les LLM sont remplacés
+par le serveur factice local (benchmark_llm_stub.py, protocoles Ollama et
+OpenAI) : aucun accès réseau. Le rapport donne les percentiles de latence,
+le débit, le pic de mémoire (RSS) et la précision par champ par rapport au
+fichier de vérité terrain, ainsi que l'issue de l'extraction LLM (JSON lu
+directement, réparé ou invalide ; réponses d'un fournisseur de repli ou des
+regex ; requêtes HTTP retentées). --unstructured désactive la sortie
+contrainte par schéma et --stub-invalid-rate tronque une part des réponses
+en texte libre, pour comparer les deux modes. En flux, le délai avant le
+premier jeton (étape llm_ttft) et les jetons envoyés / économisés par appel
+sont relevés ; --no-stream rétablit les réponses complètes. Le résultat JSON
+peut être comparé à une référence enregistrée pour détecter les régressions.
+Les transcriptions OCR enregistrées (benchmarks/ocr_transcripts.json) passent
+aussi par l'étape LLM et sont notées : la précision reste mesurable quand les
+images ne sont que des pointeurs git-lfs ou que les moteurs OCR manquent.
+
+Usage: python benchmark_pipeline.py [--ground-truth benchmarks/ground_truth.json]
+       [--transcripts benchmarks/ocr_transcripts.json]
+       [--output benchmarks/last_run.json] [--baseline benchmarks/baseline.json]
+       [--write-baseline] [--workers 2] [--rounds 1] [--stub-latency-ms 0]
+       [--unstructured] [--stub-invalid-rate 0.2] [--no-stream] [--stub-token-ms 2]
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import resource
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+import django
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCHMARK_DIR = os.path.join(BASE_DIR, 'benchmarks')
+DEFAULT_DIRS = [os.path.join(BASE_DIR, 'tickets'), os.path.join(os.path.dirname(BASE_DIR), 'tickets')]
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.pdf')
+FIELDS = ('Magasin', 'Date', 'Total', 'NumeroTicket')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--dirs', nargs='+', default=DEFAULT_DIRS, help="Dossiers du corpus")
+    parser.add_argument('--ground-truth', default=os.path.join(BENCHMARK_DIR, 'ground_truth.json'))
+    parser.add_argument('--transcripts', default=os.path.join(BENCHMARK_DIR, 'ocr_transcripts.json'),
+                        help="Transcriptions OCR passées à l'étape LLM ('' : aucune)")
+    parser.add_argument('--output', default=os.path.join(BENCHMARK_DIR, 'last_run.json'))
+    parser.add_argument('--baseline', default=os.path.join(BENCHMARK_DIR, 'baseline.json'))
+    parser.add_argument('--write-baseline', action='store_true', help="Enregistrer ce résultat comme référence")
+    parser.add_argument('--tolerance', type=float, default=0.20, help="Hausse de latence tolérée (0.20 = +20 %%)")
+    parser.add_argument('--min-latency-delta-ms', type=float, default=5.0,
+                        help="Hausse de latence ignorée en dessous de cet écart absolu (bruit des mesures courtes)")
+    parser.add_argument('--accuracy-tolerance', type=float, default=0.02, help="Baisse de précision tolérée (absolue)")
+    parser.add_argument('--engines', nargs='+', default=None, help="Moteurs OCR à mesurer (tous par défaut)")
+    parser.add_argument('--skip-engines', action='store_true', help="Ne mesurer que le pipeline complet")
+    parser.add_argument('--workers', type=int, default=2, help="Tickets traités simultanément par le pipeline")
+    parser.add_argument('--rounds', type=int, default=1)
+    parser.add_argument('--limit', type=int, default=None, help="Nombre maximal de fichiers")
+    parser.add_argument('--stub-latency-ms', type=int, default=0, help="Latence simulée du LLM factice")
+    parser.add_argument('--use-cache', action='store_true', help="Garder les caches OCR et LLM (désactivés par défaut)")
+    parser.add_argument('--unstructured', action='store_true', help="Réponses LLM en texte libre (sans schéma JSON)")
+    parser.add_argument('--stub-invalid-rate', type=float, default=0.0,
+                        help="Part des réponses en texte libre tronquées par le LLM factice")
+    parser.add_argument('--no-stream', action='store_true', help="Réponses LLM complètes (sans flux)")
+    parser.add_argument('--stub-token-ms', type=float, default=0,
+                        help="Délai entre deux jetons du LLM factice (réponses en flux)")
+    return parser.parse_args()
+
+
+# Mesures
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def latency_summary(values):
+    if not values:
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'mean_ms': round(statistics.mean(values), 1),
+        'p50_ms': round(percentile(values, 50), 1),
+        'p90_ms': round(percentile(values, 90), 1),
+        'p95_ms': round(percentile(values, 95), 1),
+        'p99_ms': round(percentile(values, 99), 1),
+        'max_ms': round(max(values), 1),
+    }
+
+
+def peak_rss_mb():
+    # ru_maxrss : kilo-octets sous Linux, octets sous macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def load_corpus(directories, limit=None):
+    """Images lisibles du corpus (les pointeurs git-lfs non récupérés sont ignorés)"""
+    from PIL import Image
+
+    files = []
+    for directory in directories:
+        if not os.path.isdir(directory):
+            continue
+        for name in sorted(os.listdir(directory)):
+            if not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            path = os.path.join(directory, name)
+            if not name.lower().endswith('.pdf'):
+                try:
+                    with Image.open(path) as img:
+                        img.verify()
+                except Exception as e:
+                    print(f"⚠️  Image ignorée {name}: {e}")
+                    continue
+            files.append(path)
+    return files[:limit] if limit else files
+
+
+def load_transcripts(path):
+    """{nom: ocr_results} des transcriptions OCR enregistrées"""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return {name: entry['ocr_results'] for name, entry in json.load(f).items() if not name.startswith('_')}
+
+
+# Précision
+
+def normalize_field(field, value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    if field == 'Total':
+        match = re.search(r'\d+(?:[.,]\d+)?', value.replace(' ', ''))
+        try:
+            return str(Decimal(match.group(0).replace(',', '.')).quantize(Decimal('0.001'))) if match else None
+        except InvalidOperation:
+            return None
+    if field == 'Date':
+        for fmt in ("%d/%m/%Y", "%d-%m-%Y", "%Y-%m-%d", "%d/%m/%y"):
+            try:
+                return datetime.strptime(value.split()[0], fmt).date().isoformat()
+            except (ValueError, IndexError):
+                continue
+        return None
+    if field == 'NumeroTicket':
+        return re.sub(r'\D', '', value) or None
+    return re.sub(r'[^a-z0-9]', '', value.lower()) or None
+
+
+def field_matches(field, expected, actual):
+    expected, actual = normalize_field(field, expected), normalize_field(field, actual)
+    if expected is None or actual is None:
+        return False
+    if field == 'Magasin':
+        return expected in actual or actual in expected
+    return expected == actual
+
+
+def score_accuracy(tickets, ground_truth):
+    """Précision par champ sur les tickets annotés (premier passage uniquement)"""
+    scores = {field: {'correct': 0, 'total': 0} for field in FIELDS}
+    seen = set()
+    for ticket in tickets:
+        name = ticket['file']
+        expected = ground_truth.get(name)
+        if not expected or name in seen:
+            continue
+        seen.add(name)
+        ticket['matches'] = {}
+        for field in FIELDS:
+            if expected.get(field) in (None, ''):
+                continue
+            ok = field_matches(field, expected[field], ticket['fields'].get(field))
+            ticket['matches'][field] = ok
+            scores[field]['total'] += 1
+            scores[field]['correct'] += int(ok)
+    for score in scores.values():
+        score['accuracy'] = round(score['correct'] / score['total'], 4) if score['total'] else None
+    totals = [score for score in scores.values() if score['total']]
+    overall = sum(s['correct'] for s in totals) / sum(s['total'] for s in totals) if totals else None
+    return {'fields': scores, 'overall': round(overall, 4) if overall is not None else None, 'annotated': len(seen)}
+
+
+# Exécution
+
+def bench_engines(files, engines, rounds):
+    from ocrapp.ocr_pipeline import OCR_ENGINES, is_error_text
+    from ocrapp.preprocessing import prepare_image, preprocess_config
+
+    results = {}
+    for name in engines:
+        latencies, errors = [], 0
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for path in files:
+                source = path
+                if not path.lower().endswith('.pdf'):
+                    source = prepare_image(path, preprocess_config())
+                t0 = time.perf_counter()
+                try:
+                    text, _ = OCR_ENGINES[name](source)
+                except Exception as e:
+                    text = f"Erreur {name}: {e}"
+                latencies.append((time.perf_counter() - t0) * 1000)
+                errors += int(is_error_text(text))
+        elapsed = time.perf_counter() - start
+        results[name] = dict(
+            latency_summary(latencies),
+            errors=errors,
+            throughput_per_s=round(len(latencies) / elapsed, 3) if elapsed else None,
+            peak_rss_mb=peak_rss_mb(),
+        )
+        print(f"{name:<10} {format_summary(results[name])}  erreurs={errors}")
+    return results
+
+
+def run_ticket(task):
+    """
+    Pipeline complet d'un ticket, comme upload_ticket (sans écriture en base).
+    task : (nom, chemin de l'image) ou (nom, transcription OCR enregistrée)
+    """
+    from ocrapp import metrics
+    from ocrapp.ocr_pipeline import run_ocr_stage
+    from ocrapp.views import analyze_three_texts_with_llm
+
+    name, source = task
+    with metrics.collecting() as timings:
+        start = time.perf_counter()
+        with metrics.span('ticket'):
+            ocr_results = source if isinstance(source, dict) else run_ocr_stage(source)[0]
+            analysis = analyze_three_texts_with_llm(ocr_results)
+        latency = (time.perf_counter() - start) * 1000
+    analysis = analysis if isinstance(analysis, dict) else {'error': str(analysis)}
+    return {
+        'file': name,
+        'latency_ms': round(latency, 1),
+        'fields': {field: analysis.get(field) for field in FIELDS},
+        'commentaire': analysis.get('Commentaire'),
+        'provider': analysis.get('llm_provider'),
+        'error': analysis.get('error'),
+        'spans': timings.summary()['spans'],
+    }
+
+
+def bench_pipeline(files, transcripts, workers, rounds):
+    items = [(os.path.basename(path), path) for path in files] + list(transcripts.items())
+    tasks = [item for _ in range(rounds) for item in items]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='bench') as executor:
+        tickets = list(executor.map(run_ticket, tasks))
+    elapsed = time.perf_counter() - start
+
+    stage_latencies = {}
+    parse_outcomes = {}
+    for ticket in tickets:
+        for span in ticket.pop('spans'):
+            if span['stage'] == 'json_parse':
+                parse_outcomes[span['outcome']] = parse_outcomes.get(span['outcome'], 0) + 1
+            key = span['stage']
+            qualifier = span.get('engine') or '/'.join(filter(None, (span.get('provider'), span.get('model'))))
+            if qualifier:
+                key = f"{key}:{qualifier}"
+            stage_latencies.setdefault(key, []).append(span['ms'])
+    pipeline = dict(
+        latency_summary([ticket['latency_ms'] for ticket in tickets]),
+        throughput_per_s=round(len(tickets) / elapsed, 3) if elapsed else None,
+        errors=sum(1 for ticket in tickets if ticket['error']),
+        elapsed_s=round(elapsed, 3),
+        peak_rss_mb=peak_rss_mb(),
+    )
+    stages = {key: latency_summary(values) for key, values in sorted(stage_latencies.items())}
+    return pipeline, stages, tickets, parse_outcomes
+
+
+def extraction_summary(tickets, parse_outcomes, http):
+    """
+    Issue de l'extraction LLM : analyses JSON par issue, tickets servis par un
+    autre fournisseur que le premier du routeur ou par les regex, requêtes
+    HTTP retentées
+    """
+    from django.conf import settings
+
+    providers = getattr(settings, 'LLM_ROUTER_PROVIDERS', [])
+    first = providers[0] if providers else None
+    return {
+        'structured_output': getattr(settings, 'LLM_STRUCTURED_OUTPUT', True),
+        'json_parse': dict(sorted(parse_outcomes.items())),
+        'json_repaired': parse_outcomes.get('repaired', 0),
+        'json_invalid': parse_outcomes.get('invalid', 0),
+        'fallbacks': sum(1 for ticket in tickets if ticket['provider'] != first),
+        'regex_fallbacks': sum(1 for ticket in tickets if not ticket['provider']),
+        'http_retries': sum(endpoint['retries'] for endpoint in http['endpoints'].values()),
+    }
+
+
+def format_summary(summary):
+    if not summary.get('count'):
+        return "aucune mesure"
+    return (
+        f"n={summary['count']:>4}  p50={summary['p50_ms']:8.1f} ms  p95={summary['p95_ms']:8.1f} ms  "
+        f"p99={summary['p99_ms']:8.1f} ms"
+    )
+
+
+# Comparaison à la référence
+
+def compare_to_baseline(result, baseline, tolerance, accuracy_tolerance, min_latency_delta_ms=0):
+    """
+    Liste des écarts (métrique, référence, actuel, régression) : latences et
+    mémoire plus hautes que la tolérance, débit et précision plus bas. Une
+    latence n'est en régression que si elle augmente aussi d'au moins
+    min_latency_delta_ms (les mesures de quelques ms sont trop bruitées)
+    """
+    rows = []
+
+    def check(metric, before, after, higher_is_worse=True, absolute=None):
+        if before is None or after is None:
+            return
+        if absolute is not None:
+            regression = after < before - absolute
+        elif higher_is_worse:
+            regression = after > before * (1 + tolerance)
+            if metric.endswith('_ms'):
+                regression = regression and after - before >= min_latency_delta_ms
+        else:
+            regression = after < before * (1 - tolerance)
+        rows.append((metric, before, after, regression))
+
+    for name, summary in result.get('engines', {}).items():
+        before = baseline.get('engines', {}).get(name, {})
+        for key in ('p50_ms', 'p95_ms'):
+            check(f"engines.{name}.{key}", before.get(key), summary.get(key))
+    for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+        check(f"pipeline.{key}", baseline.get('pipeline', {}).get(key), result['pipeline'].get(key))
+    check("pipeline.throughput_per_s", baseline.get('pipeline', {}).get('throughput_per_s'),
+          result['pipeline'].get('throughput_per_s'), higher_is_worse=False)
+    check("peak_rss_mb", baseline.get('peak_rss_mb'), result.get('peak_rss_mb'))
+    check("streaming.ttft_p50_ms", baseline.get('streaming', {}).get('ttft_p50_ms'),
+          result.get('streaming', {}).get('ttft_p50_ms'))
+    # Compteurs d'extraction : toute hausse est signalée (référence à 0 comprise)
+    for key in ('json_repaired', 'json_invalid', 'fallbacks', 'regex_fallbacks', 'http_retries'):
+        before = baseline.get('extraction', {}).get(key)
+        after = result.get('extraction', {}).get(key)
+        if before is not None and after is not None:
+            rows.append((f"extraction.{key}", before, after, after > before))
+    for field, score in result['accuracy']['fields'].items():
+        before = baseline.get('accuracy', {}).get('fields', {}).get(field, {})
+        check(f"accuracy.{field}", before.get('accuracy'), score.get('accuracy'), absolute=accuracy_tolerance)
+    return rows
+
+
+def print_diff(rows):
+    print("\nComparaison à la référence :")
+    for metric, before, after, regression in rows:
+        change = f"{(after - before) / before * 100:+6.1f} %" if before else "   n/a"
+        flag = "❌ RÉGRESSION" if regression else "✅"
+        print(f"  {metric:<32} {before:>10} → {after:>10}  {change}  {flag}")
+
+
+def main():
+    args = parse_args()
+
+    # Serveur LLM factice démarré avant Django : les URL des LLM sont lues dans les settings
+    from benchmark_llm_stub import start_stub_server
+    stub = start_stub_server(latency_ms=args.stub_latency_ms, invalid_rate=args.stub_invalid_rate,
+                             token_ms=args.stub_token_ms)
+    os.environ['OLLAMA_BASE_URL'] = stub.url
+    os.environ['HF_BASE_URL'] = f"{stub.url}/v1"
+    os.environ['HF_TOKEN'] = 'benchmark'
+    os.environ['OCR_CACHE_ENABLED'] = 'True' if args.use_cache else 'False'
+    os.environ['LLM_CACHE_ENABLED'] = 'True' if args.use_cache else 'False'
+    os.environ['LLM_STRUCTURED_OUTPUT'] = 'False' if args.unstructured else 'True'
+    os.environ['LLM_STREAMING'] = 'False' if args.no_stream else 'True'
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ticketocr.settings')
+    django.setup()
+
+    from ocrapp.ocr_pipeline import OCR_ENGINES
+
+    files = load_corpus(args.dirs, args.limit)
+    transcripts = load_transcripts(args.transcripts)
+    if not files:
+        print(f"⚠️  Aucune image lisible dans {', '.join(args.dirs)} (fichiers git-lfs récupérés ?)")
+        if not transcripts:
+            return 1
+    ground_truth = {}
+    if os.path.exists(args.ground_truth):
+        with open(args.ground_truth, encoding='utf-8') as f:
+            ground_truth = {name: fields for name, fields in json.load(f).items() if not name.startswith('_')}
+    print(f"{len(files)} fichiers, {len(transcripts)} transcriptions, {len(ground_truth)} annotés, "
+          f"{args.rounds} passe(s), LLM factice sur {stub.url}\n")
+
+    result = {
+        'meta': {
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'files': len(files),
+            'transcripts': len(transcripts),
+            'rounds': args.rounds,
+            'workers': args.workers,
+            'stub_latency_ms': args.stub_latency_ms,
+            'cache': args.use_cache,
+            'structured_output': not args.unstructured,
+            'stub_invalid_rate': args.stub_invalid_rate,
+            'streaming': not args.no_stream,
+            'stub_token_ms': args.stub_token_ms,
+        },
+        'engines': {},
+    }
+    if not args.skip_engines and files:
+        print("Moteurs OCR :")
+        result['engines'] = bench_engines(files, args.engines or list(OCR_ENGINES), args.rounds)
+
+    print("\nPipeline complet (OCR + LLM) :")
+    result['pipeline'], result['stages'], tickets, parse_outcomes = bench_pipeline(files, transcripts, args.workers, args.rounds)
+    result['pipeline']['llm_requests'] = stub.requests
+    result['pipeline']['llm_constrained_requests'] = stub.constrained_requests
+    from ocrapp.http_client import http_stats
+    result['extraction'] = extraction_summary(tickets, parse_outcomes, http_stats())
+    from ocrapp.llm_stream import stream_stats
+    result['streaming'] = dict(stream_stats(), **stub.token_stats())
+    print(f"ticket     {format_summary(result['pipeline'])}  débit={result['pipeline']['throughput_per_s']} tickets/s")
+    for key, summary in result['stages'].items():
+        print(f"  {key:<40} {format_summary(summary)}")
+
+    result['accuracy'] = score_accuracy(tickets, ground_truth)
+    result['peak_rss_mb'] = peak_rss_mb()
+    result['tickets'] = tickets
+    extraction = result['extraction']
+    print(f"\nExtraction LLM : JSON {extraction['json_parse']}, replis={extraction['fallbacks']} "
+          f"(regex={extraction['regex_fallbacks']}), requêtes retentées={extraction['http_retries']}")
+    streaming = result['streaming']
+    if streaming.get('responses'):
+        print(f"Jetons LLM : {streaming['mean_sent_per_call']} envoyés / {streaming['mean_saved_per_call']} "
+              f"économisés par appel, premier jeton p50={streaming['ttft_p50_ms']} ms, "
+              f"arrêts anticipés={streaming['early_stops']}/{streaming['calls']}")
+    print(f"Pic mémoire (RSS): {result['peak_rss_mb']} Mo")
+    print(f"Précision ({result['accuracy']['annotated']} tickets annotés) : global={result['accuracy']['overall']}")
+    for field, score in result['accuracy']['fields'].items():
+        print(f"  {field:<14} {score['correct']}/{score['total']}  {score['accuracy']}")
+    stub.shutdown()
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\nRésultat écrit dans {args.output}")
+
+    if args.write_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"Référence enregistrée dans {args.baseline}")
+        return 0
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            rows = compare_to_baseline(result, json.load(f), args.tolerance, args.accuracy_tolerance,
+                                       args.min_latency_delta_ms)
+        print_diff(rows)
+        if any(regression for *_, regression in rows):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
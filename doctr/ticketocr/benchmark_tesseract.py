@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""
+Benchmark Tesseract : chemin pytesseract historique (vérification de version
++ sous-processus par image) contre le pool persistant (ocrapp/tesseract_pool.py)
+sur les images du dossier tickets/.
+
+Usage: python benchmark_tesseract.py [--dir tickets] [--rounds 3]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import django
+
+# Setup Django
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ticketocr.settings')
+django.setup()
+
+from PIL import Image
+
+from ocrapp.tesseract_pool import pool as tesseract_pool, tesseract_status, TESSERACT_LANG
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def legacy_image_to_string(image_path):
+    """Ancien chemin de extract_text_tesseract : deux sous-processus par image"""
+    import pytesseract
+    pytesseract.get_tesseract_version()
+    return pytesseract.image_to_string(Image.open(image_path), lang=TESSERACT_LANG)
+
+
+def pool_image_to_string(image_path):
+    return tesseract_pool.image_to_string(Image.open(image_path))
+
+
+def load_images(directory):
+    images = []
+    for name in sorted(os.listdir(directory)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            with Image.open(path) as img:
+                img.verify()
+            images.append(path)
+        except Exception as e:
+            print(f"⚠️  Image ignorée {name}: {e}")
+    return images
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run(label, function, images, rounds):
+    latencies = []
+    characters = 0
+    for _ in range(rounds):
+        for path in images:
+            start = time.perf_counter()
+            text = function(path)
+            latencies.append((time.perf_counter() - start) * 1000)
+            characters += len(text)
+    print(
+        f"{label:<12} images={len(latencies):>4}  moyenne={statistics.mean(latencies):8.1f} ms  "
+        f"médiane={statistics.median(latencies):8.1f} ms  p95={percentile(latencies, 95):8.1f} ms  "
+        f"caractères={characters // rounds}"
+    )
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--dir', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tickets'))
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    status = tesseract_status()
+    if not status['available']:
+        print(f"❌ Tesseract non disponible: {status['error']}")
+        return 1
+    print(f"Tesseract {status['version']} - backend du pool: {status['backend']}")
+
+    images = load_images(args.dir)
+    if not images:
+        print(f"❌ Aucune image lisible dans {args.dir}")
+        return 1
+    print(f"{len(images)} images, {args.rounds} passes\n")
+
+    start = time.perf_counter()
+    tesseract_pool.warm_up()
+    print(f"Préchauffage du pool: {(time.perf_counter() - start) * 1000:.1f} ms (hors mesures)")
+
+    legacy = run('pytesseract', legacy_image_to_string, images, args.rounds)
+    pooled = run('pool', pool_image_to_string, images, args.rounds)
+    print(f"\nGain médian: x{statistics.median(legacy) / statistics.median(pooled):.2f}")
+    print(f"Pool: {tesseract_pool.stats()}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
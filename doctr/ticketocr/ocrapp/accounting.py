@@ -0,0 +1,585 @@
+"""
+Écritures comptables des tickets analysés : historique (TicketHistory),
+entrées comptables (AccountingEntry) et exports PDF / Excel.
+
+reportlab et openpyxl ne sont importés que par les fonctions d'export.
+"""
+from datetime import datetime, date
+from decimal import Decimal, InvalidOperation
+from io import BytesIO
+
+from . import metrics
+from .models import TicketHistory, AccountingEntry
+
+
+DATE_FORMATS = ("%d/%m/%Y", "%d-%m-%Y", "%Y-%m-%d")
+
+
+def parse_ticket_date(date_str):
+    """Date d'un ticket ('JJ/MM/AAAA HH:MM', 'AAAA-MM-JJ'...), ou None"""
+    if not date_str or not isinstance(date_str, str) or not date_str.split():
+        return None
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(date_str.split()[0], fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def parse_ticket_total(total_str):
+    """Montant d'un ticket ('12.345 DT', '12,345'), ou None"""
+    if total_str is None:
+        return None
+    try:
+        return Decimal(str(total_str).replace("DT", "").replace(",", ".").strip())
+    except InvalidOperation:
+        return None
+
+
+def is_accountable(analysis):
+    """
+    Analyse comptabilisable sans validation humaine : les mêmes exigences que
+    save_ticket_analysis (magasin, date et total), avec une date lisible et un
+    total non nul. Les réponses LLM dégradées (texte fusionné, repli regex)
+    n'ont ni date ni total et ne doivent pas produire d'écriture à 0.000 datée du jour
+    """
+    if not isinstance(analysis, dict) or not analysis or analysis.get('error'):
+        return False
+    if not str(analysis.get("Magasin") or "").strip():
+        return False
+    total = parse_ticket_total(analysis.get("Total"))
+    if total is None or not total.is_finite() or total == 0:
+        return False
+    return parse_ticket_date(analysis.get("Date")) is not None
+
+
+def save_ticket_to_history(llm_analysis):
+    """
+    Sauvegarde un ticket analysÃ© dans l'historique
+    """
+    if not llm_analysis or not isinstance(llm_analysis, dict):
+        return None
+    
+    try:
+        # Extraire les donnÃ©es du ticket
+        date_str = llm_analysis.get("Date", "")
+        magasin = llm_analysis.get("Magasin", "Magasin inconnu")
+        total_str = llm_analysis.get("Total", "0.000 DT")
+        numero_ticket = llm_analysis.get("NumeroTicket", "")
+        articles = llm_analysis.get("Articles", [])
+        
+        # Nettoyer le total
+        try:
+            total_clean = total_str.replace(" DT", "").replace(",", ".")
+            total_decimal = Decimal(total_clean)
+        except:
+            total_decimal = Decimal('0.000')
+        
+        # Parser la date
+        try:
+            if date_str:
+                # Essayer diffÃ©rents formats de date
+                date_formats = ["%d/%m/%Y", "%d-%m-%Y", "%Y-%m-%d"]
+                ticket_date = None
+                for fmt in date_formats:
+                    try:
+                        ticket_date = datetime.strptime(date_str.split()[0], fmt).date()
+                        break
+                    except:
+                        continue
+                if not ticket_date:
+                    ticket_date = date.today()
+            else:
+                ticket_date = date.today()
+        except:
+            ticket_date = date.today()
+        
+        # CrÃ©er l'entrÃ©e dans l'historique
+        with metrics.span('db_write', model='TicketHistory'):
+            ticket_history = TicketHistory.objects.create(
+                date_ticket=ticket_date,
+                magasin=magasin,
+                total=total_decimal,
+                numero_ticket=numero_ticket,
+                articles_data=articles,
+                llm_analysis=llm_analysis
+            )
+        
+        print(f"Ticket sauvegardÃ©: {ticket_history}")
+        return ticket_history
+        
+    except Exception as e:
+        print(f"Erreur lors de la sauvegarde du ticket: {e}")
+        return None
+
+def generate_accounting_report(llm_analysis, compte="606100", description="Achat divers", save_to_db=True):
+    """
+    GÃ©nÃ¨re un rapport comptable Ã  partir des donnÃ©es LLM
+    """
+    if not llm_analysis or not isinstance(llm_analysis, dict):
+        return None
+    
+    # Extraire les donnÃ©es du ticket
+    date_ticket = llm_analysis.get("Date", "")
+    magasin = llm_analysis.get("Magasin", "Magasin inconnu")
+    total = llm_analysis.get("Total", "0.000 DT")
+    
+    # Nettoyer le total (enlever "DT" et convertir en float)
+    try:
+        total_clean = total.replace(" DT", "").replace(",", ".")
+        total_float = float(total_clean)
+    except:
+        total_float = 0.0
+    
+    # CrÃ©er le libellÃ© d'Ã©criture
+    libelle_ecriture = f"Achat-{magasin}"
+    
+    # CrÃ©er le rapport comptable
+    report_data = {
+        "date_ticket": date_ticket,
+        "compte": compte,
+        "description": description,
+        "libelle_ecriture": libelle_ecriture,
+        "debit": f"{total_float:.3f}",
+        "credit": "",
+        "magasin": magasin,
+        "total_original": total
+    }
+    
+    # Sauvegarder dans la base de donnÃ©es si demandÃ©
+    if save_to_db:
+        try:
+            # Sauvegarder le ticket dans l'historique
+            ticket_history = save_ticket_to_history(llm_analysis)
+            
+            if ticket_history:
+                # CrÃ©er l'entrÃ©e comptable
+                try:
+                    # Parser la date pour l'Ã©criture comptable
+                    date_ecriture = date.today()
+                    if date_ticket:
+                        date_formats = ["%d/%m/%Y", "%d-%m-%Y", "%Y-%m-%d"]
+                        for fmt in date_formats:
+                            try:
+                                date_ecriture = datetime.strptime(date_ticket.split()[0], fmt).date()
+                                break
+                            except:
+                                continue
+                    
+                    with metrics.span('db_write', model='AccountingEntry'):
+                        accounting_entry = AccountingEntry.objects.create(
+                            ticket=ticket_history,
+                            date_ecriture=date_ecriture,
+                            compte=compte,
+                            description=description,
+                            libelle_ecriture=libelle_ecriture,
+                            debit=Decimal(f"{total_float:.3f}"),
+                            credit=None
+                        )
+                    print(f"EntrÃ©e comptable crÃ©Ã©e: {accounting_entry}")
+                except Exception as e:
+                    print(f"Erreur lors de la crÃ©ation de l'entrÃ©e comptable: {e}")
+        except Exception as e:
+            print(f"Erreur lors de la sauvegarde: {e}")
+    
+    return report_data
+
+def generate_accounting_pdf(report_data):
+    """
+    GÃ©nÃ¨re un PDF du bilan comptable
+    """
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import inch
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    elements = []
+    
+    # Styles
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=16,
+        spaceAfter=30,
+        alignment=1  # Center
+    )
+    
+    # Titre
+    title = Paragraph("Bilan Comptable - Ticket de Caisse", title_style)
+    elements.append(title)
+    elements.append(Spacer(1, 20))
+    
+    # Informations du ticket
+    ticket_info = [
+        ["Date du ticket:", report_data["date_ticket"]],
+        ["Magasin:", report_data["magasin"]],
+        ["Total:", report_data["total_original"]],
+    ]
+    
+    ticket_table = Table(ticket_info, colWidths=[2*inch, 4*inch])
+    ticket_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (0, -1), colors.grey),
+        ('TEXTCOLOR', (0, 0), (0, -1), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+        ('BACKGROUND', (1, 0), (1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+    elements.append(ticket_table)
+    elements.append(Spacer(1, 20))
+    
+    # Tableau comptable
+    accounting_data = [
+        ["Date", "Compte", "Description", "LibellÃ© Ã‰criture", "DÃ©bit", "CrÃ©dit"],
+        [
+            report_data["date_ticket"],
+            report_data["compte"],
+            report_data["description"],
+            report_data["libelle_ecriture"],
+            f"{report_data['debit']} DT",
+            report_data["credit"]
+        ]
+    ]
+    
+    accounting_table = Table(accounting_data, colWidths=[1*inch, 1*inch, 1.5*inch, 2*inch, 1*inch, 1*inch])
+    accounting_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 9),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+        ('BACKGROUND', (0, 1), (-1, 1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+    elements.append(accounting_table)
+    
+    # Construire le PDF
+    doc.build(elements)
+    buffer.seek(0)
+    return buffer
+
+def generate_accounting_excel(report_data):
+    """
+    GÃ©nÃ¨re un fichier Excel du bilan comptable
+    """
+    from openpyxl import Workbook
+    from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+    from openpyxl.utils import get_column_letter
+
+    # CrÃ©er un nouveau classeur Excel
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Bilan Comptable"
+    
+    # Styles
+    header_font = Font(bold=True, color="FFFFFF")
+    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+    border = Border(
+        left=Side(style='thin'),
+        right=Side(style='thin'),
+        top=Side(style='thin'),
+        bottom=Side(style='thin')
+    )
+    center_alignment = Alignment(horizontal="center", vertical="center")
+    
+    # Titre principal
+    ws.merge_cells('A1:F1')
+    ws['A1'] = "Bilan Comptable - Ticket de Caisse"
+    ws['A1'].font = Font(bold=True, size=16)
+    ws['A1'].alignment = center_alignment
+    
+    # Informations du ticket (ligne 3-5)
+    ws['A3'] = "Date du ticket:"
+    ws['B3'] = report_data["date_ticket"]
+    ws['A4'] = "Magasin:"
+    ws['B4'] = report_data["magasin"]
+    ws['A5'] = "Total:"
+    ws['B5'] = report_data["total_original"]
+    
+    # Style pour les labels
+    for row in range(3, 6):
+        ws[f'A{row}'].font = Font(bold=True)
+        ws[f'A{row}'].fill = PatternFill(start_color="E6E6E6", end_color="E6E6E6", fill_type="solid")
+    
+    # En-tÃªtes du tableau comptable (ligne 7)
+    headers = ["Date", "Compte", "Description", "LibellÃ© Ã‰criture", "DÃ©bit", "CrÃ©dit"]
+    for col, header in enumerate(headers, 1):
+        cell = ws.cell(row=7, column=col, value=header)
+        cell.font = header_font
+        cell.fill = header_fill
+        cell.alignment = center_alignment
+        cell.border = border
+    
+    # DonnÃ©es comptables (ligne 8)
+    data_row = [
+        report_data["date_ticket"],
+        report_data["compte"],
+        report_data["description"],
+        report_data["libelle_ecriture"],
+        f"{report_data['debit']} DT",
+        report_data["credit"]
+    ]
+    
+    for col, value in enumerate(data_row, 1):
+        cell = ws.cell(row=8, column=col, value=value)
+        cell.border = border
+        cell.alignment = center_alignment
+    
+    # Ajuster la largeur des colonnes
+    column_widths = [15, 12, 20, 25, 12, 12]
+    for col, width in enumerate(column_widths, 1):
+        ws.column_dimensions[get_column_letter(col)].width = width
+    
+    # Sauvegarder dans un buffer
+    buffer = BytesIO()
+    wb.save(buffer)
+    buffer.seek(0)
+    return buffer
+
+def generate_cumulative_accounting_pdf(start_date=None, end_date=None):
+    """
+    GÃ©nÃ¨re un PDF cumulatif de toutes les entrÃ©es comptables
+    """
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import inch
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+
+    # RÃ©cupÃ©rer toutes les entrÃ©es comptables
+    entries = AccountingEntry.objects.all()
+    
+    if start_date:
+        entries = entries.filter(date_ecriture__gte=start_date)
+    if end_date:
+        entries = entries.filter(date_ecriture__lte=end_date)
+    
+    entries = entries.order_by('date_ecriture')
+
+    # Exclure deux lignes spÃ©cifiques demandÃ©es par l'utilisateur
+    try:
+        from datetime import date as _date
+        entries = entries.exclude(
+            compte='531200',
+            description='Paiement ticket de caisse',
+            libelle_ecriture='Paiement ticket - AZIZA - 80102080 - 4.090 DT',
+            date_ecriture__in=[_date(2025, 2, 1), _date(2025, 8, 8)]
+        )
+    except Exception:
+        pass  # Ne jamais bloquer la gÃ©nÃ©ration si exclusion Ã©choue
+    
+    if not entries.exists():
+        return None
+    
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    elements = []
+    
+    # Styles
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=16,
+        spaceAfter=30,
+        alignment=1  # Center
+    )
+    
+    # Titre
+    title = Paragraph("Bilan Comptable Cumulatif", title_style)
+    elements.append(title)
+    elements.append(Spacer(1, 20))
+    
+    # Informations gÃ©nÃ©rales
+    total_debit = sum(entry.debit for entry in entries)
+    nb_entries = entries.count()
+    
+    fin = end_date or "Aujourd'hui"
+    summary_info = [
+        ["PÃ©riode:", f"{start_date or 'DÃ©but'} Ã  {fin}"],
+        ["Nombre d'Ã©critures:", str(nb_entries)],
+        ["Total dÃ©bit:", f"{total_debit:.3f} DT"],
+    ]
+    
+    summary_table = Table(summary_info, colWidths=[2*inch, 4*inch])
+    summary_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (0, -1), colors.grey),
+        ('TEXTCOLOR', (0, 0), (0, -1), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+        ('BACKGROUND', (1, 0), (1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+    elements.append(summary_table)
+    elements.append(Spacer(1, 20))
+    
+    # Tableau des Ã©critures comptables
+    accounting_data = [
+        ["Date", "Compte", "Description", "LibellÃ© Ã‰criture", "DÃ©bit", "CrÃ©dit"]
+    ]
+    
+    for entry in entries:
+        accounting_data.append([
+            entry.date_ecriture.strftime("%d/%m/%Y"),
+            entry.compte,
+            entry.description,
+            entry.libelle_ecriture,
+            f"{entry.debit:.3f} DT",
+            f"{entry.credit:.3f} DT" if entry.credit else ""
+        ])
+    
+    # Ajouter une ligne de total
+    accounting_data.append([
+        "", "", "", "TOTAL", f"{total_debit:.3f} DT", ""
+    ])
+    
+    accounting_table = Table(accounting_data, colWidths=[1*inch, 1*inch, 1.5*inch, 2*inch, 1*inch, 1*inch])
+    accounting_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 9),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+        ('BACKGROUND', (0, 1), (-1, -2), colors.beige),
+        ('BACKGROUND', (0, -1), (-1, -1), colors.lightblue),
+        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+    elements.append(accounting_table)
+    
+    # Construire le PDF
+    doc.build(elements)
+    buffer.seek(0)
+    return buffer
+
+def generate_cumulative_accounting_excel(start_date=None, end_date=None):
+    """
+    GÃ©nÃ¨re un fichier Excel cumulatif de toutes les entrÃ©es comptables
+    """
+    from openpyxl import Workbook
+    from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+    from openpyxl.utils import get_column_letter
+
+    # RÃ©cupÃ©rer toutes les entrÃ©es comptables
+    entries = AccountingEntry.objects.all()
+    
+    if start_date:
+        entries = entries.filter(date_ecriture__gte=start_date)
+    if end_date:
+        entries = entries.filter(date_ecriture__lte=end_date)
+    
+    entries = entries.order_by('date_ecriture')
+
+    # Exclure deux lignes spÃ©cifiques demandÃ©es par l'utilisateur
+    try:
+        from datetime import date as _date
+        entries = entries.exclude(
+            compte='531200',
+            description='Paiement ticket de caisse',
+            libelle_ecriture='Paiement ticket - AZIZA - 80102080 - 4.090 DT',
+            date_ecriture__in=[_date(2025, 2, 1), _date(2025, 8, 8)]
+        )
+    except Exception:
+        pass
+    
+    if not entries.exists():
+        return None
+    
+    # CrÃ©er un nouveau classeur Excel
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Bilan Comptable Cumulatif"
+    
+    # Styles
+    header_font = Font(bold=True, color="FFFFFF")
+    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+    total_fill = PatternFill(start_color="ADD8E6", end_color="ADD8E6", fill_type="solid")
+    border = Border(
+        left=Side(style='thin'),
+        right=Side(style='thin'),
+        top=Side(style='thin'),
+        bottom=Side(style='thin')
+    )
+    center_alignment = Alignment(horizontal="center", vertical="center")
+    
+    # Titre principal
+    ws.merge_cells('A1:F1')
+    ws['A1'] = "Bilan Comptable Cumulatif"
+    ws['A1'].font = Font(bold=True, size=16)
+    ws['A1'].alignment = center_alignment
+    
+    # Informations gÃ©nÃ©rales
+    total_debit = sum(entry.debit for entry in entries)
+    nb_entries = entries.count()
+    
+    ws['A3'] = "PÃ©riode:"
+    fin = end_date or "Aujourd'hui"
+    ws['B3'] = f"{start_date or 'DÃ©but'} Ã  {fin}"
+    ws['A4'] = "Nombre d'Ã©critures:"
+    ws['B4'] = str(nb_entries)
+    ws['A5'] = "Total dÃ©bit:"
+    ws['B5'] = f"{total_debit:.3f} DT"
+    
+    # Style pour les labels
+    for row in range(3, 6):
+        ws[f'A{row}'].font = Font(bold=True)
+        ws[f'A{row}'].fill = PatternFill(start_color="E6E6E6", end_color="E6E6E6", fill_type="solid")
+    
+    # En-tÃªtes du tableau comptable (ligne 7)
+    headers = ["Date", "Compte", "Description", "LibellÃ© Ã‰criture", "DÃ©bit", "CrÃ©dit"]
+    for col, header in enumerate(headers, 1):
+        cell = ws.cell(row=7, column=col, value=header)
+        cell.font = header_font
+        cell.fill = header_fill
+        cell.alignment = center_alignment
+        cell.border = border
+    
+    # DonnÃ©es comptables
+    current_row = 8
+    for entry in entries:
+        data_row = [
+            entry.date_ecriture.strftime("%d/%m/%Y"),
+            entry.compte,
+            entry.description,
+            entry.libelle_ecriture,
+            f"{entry.debit:.3f} DT",
+            f"{entry.credit:.3f} DT" if entry.credit else ""
+        ]
+        
+        for col, value in enumerate(data_row, 1):
+            cell = ws.cell(row=current_row, column=col, value=value)
+            cell.border = border
+            cell.alignment = center_alignment
+        
+        current_row += 1
+    
+    # Ligne de total
+    total_row = ["", "", "", "TOTAL", f"{total_debit:.3f} DT", ""]
+    for col, value in enumerate(total_row, 1):
+        cell = ws.cell(row=current_row, column=col, value=value)
+        cell.border = border
+        cell.alignment = center_alignment
+        cell.fill = total_fill
+        cell.font = Font(bold=True)
+    
+    # Ajuster la largeur des colonnes
+    column_widths = [15, 12, 20, 25, 12, 12]
+    for col, width in enumerate(column_widths, 1):
+        ws.column_dimensions[get_column_letter(col)].width = width
+    
+    # Sauvegarder dans un buffer
+    buffer = BytesIO()
+    wb.save(buffer)
+    buffer.seek(0)
+    return buffer
@@ -4,3 +4,26 @@ from django.apps import AppConfig
 class OcrappConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "ocrapp"
+
+    def ready(self):
+        # Préchargement des modèles OCR en arrière-plan pour que la première
+        # requête ne paie pas le chargement de doctr/docling ni des données
+        # de langue Tesseract
+        import threading
+
+        from .ocr_registry import is_server_process, registry, should_preload
+        from .tesseract_pool import pool as tesseract_pool
+        if should_preload():
+            registry.preload_async()
+            threading.Thread(target=tesseract_pool.warm_up, name="tesseract-warmup", daemon=True).start()
+
+        # Contrôles de santé périodiques (Ollama, fournisseurs LLM, paquets OCR)
+        if is_server_process():
+            from .health import monitor as health_monitor
+            health_monitor.start()
+
+        # Workers de la file des jobs : reprennent aussi les jobs laissés en attente
+        from django.conf import settings
+        if is_server_process() and getattr(settings, 'OCR_ASYNC_JOBS', False):
+            from .jobs import worker_pool
+            worker_pool.start()
@@ -0,0 +1,192 @@
+"""
+Disjoncteurs par fournisseur LLM (HuggingFace, Ollama, Gemini).
+
+Chaque appel réseau à un fournisseur passe par breakers[nom].guard() : les
+succès, échecs et latences sont gardés sur une fenêtre glissante
+(LLM_BREAKER_WINDOW secondes). Au-delà de LLM_BREAKER_ERROR_RATE d'échecs
+(sur au moins LLM_BREAKER_MIN_CALLS appels), le disjoncteur s'ouvre : les
+appels suivants échouent aussitôt (CircuitOpenError) au lieu d'attendre le
+délai d'expiration, et le routeur passe au fournisseur suivant. Après
+LLM_BREAKER_OPEN_SECONDS, il passe en semi-ouvert et laisse passer une
+requête de sonde : un succès le referme, un échec le rouvre. L'état est
+exposé sur /health.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Appel refusé : le fournisseur est considéré comme indisponible"""
+
+    def __init__(self, name, retry_in):
+        super().__init__(f"Circuit ouvert pour {name} (nouvel essai dans {retry_in:.0f} s)")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CallAbandoned(Exception):
+    """Appel interrompu par l'appelant : ni succès ni échec du fournisseur"""
+
+
+class CircuitBreaker:
+    def __init__(self, name):
+        self.name = name
+        self.state = CLOSED
+        self._calls = deque()  # (instant, succès, latence)
+        self._opened_at = None
+        self._probes = 0
+        self._last_error = None
+        self._lock = threading.Lock()
+
+    @property
+    def window(self):
+        return getattr(settings, 'LLM_BREAKER_WINDOW', 60)
+
+    @property
+    def min_calls(self):
+        return getattr(settings, 'LLM_BREAKER_MIN_CALLS', 3)
+
+    @property
+    def error_rate_threshold(self):
+        return getattr(settings, 'LLM_BREAKER_ERROR_RATE', 0.5)
+
+    @property
+    def open_seconds(self):
+        return getattr(settings, 'LLM_BREAKER_OPEN_SECONDS', 30)
+
+    @property
+    def max_probes(self):
+        return getattr(settings, 'LLM_BREAKER_HALF_OPEN_PROBES', 1)
+
+    def _trim(self, now):
+        while self._calls and now - self._calls[0][0] > self.window:
+            self._calls.popleft()
+
+    def _error_rate(self):
+        if not self._calls:
+            return 0.0
+        return sum(1 for _, ok, _ in self._calls if not ok) / len(self._calls)
+
+    def allow(self):
+        """Réserve un appel ; lève CircuitOpenError si le fournisseur est écarté"""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == OPEN:
+                elapsed = now - self._opened_at
+                if elapsed < self.open_seconds:
+                    raise CircuitOpenError(self.name, self.open_seconds - elapsed)
+                self.state = HALF_OPEN
+                self._probes = 0
+                logger.info("Disjoncteur %s semi-ouvert : requête de sonde", self.name)
+            if self.state == HALF_OPEN:
+                if self._probes >= self.max_probes:
+                    raise CircuitOpenError(self.name, 0)
+                self._probes += 1
+
+    def record(self, ok, latency, error=None):
+        with self._lock:
+            now = time.monotonic()
+            self._trim(now)
+            self._calls.append((now, ok, latency))
+            if not ok:
+                self._last_error = error
+            if self.state == HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+                if ok:
+                    self.state = CLOSED
+                    self._calls.clear()
+                    logger.info("Disjoncteur %s refermé", self.name)
+                else:
+                    self._open(now)
+            elif (self.state == CLOSED and len(self._calls) >= self.min_calls
+                  and self._error_rate() >= self.error_rate_threshold):
+                self._open(now)
+
+    def release(self):
+        """Libère la réservation d'un appel abandonné, sans rien enregistrer"""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+
+    def _open(self, now):
+        self.state = OPEN
+        self._opened_at = now
+        logger.warning("Disjoncteur %s ouvert pour %ss (taux d'échec %.0f %%): %s",
+                       self.name, self.open_seconds, self._error_rate() * 100, self._last_error)
+
+    @contextmanager
+    def guard(self):
+        """
+        Appel protégé : refusé si ouvert, issue et latence enregistrées sinon.
+        Toute sortie libère la réservation (sonde du mode semi-ouvert comprise) :
+        KeyboardInterrupt, SystemExit, etc. comptent comme des échecs
+        """
+        self.allow()
+        start = time.perf_counter()
+        try:
+            yield self
+        except CallAbandoned:
+            self.release()
+            raise
+        except BaseException as e:
+            self.record(False, time.perf_counter() - start, f"{type(e).__name__}: {e}")
+            raise
+        else:
+            self.record(True, time.perf_counter() - start)
+
+    def reset(self):
+        with self._lock:
+            self.state = CLOSED
+            self._calls.clear()
+            self._opened_at = None
+            self._probes = 0
+            self._last_error = None
+
+    def snapshot(self):
+        with self._lock:
+            now = time.monotonic()
+            self._trim(now)
+            latencies = sorted(latency for _, ok, latency in self._calls if ok)
+            state = {
+                'state': self.state,
+                'calls': len(self._calls),
+                'error_rate': round(self._error_rate(), 3),
+                'p50_ms': round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None,
+                'p95_ms': round(latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))] * 1000, 1) if latencies else None,
+                'last_error': self._last_error,
+            }
+            if self.state == OPEN:
+                state['retry_in_s'] = round(max(0.0, self.open_seconds - (now - self._opened_at)), 1)
+            return state
+
+
+class BreakerRegistry:
+    def __init__(self):
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name):
+        with self._lock:
+            breaker = self._breakers.get(name)
+            if breaker is None:
+                breaker = self._breakers[name] = CircuitBreaker(name)
+            return breaker
+
+    def snapshot(self):
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {name: breaker.snapshot() for name, breaker in sorted(breakers.items())}
+
+
+breakers = BreakerRegistry()
@@ -0,0 +1,200 @@
+"""
+Micro-batching des inférences doctr entre requêtes concurrentes.
+
+Chaque appel à submit() dépose une image dans une file commune ; un thread
+unique vide la file en un seul lot dès que OCR_DOCTR_MICROBATCH_MAX images
+attendent ou que la fenêtre OCR_DOCTR_MICROBATCH_WINDOW_MS est écoulée depuis
+la première image en attente. Chaque requête récupère son propre résultat.
+Une requête qui abandonne (délai du moteur dépassé) annule son Future : elle
+est retirée de la file et ne prend pas de place dans les lots suivants.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from django.conf import settings
+
+from .ocr_engines import ocr_doctr_batch
+
+logger = logging.getLogger(__name__)
+
+# Bornes supérieures des histogrammes (format Prometheus, dernière borne = +Inf)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32)
+QUEUE_DEPTH_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+WAIT_MS_BUCKETS = (5, 10, 20, 30, 50, 100, 250, 1000)
+
+
+def _observe(histogram, buckets, value):
+    for bound in buckets:
+        if value <= bound:
+            histogram[bound] += 1
+            return
+    histogram['+Inf'] += 1
+
+
+def _empty_histogram(buckets):
+    return dict.fromkeys(list(buckets) + ['+Inf'], 0)
+
+
+class DoctrBatcher:
+    """
+    Planificateur d'inférence doctr partagé par le worker
+    """
+
+    def __init__(self, max_batch=None, window_ms=None, run_batch=None):
+        self._max_batch = max_batch
+        self._window_ms = window_ms
+        self._run_batch = run_batch or ocr_doctr_batch
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self.reset_stats()
+
+    @property
+    def max_batch(self):
+        return self._max_batch or getattr(
+            settings, 'OCR_DOCTR_MICROBATCH_MAX', getattr(settings, 'OCR_DOCTR_BATCH_SIZE', 8)
+        )
+
+    @property
+    def window(self):
+        window_ms = self._window_ms if self._window_ms is not None else getattr(
+            settings, 'OCR_DOCTR_MICROBATCH_WINDOW_MS', 30
+        )
+        return window_ms / 1000
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._stats = {
+                'submitted': 0,
+                'batches': 0,
+                'max_queue_depth': 0,
+                'batch_sizes': {},
+                'queue_depth': _empty_histogram(QUEUE_DEPTH_BUCKETS),
+                'queue_depth_sum': 0,
+                'wait_ms': _empty_histogram(WAIT_MS_BUCKETS),
+                'wait_ms_sum': 0.0,
+            }
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, name="doctr-batcher", daemon=True)
+            self._thread.start()
+
+    def submit(self, source, deadline=None):
+        """
+        Met l'image en file ; retourne un Future de (texte, détails). Passé
+        `deadline` (time.monotonic()), l'image n'entre plus dans un lot
+        """
+        future = Future()
+        with self._condition:
+            self._ensure_thread()
+            self._queue.append((source, future, time.monotonic(), deadline))
+            depth = len(self._queue)
+            self._condition.notify()
+        with self._stats_lock:
+            self._stats['submitted'] += 1
+            self._stats['max_queue_depth'] = max(self._stats['max_queue_depth'], depth)
+            _observe(self._stats['queue_depth'], QUEUE_DEPTH_BUCKETS, depth)
+            self._stats['queue_depth_sum'] += depth
+        return future
+
+    def ocr(self, source, timeout=None):
+        """
+        Équivalent bloquant de ocr_doctr(), servi par le prochain lot. Au-delà
+        de `timeout` secondes, la requête est annulée (si son lot n'a pas
+        démarré) et TimeoutError est levée
+        """
+        deadline = time.monotonic() + timeout if timeout else None
+        future = self.submit(source, deadline)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            future.cancel()
+            with self._condition:
+                self._condition.notify()
+            raise
+
+    def _drop_abandoned(self):
+        """Retire de la file les requêtes annulées ou dont le délai est passé (verrou tenu)"""
+        now = time.monotonic()
+        kept = deque(
+            item for item in self._queue
+            if not item[1].cancelled() and not (item[3] is not None and now >= item[3] and item[1].cancel())
+        )
+        if len(kept) != len(self._queue):
+            self._queue = kept
+
+    def _next_batch(self):
+        with self._condition:
+            self._drop_abandoned()
+            while not self._queue:
+                self._condition.wait()
+                self._drop_abandoned()
+            # Fenêtre ouverte par la plus ancienne image en attente
+            deadline = self._queue[0][2] + self.window
+            while len(self._queue) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+                self._drop_abandoned()
+            return [self._queue.popleft() for _ in range(min(self.max_batch, len(self._queue)))]
+
+    def _loop(self):
+        while True:
+            batch = self._next_batch()
+            # Dernière vérification : une requête annulée entre-temps ne part pas dans le lot
+            batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            now = time.monotonic()
+            with self._stats_lock:
+                self._stats['batches'] += 1
+                sizes = self._stats['batch_sizes']
+                sizes[len(batch)] = sizes.get(len(batch), 0) + 1
+                for _, _, queued_at, _ in batch:
+                    wait_ms = (now - queued_at) * 1000
+                    _observe(self._stats['wait_ms'], WAIT_MS_BUCKETS, wait_ms)
+                    self._stats['wait_ms_sum'] += wait_ms
+
+            try:
+                outputs = self._run_batch([source for source, _, _, _ in batch], batch_size=len(batch))
+            except Exception as e:
+                logger.error("Lot doctr en échec (%d images): %s", len(batch), e)
+                for _, future, _, _ in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future, _, _), output in zip(batch, outputs):
+                future.set_result(output)
+
+    def stats(self):
+        with self._condition:
+            depth = len(self._queue)
+        with self._stats_lock:
+            stats = {
+                key: dict(value) if isinstance(value, dict) else value
+                for key, value in self._stats.items()
+            }
+        stats['current_queue_depth'] = depth
+        processed = sum(size * count for size, count in stats['batch_sizes'].items())
+        stats['mean_batch_size'] = round(processed / stats['batches'], 2) if stats['batches'] else None
+        stats['max_batch'] = self.max_batch
+        stats['window_ms'] = round(self.window * 1000, 1)
+        return stats
+
+
+batcher = DoctrBatcher()
+
+
+def microbatch_enabled():
+    return getattr(settings, 'OCR_DOCTR_MICROBATCH', False)
+
+
+def ocr_doctr_microbatched(source, timeout=None):
+    """Moteur doctr du pipeline : passe par le planificateur partagé"""
+    return batcher.ocr(source, timeout)
@@ -0,0 +1,209 @@
+"""
+Contrôles de santé en arrière-plan.
+
+Les vérifications (serveur Ollama, clés des fournisseurs LLM, dossier media,
+paquets OCR, moteurs bloqués) tournent dans un thread toutes les OCR_HEALTH_INTERVAL secondes
+et le dernier état est gardé en mémoire : upload_ticket et /health le lisent
+sans attendre, et le routage LLM saute un fournisseur connu comme indisponible
+au lieu d'attendre son délai d'expiration à chaque requête.
+"""
+import importlib.util
+import logging
+import os
+import sys
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.utils import timezone
+
+from .http_client import client as http_client
+
+logger = logging.getLogger(__name__)
+
+OCR_PACKAGES = ['doctr', 'pytesseract', 'docling', 'PIL', 'pdf2image']
+
+
+def check_ollama():
+    base_url = getattr(settings, 'OLLAMA_BASE_URL', "http://localhost:11434").rstrip('/')
+    timeout = getattr(settings, 'OCR_HEALTH_TIMEOUT', 2)
+    start = time.monotonic()
+    try:
+        # Sans nouvel essai : le contrôle suivant tranchera
+        response = http_client.get(f"{base_url}/api/tags", timeout=timeout, connect_timeout=timeout, retries=0)
+        latency = round((time.monotonic() - start) * 1000, 1)
+        if response.status_code != 200:
+            return {'available': False, 'latency_ms': latency, 'error': "Ollama server not responding properly"}
+        models = [model.get('name') for model in response.json().get('models', [])]
+        return {'available': True, 'latency_ms': latency, 'models': models}
+    except requests.exceptions.ConnectionError:
+        return {'available': False, 'error': "Cannot connect to Ollama server - is it running?"}
+    except requests.exceptions.Timeout:
+        return {'available': False, 'error': "Ollama server timeout - server may be overloaded"}
+    except Exception as e:
+        return {'available': False, 'error': f"Ollama connection error: {str(e)}"}
+
+
+def check_huggingface():
+    if not os.environ.get("HF_TOKEN"):
+        return {'available': False, 'error': "Token HuggingFace manquant (HF_TOKEN)"}
+    return {'available': True}
+
+
+def check_gemini():
+    api_key = os.environ.get('GOOGLE_API_KEY')
+    if not api_key or api_key == 'your_google_api_key_here':
+        return {'available': False, 'error': "Clé API Google Generative AI manquante (mode démo)"}
+    return {'available': True}
+
+
+def check_media():
+    media_root = getattr(settings, 'MEDIA_ROOT', None)
+    if not media_root:
+        return {'available': False, 'error': "MEDIA_ROOT not configured in settings"}
+    if not os.path.exists(media_root):
+        return {'available': False, 'error': f"Media directory doesn't exist: {media_root}"}
+    return {'available': True, 'path': str(media_root)}
+
+
+def _installed(package):
+    # find_spec ne charge pas les paquets (doctr/torch, docling) : contrôle instantané
+    if package in sys.modules:
+        return True
+    try:
+        return importlib.util.find_spec(package) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def check_packages():
+    missing = [package for package in OCR_PACKAGES if not _installed(package)]
+    result = {'available': not missing, 'missing': missing}
+    if missing:
+        result['error'] = ", ".join(f"Missing required package: {package}" for package in missing)
+    try:
+        from .tesseract_pool import tesseract_status
+        result['tesseract'] = tesseract_status()
+    except Exception as e:
+        result['tesseract'] = {'available': False, 'error': str(e)}
+    return result
+
+
+def check_engines():
+    from .ocr_registry import registry
+    stuck = registry.stuck_engines()
+    result = {'available': not stuck, 'engines': registry.stats()}
+    if stuck:
+        result['error'] = ", ".join(
+            f"Moteur OCR {name} bloqué par une inférence hors délai depuis {seconds:.0f}s"
+            for name, seconds in stuck.items()
+        )
+    return result
+
+
+CHECKS = {
+    'ollama': check_ollama,
+    'huggingface': check_huggingface,
+    'gemini': check_gemini,
+    'media': check_media,
+    'packages': check_packages,
+    'engines': check_engines,
+}
+
+# Composants dont l'absence empêche tout traitement
+CRITICAL_CHECKS = ('media', 'packages')
+
+
+def run_checks():
+    """Exécute tous les contrôles ; retourne l'état complet"""
+    checks = {}
+    for name, check in CHECKS.items():
+        try:
+            checks[name] = check()
+        except Exception as e:
+            checks[name] = {'available': False, 'error': str(e)}
+    issues = [result['error'] for result in checks.values() if not result.get('available') and result.get('error')]
+    if any(not checks[name].get('available') for name in CRITICAL_CHECKS):
+        status = 'down'
+    else:
+        status = 'degraded' if issues else 'ok'
+    return {
+        'status': status,
+        'checks': checks,
+        'issues': issues,
+        'checked_at': timezone.now().isoformat(),
+        'checked_monotonic': time.monotonic(),
+    }
+
+
+class HealthMonitor:
+    """
+    Dernier état des contrôles, rafraîchi par un thread d'arrière-plan
+    """
+
+    def __init__(self):
+        self._state = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def interval(self):
+        return getattr(settings, 'OCR_HEALTH_INTERVAL', 30)
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="health-checks", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self.refresh()
+            self._stop.wait(self.interval)
+
+    def refresh(self):
+        state = run_checks()
+        previous = self._state
+        self._state = state
+        if previous is None or previous['issues'] != state['issues']:
+            if state['issues']:
+                logger.warning("Contrôle de santé (%s): %s", state['status'], "; ".join(state['issues']))
+            else:
+                logger.info("Contrôle de santé: tous les composants sont disponibles")
+        return state
+
+    def snapshot(self):
+        """Dernier état connu, sans attente ; le premier appel lance les contrôles"""
+        state = self._state
+        if state is None:
+            self.start()
+            return {'status': 'unknown', 'checks': {}, 'issues': [], 'checked_at': None, 'age_s': None}
+        return dict(state, age_s=round(time.monotonic() - state['checked_monotonic'], 1))
+
+    def issues(self):
+        state = self._state
+        if state is None:
+            self.start()
+            return []
+        return list(state['issues'])
+
+    def is_available(self, name):
+        """
+        Disponibilité connue d'un composant ; tant qu'aucun contrôle n'a
+        abouti, on le suppose disponible (le premier appel réel tranchera)
+        """
+        state = self._state
+        if state is None:
+            self.start()
+            return True
+        return state['checks'].get(name, {}).get('available', True)
+
+
+monitor = HealthMonitor()
@@ -0,0 +1,202 @@
+"""
+Client HTTP partagé pour les serveurs LLM (Ollama local, routeurs distants).
+
+Une session requests par hôte, avec connexions keep-alive réutilisées et un
+pool borné (LLM_HTTP_POOL_SIZE) : les appels successifs à /api/generate ne
+rouvrent pas une connexion TCP à chaque ticket. Le délai de connexion est
+court (LLM_HTTP_CONNECT_TIMEOUT) et distinct du délai de lecture passé par
+l'appelant ; les erreurs de connexion et les réponses 429/502/503/504 sont
+retentées (LLM_HTTP_RETRIES) après une attente exponentielle avec jitter.
+Latences et statistiques des pools par point d'accès : http_stats().
+"""
+import logging
+import random
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = (429, 502, 503, 504)
+
+LATENCY_SAMPLES = 512
+
+
+class EndpointStats:
+    """Compteurs et dernières latences d'un point d'accès (hôte + chemin)"""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def summary(self):
+        latencies = sorted(self.latencies)
+
+        def pct(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1)
+
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'retries': self.retries,
+            'p50_ms': pct(0.50),
+            'p95_ms': pct(0.95),
+            'max_ms': round(latencies[-1] * 1000, 1) if latencies else None,
+        }
+
+
+class HTTPClient:
+    def __init__(self):
+        self._sessions = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    @property
+    def pool_size(self):
+        return getattr(settings, 'LLM_HTTP_POOL_SIZE', 10)
+
+    @property
+    def connect_timeout(self):
+        return getattr(settings, 'LLM_HTTP_CONNECT_TIMEOUT', 3)
+
+    @property
+    def retries(self):
+        return getattr(settings, 'LLM_HTTP_RETRIES', 2)
+
+    @property
+    def backoff(self):
+        return getattr(settings, 'LLM_HTTP_BACKOFF', 0.25)
+
+    def session(self, url):
+        """Session keep-alive de l'hôte de `url` (créée au premier appel)"""
+        parts = urlsplit(url)
+        host = f"{parts.scheme}://{parts.netloc}"
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                # pool_block : au-delà de pool_size requêtes simultanées, on attend
+                # une connexion libre au lieu d'en ouvrir (et jeter) de nouvelles
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, pool_block=True, max_retries=0)
+                session.mount(f"{parts.scheme}://", adapter)
+                self._sessions[host] = session
+            return session
+
+    def _endpoint_stats(self, endpoint):
+        with self._lock:
+            stats = self._stats.get(endpoint)
+            if stats is None:
+                stats = self._stats[endpoint] = EndpointStats()
+            return stats
+
+    def _delay(self, attempt):
+        # Attente exponentielle avec jitter complet : les workers ne retentent pas en même temps
+        return random.uniform(0, self.backoff * (2 ** attempt))
+
+    def request(self, method, url, timeout=30, connect_timeout=None, retries=None, **kwargs):
+        """
+        Requête via la session partagée. `timeout` est le délai de lecture ;
+        lève les exceptions de requests comme un appel direct
+        """
+        connect_timeout = self.connect_timeout if connect_timeout is None else connect_timeout
+        retries = self.retries if retries is None else retries
+        parts = urlsplit(url)
+        endpoint = f"{parts.netloc}{parts.path}"
+        stats = self._endpoint_stats(endpoint)
+        session = self.session(url)
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                response = session.request(method, url, timeout=(connect_timeout, timeout), **kwargs)
+            except requests.exceptions.RequestException as e:
+                elapsed = time.perf_counter() - start
+                with self._lock:
+                    stats.requests += 1
+                    stats.errors += 1
+                timed_out = isinstance(e, requests.exceptions.Timeout)
+                metrics.record('http', elapsed, provider=endpoint, outcome='timeout' if timed_out else 'error')
+                # Seuls les échecs de connexion sont retentés : rien n'a été traité. Un délai
+                # de lecture ne l'est pas, le serveur a peut-être déjà calculé la réponse
+                retryable = (isinstance(e, requests.exceptions.ConnectionError)
+                             and not isinstance(e, requests.exceptions.ReadTimeout))
+                if not retryable or attempt >= retries:
+                    raise
+            else:
+                elapsed = time.perf_counter() - start
+                retry = response.status_code in RETRY_STATUSES and attempt < retries
+                with self._lock:
+                    stats.requests += 1
+                    stats.latencies.append(elapsed)
+                    if response.status_code >= 400:
+                        stats.errors += 1
+                metrics.record('http', elapsed, provider=endpoint,
+                               outcome='ok' if response.status_code < 400 else f"http_{response.status_code}")
+                if not retry:
+                    return response
+                response.close()
+            attempt += 1
+            with self._lock:
+                stats.retries += 1
+            delay = self._delay(attempt - 1)
+            logger.warning("Requête %s %s échouée, nouvel essai %d/%d dans %.2fs",
+                           method, endpoint, attempt, retries, delay)
+            time.sleep(delay)
+
+    def get(self, url, timeout=30, **kwargs):
+        return self.request('GET', url, timeout=timeout, **kwargs)
+
+    def post(self, url, timeout=30, **kwargs):
+        return self.request('POST', url, timeout=timeout, **kwargs)
+
+    def stats(self):
+        """Latences par point d'accès et état des pools de connexions par hôte"""
+        with self._lock:
+            endpoints = {endpoint: stats.summary() for endpoint, stats in self._stats.items()}
+            sessions = dict(self._sessions)
+        pools = {}
+        for host, session in sessions.items():
+            adapter = session.get_adapter(host)
+            connections = 0
+            served = 0
+            idle = 0
+            for key in list(adapter.poolmanager.pools.keys()):
+                pool = adapter.poolmanager.pools.get(key)
+                if pool is None:
+                    continue
+                connections += pool.num_connections
+                served += pool.num_requests
+                # La file du pool contient des emplacements vides (None) en plus des connexions libres
+                idle += sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool is not None else 0
+            pools[host] = {
+                'maxsize': self.pool_size,
+                'connections_opened': connections,
+                'requests_served': served,
+                'idle_connections': idle,
+            }
+        return {'endpoints': endpoints, 'pools': pools}
+
+    def close(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
+
+
+client = HTTPClient()
+
+
+def http_stats():
+    return client.stats()
@@ -0,0 +1,317 @@
+"""
+Ingestion en masse de tickets (dossier ou archive zip).
+
+Les fichiers sont identifiés par le SHA-256 de leur contenu : un ticket déjà
+présent en base (ExtractionHistory.content_hash) ou déjà listé dans le
+fichier de reprise est ignoré. L'OCR et l'extraction tournent dans des
+processus séparés, par lots (run_ocr_batch) ; seul le processus principal
+écrit en base, par transactions groupées.
+"""
+import json
+import logging
+import os
+import tempfile
+import time
+import zipfile
+from collections import defaultdict
+
+from django.core.files import File
+from django.db import transaction
+
+from . import metrics
+from .models import ExtractionHistory
+from .ocr_layout import OCRLayout
+
+logger = logging.getLogger(__name__)
+
+TICKET_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.pdf')
+
+# Extraction structurée après l'OCR : fonction des vues utilisée par analyse
+ANALYSES = {
+    'llm': 'analyze_three_texts_with_llm',
+    'gemini': 'analyze_three_texts_with_gemini',
+    'regex': None,
+    'none': None,
+}
+
+
+def is_ticket_file(name):
+    base = os.path.basename(name)
+    return not base.startswith('.') and base.lower().endswith(TICKET_EXTENSIONS)
+
+
+def iter_ticket_files(source, workdir=None):
+    """
+    Produit (nom relatif, chemin) des tickets d'un dossier (récursif) ou
+    d'une archive zip ; les membres de l'archive sont extraits un par un
+    dans `workdir`
+    """
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for member in sorted(archive.namelist()):
+                if member.endswith('/') or not is_ticket_file(member):
+                    continue
+                yield member, archive.extract(member, workdir)
+        return
+    for root, dirs, files in os.walk(source):
+        dirs.sort()
+        for name in sorted(files):
+            if is_ticket_file(name):
+                path = os.path.join(root, name)
+                yield os.path.relpath(path, source), path
+
+
+class Checkpoint:
+    """
+    Fichier de reprise : empreintes des tickets déjà écrits en base, mis à
+    jour après chaque transaction (écriture atomique par renommage)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.done = {}
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.done = json.load(f).get('done', {})
+
+    def __contains__(self, content_hash):
+        return content_hash in self.done
+
+    def add(self, content_hash, name):
+        self.done[content_hash] = name
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'done': self.done, 'updated_at': time.strftime('%Y-%m-%dT%H:%M:%S')}, f)
+        os.replace(tmp_path, self.path)
+
+
+class StageTimings:
+    """Durées cumulées par étape (secondes)"""
+
+    def __init__(self):
+        self.totals = defaultdict(float)
+        self.counts = defaultdict(int)
+
+    def add(self, stage, seconds, count=1):
+        self.totals[stage] += seconds
+        self.counts[stage] += count
+
+    def summary(self):
+        return {
+            stage: {
+                'total_s': round(total, 3),
+                'count': self.counts[stage],
+                'mean_ms': round(total * 1000 / self.counts[stage], 1) if self.counts[stage] else 0.0,
+            }
+            for stage, total in self.totals.items()
+        }
+
+
+def init_worker():
+    """Initialisation d'un processus de l'ingestion"""
+    import django
+    from django.apps import apps
+    from django.db import connections
+
+    if not apps.ready:
+        django.setup()
+    # Les connexions héritées du processus parent ne doivent pas être partagées
+    connections.close_all()
+
+
+def extract_fields(analysis, ocr_results):
+    """Extraction structurée (dict) des textes OCR selon l'analyse demandée"""
+    if analysis == 'none':
+        return None
+    from . import views
+    if analysis == 'regex':
+        texte_combine = f"{ocr_results.get('doctr', '')}\n{ocr_results.get('tesseract', '')}\n{ocr_results.get('docling', '')}"
+        return views.extraire_elements_avec_regex(texte_combine)
+    return getattr(views, ANALYSES[analysis])(ocr_results)
+
+
+def process_chunk(task):
+    """
+    Tâche d'un processus : OCR groupé d'un lot de fichiers puis extraction
+    ticket par ticket. Retourne une entrée par fichier, avec ses durées.
+    """
+    items, analysis, use_cache = task
+    from .ocr_pipeline import run_ocr_batch, score_ocr_output
+
+    paths = [item['path'] for item in items]
+    start = time.perf_counter()
+    try:
+        batch = run_ocr_batch(paths, use_cache=use_cache)
+    except Exception as e:
+        logger.exception("OCR du lot impossible")
+        return [dict(item, error=f"Erreur OCR: {e}") for item in items]
+    ocr_seconds = (time.perf_counter() - start) / len(items)
+
+    outputs = []
+    for item, (ocr_results, details) in zip(items, batch):
+        details = {name: dict(engine_details or {}) for name, engine_details in details.items()}
+        layout = details.get('doctr', {}).pop('layout', None)
+        start = time.perf_counter()
+        with metrics.collecting() as timings:
+            try:
+                fields = extract_fields(analysis, ocr_results)
+            except Exception as e:
+                fields = {'error': f"Erreur d'extraction: {e}"}
+        outputs.append(dict(
+            item,
+            ocr_results=ocr_results,
+            ocr_report={
+                'mode': 'batch',
+                'engines_run': list(ocr_results),
+                'scores': {name: score_ocr_output(text, details.get(name)) for name, text in ocr_results.items()},
+            },
+            layout=layout,
+            fields=fields,
+            spans=timings.summary(),
+            timings={'ocr': round(ocr_seconds, 4), 'extraction': round(time.perf_counter() - start, 4)},
+        ))
+    return outputs
+
+
+def save_ingested(output, analysis):
+    """
+    Écrit un ticket traité : ExtractionHistory, puis TicketHistory et
+    AccountingEntry si l'extraction donne magasin, date et total (sinon OCR
+    seul, à valider à la main). À appeler dans une transaction.
+    """
+    from .accounting import is_accountable
+    from .views import generate_accounting_report
+
+    ocr_results = output['ocr_results']
+    extraction = ExtractionHistory(
+        extracted_text=ocr_results.get('doctr'),
+        content_hash=output['content_hash'],
+        ocr_details={
+            'ocr': output['ocr_report'],
+            'ingest': {'source': output['name'], 'analysis': analysis, 'timings': output['timings']},
+            'timings': output.get('spans'),
+        },
+    )
+    if output.get('layout'):
+        extraction.ocr_layout = OCRLayout.decode(output['layout']).to_bytes()
+    with open(output['path'], 'rb') as f:
+        extraction.image.save(os.path.basename(output['name']), File(f), save=False)
+    extraction.save()
+
+    fields = output.get('fields')
+    accounted = is_accountable(fields)
+    if accounted:
+        generate_accounting_report(fields, save_to_db=True)
+    return extraction, accounted
+
+
+class Ingestion:
+    """
+    Une ingestion : découverte et dédoublonnage des fichiers, traitement en
+    parallèle et écriture par transactions de `batch_size` tickets
+    """
+
+    def __init__(self, source, analysis='llm', workers=2, chunk_size=4, batch_size=20,
+                 checkpoint_path=None, use_cache=True, log=print):
+        self.source = source
+        self.analysis = analysis
+        self.workers = workers
+        self.chunk_size = max(1, chunk_size)
+        self.batch_size = max(1, batch_size)
+        self.checkpoint = Checkpoint(checkpoint_path)
+        self.use_cache = use_cache
+        self.log = log
+        self.timings = StageTimings()
+        self.counts = defaultdict(int)
+
+    def discover(self, workdir):
+        """Fichiers à traiter, sans les contenus déjà ingérés ni les doublons"""
+        from .ocr_cache import hash_file
+
+        items = []
+        seen = set()
+        start = time.perf_counter()
+        for name, path in iter_ticket_files(self.source, workdir):
+            self.counts['found'] += 1
+            content_hash = hash_file(path)
+            if content_hash in seen or content_hash in self.checkpoint:
+                self.counts['skipped'] += 1
+                continue
+            seen.add(content_hash)
+            items.append({'name': name, 'path': path, 'content_hash': content_hash})
+        self.timings.add('hash', time.perf_counter() - start, self.counts['found'])
+
+        hashes = [item['content_hash'] for item in items]
+        ingested = set()
+        for offset in range(0, len(hashes), 500):
+            ingested.update(
+                ExtractionHistory.objects.filter(content_hash__in=hashes[offset:offset + 500])
+                .values_list('content_hash', flat=True)
+            )
+        if ingested:
+            self.counts['skipped'] += len(ingested)
+            items = [item for item in items if item['content_hash'] not in ingested]
+        return items
+
+    def iter_outputs(self, items):
+        tasks = [
+            (items[offset:offset + self.chunk_size], self.analysis, self.use_cache)
+            for offset in range(0, len(items), self.chunk_size)
+        ]
+        if self.workers <= 1:
+            for task in tasks:
+                yield from process_chunk(task)
+            return
+
+        import multiprocessing
+        from django.db import connections
+
+        connections.close_all()
+        with multiprocessing.get_context().Pool(self.workers, initializer=init_worker) as pool:
+            for outputs in pool.imap_unordered(process_chunk, tasks):
+                yield from outputs
+
+    def flush(self, pending):
+        if not pending:
+            return
+        start = time.perf_counter()
+        with transaction.atomic():
+            for output in pending:
+                _, accounted = save_ingested(output, self.analysis)
+                self.counts['accounted' if accounted else 'ocr_only'] += 1
+        for output in pending:
+            self.checkpoint.add(output['content_hash'], output['name'])
+        self.checkpoint.save()
+        self.timings.add('db', time.perf_counter() - start, len(pending))
+        self.counts['ingested'] += len(pending)
+        self.log(f"{self.counts['ingested']} tickets enregistrés")
+        pending.clear()
+
+    def run(self):
+        start = time.perf_counter()
+        with tempfile.TemporaryDirectory(prefix='ingest-') as workdir:
+            items = self.discover(workdir)
+            self.log(f"{self.counts['found']} fichiers, {self.counts['skipped']} déjà ingérés, {len(items)} à traiter")
+            pending = []
+            for output in self.iter_outputs(items):
+                if output.get('error'):
+                    self.counts['failed'] += 1
+                    self.log(f"Échec {output['name']}: {output['error']}")
+                    continue
+                for stage, seconds in output['timings'].items():
+                    self.timings.add(stage, seconds)
+                pending.append(output)
+                if len(pending) >= self.batch_size:
+                    self.flush(pending)
+            self.flush(pending)
+        elapsed = time.perf_counter() - start
+        return {
+            'elapsed_s': round(elapsed, 3),
+            'tickets_per_s': round(self.counts['ingested'] / elapsed, 3) if elapsed else 0.0,
+            'counts': dict(self.counts),
+            'stages': self.timings.summary(),
+        }
@@ -0,0 +1,364 @@
+"""
+File d'attente des traitements OCR/LLM, stockée en base (modèle OCRJob).
+
+L'upload crée un job et rend la main immédiatement ; un pool de threads du
+worker (ou la commande `manage.py process_ocr_jobs` dans un processus séparé)
+réclame les jobs en attente et exécute le pipeline OCR + LLM. Aucun broker
+externe : la réclamation est un UPDATE conditionnel sur le statut, sûr entre
+plusieurs threads et plusieurs processus partageant la même base.
+"""
+import asyncio
+import logging
+import os
+import json
+import socket
+import threading
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from . import progress
+from .models import OCRJob, OCRJobEvent
+
+logger = logging.getLogger(__name__)
+
+
+def jobs_enabled():
+    return getattr(settings, 'OCR_ASYNC_JOBS', False)
+
+
+def enqueue_job(extraction, analysis, payload=None):
+    """Crée un job en attente et réveille les workers"""
+    job = OCRJob.objects.create(extraction=extraction, analysis=analysis, payload=payload or {})
+    logger.info("Job %s en file (%s, extraction %s)", job.pk, analysis, extraction.pk)
+    worker_pool.start()
+    worker_pool.notify()
+    return job
+
+
+def claim_next_job(worker_name):
+    """
+    Réclame le plus ancien job en attente. Retourne le job ou None ; si un
+    autre worker l'a pris entre-temps, on passe au suivant.
+    """
+    while True:
+        job_id = (
+            OCRJob.objects.filter(status='pending')
+            .order_by('created_at', 'pk')
+            .values_list('pk', flat=True)
+            .first()
+        )
+        if job_id is None:
+            return None
+        now = timezone.now()
+        claimed = OCRJob.objects.filter(pk=job_id, status='pending').update(
+            status='running', worker=worker_name, started_at=now, updated_at=now
+        )
+        if claimed:
+            job = OCRJob.objects.get(pk=job_id)
+            job.attempts += 1
+            job.save(update_fields=['attempts'])
+            return job
+
+
+def set_stage(job, stage):
+    """Met à jour l'étape en cours du job (lue par l'endpoint de statut)"""
+    job.stage = stage
+    job.updated_at = timezone.now()
+    OCRJob.objects.filter(pk=job.pk).update(stage=stage, updated_at=job.updated_at)
+    progress.emit('stage', stage=stage)
+
+
+def run_job(job):
+    # Import différé : le pipeline d'analyse vit dans les vues
+    from .views import run_ticket_analysis
+
+    reporter = progress.JobReporter(job.pk)
+    with progress.reporting(reporter):
+        try:
+            result = run_ticket_analysis(
+                job.extraction, job.analysis,
+                ocr_results=job.payload.get('ocr_results'),
+                on_stage=lambda stage: set_stage(job, stage)
+            )
+            job.result = result
+            job.status = 'done'
+            job.stage = 'done'
+        except Exception as e:
+            logger.exception("Job %s en échec", job.pk)
+            job.status = 'failed'
+            job.error = str(e)
+    job.finished_at = job.updated_at = timezone.now()
+    fields = ['result', 'status', 'stage', 'error', 'updated_at', 'finished_at']
+    try:
+        job.save(update_fields=fields)
+    except Exception as e:
+        # Résultat non sérialisable : le job ne doit pas rester bloqué en cours
+        logger.error("Enregistrement du résultat du job %s impossible: %s", job.pk, e)
+        job.result, job.status, job.error = {}, 'failed', str(e)
+        job.save(update_fields=fields)
+    # Dernier événement : la page recharge le résultat complet
+    reporter.emit(job.status, error=job.error or None)
+    logger.info(
+        "Job %s %s en %.1fs", job.pk, job.status,
+        (job.finished_at - job.started_at).total_seconds() if job.started_at else 0
+    )
+    return job
+
+
+def requeue_stale_jobs():
+    """
+    Remet en attente les jobs 'running' abandonnés (worker arrêté en cours de
+    traitement) ; au-delà de OCR_JOB_MAX_ATTEMPTS ils passent en échec. Un job
+    est abandonné quand son dernier battement (updated_at : étape ou événement)
+    date de plus de OCR_JOB_STALE_SECONDS, quelle que soit sa durée totale.
+    """
+    stale_after = getattr(settings, 'OCR_JOB_STALE_SECONDS', 900)
+    cutoff = timezone.now() - timedelta(seconds=stale_after)
+    # Jobs réclamés avant la migration 0012 : pas encore de battement
+    stale = OCRJob.objects.filter(status='running').filter(
+        Q(updated_at__lt=cutoff) | Q(updated_at__isnull=True, started_at__lt=cutoff)
+    )
+    max_attempts = getattr(settings, 'OCR_JOB_MAX_ATTEMPTS', 2)
+    failed = stale.filter(attempts__gte=max_attempts).update(
+        status='failed', error='Traitement interrompu', finished_at=timezone.now()
+    )
+    requeued = stale.update(status='pending', worker='', stage='')
+    if failed or requeued:
+        logger.warning("Jobs abandonnés: %s remis en file, %s en échec", requeued, failed)
+    return requeued
+
+
+class JobWorkerPool:
+    """
+    Threads de traitement des jobs, démarrés à la première mise en file ou au
+    lancement du serveur
+    """
+
+    def __init__(self):
+        self._threads = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+
+    @property
+    def size(self):
+        return getattr(settings, 'OCR_JOB_WORKERS', 2)
+
+    @property
+    def poll_interval(self):
+        return getattr(settings, 'OCR_JOB_POLL_INTERVAL', 2.0)
+
+    def start(self, size=None):
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            if self._threads:
+                return
+            self._stop.clear()
+            prefix = f"{socket.gethostname()}:{os.getpid()}"
+            for index in range(size or self.size):
+                thread = threading.Thread(
+                    target=self.work, args=(f"{prefix}:{index}",),
+                    kwargs={'recover': index == 0},
+                    name=f"ocr-job-{index}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def join(self, timeout=None):
+        for thread in list(self._threads):
+            thread.join(timeout)
+
+    def notify(self):
+        self._wakeup.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def work(self, worker_name, once=False, recover=False):
+        """Boucle d'un worker : réclame et exécute les jobs jusqu'à l'arrêt"""
+        if recover:
+            try:
+                requeue_stale_jobs()
+            except Exception as e:
+                logger.error("Reprise des jobs abandonnés impossible: %s", e)
+        while not self._stop.is_set():
+            close_old_connections()
+            try:
+                job = claim_next_job(worker_name)
+            except Exception as e:
+                logger.error("Lecture de la file des jobs impossible: %s", e)
+                job = None
+            if job is not None:
+                run_job(job)
+                continue
+            if once:
+                return
+            # File vide : attendre une mise en file locale ou le prochain sondage
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+        close_old_connections()
+
+    def stats(self):
+        alive = sum(1 for t in self._threads if t.is_alive())
+        counts = {status: 0 for status, _ in OCRJob.STATUS_CHOICES}
+        try:
+            for row in OCRJob.objects.values('status').order_by().annotate(n=Count('pk')):
+                counts[row['status']] = row['n']
+        except Exception:
+            pass
+        return {'workers': alive, 'jobs': counts}
+
+
+def describe_job(job):
+    """Représentation JSON d'un job pour l'endpoint de statut"""
+    data = {
+        'id': job.pk,
+        'status': job.status,
+        'stage': job.stage,
+        'analysis': job.analysis,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'updated_at': job.updated_at.isoformat() if job.updated_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'error': job.error or None,
+    }
+    if job.status == 'pending':
+        data['queue_position'] = OCRJob.objects.filter(
+            status='pending', created_at__lte=job.created_at
+        ).count()
+    if job.status == 'done':
+        data['result'] = job.result
+    return data
+
+
+worker_pool = JobWorkerPool()
+
+
+def _job_event_chunks(job_id, after):
+    """
+    Textes SSE des événements du job postérieurs à `after` :
+    (textes, id du dernier événement envoyé, flux terminé)
+    """
+    chunks = []
+    events = list(OCRJobEvent.objects.filter(job_id=job_id, pk__gt=after).order_by('pk'))
+    for event in events:
+        after = event.pk
+        payload = json.dumps(dict(event.data, at=event.created_at.isoformat()), cls=DjangoJSONEncoder)
+        chunks.append(f"id: {event.pk}\nevent: {event.kind}\ndata: {payload}\n\n")
+        if event.kind in ('done', 'failed'):
+            return chunks, after, True
+    if not events:
+        status = OCRJob.objects.filter(pk=job_id).values_list('status', flat=True).first()
+        if status is None:
+            return chunks, after, True
+        if status in ('done', 'failed'):
+            chunks.append(f"event: {status}\ndata: {{}}\n\n")
+            return chunks, after, True
+    return chunks, after, False
+
+
+def _stream_settings(poll_interval, timeout):
+    return (poll_interval or getattr(settings, 'OCR_PROGRESS_POLL_INTERVAL', 0.3),
+            timeout or getattr(settings, 'OCR_PROGRESS_STREAM_TIMEOUT', 600))
+
+
+def iter_job_events(job_id, after=0, poll_interval=None, timeout=None, heartbeat=15):
+    """
+    Flux server-sent events des événements d'un job, à partir de l'id `after`.
+    Se termine après l'événement final du job (done/failed) ou au délai maximal.
+    Version bloquante pour WSGI : le flux occupe un thread du serveur tant
+    qu'il est ouvert (voir open_job_event_stream)
+    """
+    poll_interval, timeout = _stream_settings(poll_interval, timeout)
+    deadline = time.monotonic() + timeout
+    last_sent = time.monotonic()
+    yield "retry: 2000\n\n"
+    while time.monotonic() < deadline:
+        chunks, after, finished = _job_event_chunks(job_id, after)
+        yield from chunks
+        if finished:
+            return
+        if chunks:
+            last_sent = time.monotonic()
+        elif time.monotonic() - last_sent > heartbeat:
+            yield ": ping\n\n"
+            last_sent = time.monotonic()
+        close_old_connections()
+        time.sleep(poll_interval)
+
+
+async def aiter_job_events(job_id, after=0, poll_interval=None, timeout=None, heartbeat=15):
+    """
+    Équivalent asynchrone de iter_job_events() pour ASGI : les requêtes en
+    base passent par sync_to_async et l'attente ne bloque aucun thread, le
+    flux est envoyé au fil de l'eau au lieu d'être mis en tampon
+    """
+    poll_interval, timeout = _stream_settings(poll_interval, timeout)
+    deadline = time.monotonic() + timeout
+    last_sent = time.monotonic()
+    yield "retry: 2000\n\n"
+    while time.monotonic() < deadline:
+        chunks, after, finished = await sync_to_async(_job_event_chunks)(job_id, after)
+        for chunk in chunks:
+            yield chunk
+        if finished:
+            return
+        if chunks:
+            last_sent = time.monotonic()
+        elif time.monotonic() - last_sent > heartbeat:
+            yield ": ping\n\n"
+            last_sent = time.monotonic()
+        await asyncio.sleep(poll_interval)
+
+
+_stream_slots = None
+_stream_slots_lock = threading.Lock()
+
+
+def _get_stream_slots():
+    global _stream_slots
+    with _stream_slots_lock:
+        if _stream_slots is None:
+            _stream_slots = threading.BoundedSemaphore(getattr(settings, 'OCR_PROGRESS_MAX_STREAMS', 8))
+        return _stream_slots
+
+
+class _SlotStream:
+    """Itérateur du flux SSE qui libère sa place à la fermeture de la réponse"""
+
+    def __init__(self, iterator, slots):
+        self._iterator = iterator
+        self._slots = slots
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._iterator)
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._iterator.close()
+            self._slots.release()
+
+
+def open_job_event_stream(job_id, after=0):
+    """
+    Flux SSE bloquant (WSGI) d'un job, ou None si OCR_PROGRESS_MAX_STREAMS
+    flux sont déjà ouverts dans ce processus : chacun retient un thread du
+    serveur jusqu'à OCR_PROGRESS_STREAM_TIMEOUT secondes
+    """
+    slots = _get_stream_slots()
+    if not slots.acquire(blocking=False):
+        return None
+    return _SlotStream(iter_job_events(job_id, after), slots)
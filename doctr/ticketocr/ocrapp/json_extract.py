@@ -0,0 +1,130 @@
+"""
+Extraction en temps linéaire de l'objet JSON d'un ticket dans une réponse LLM.
+
+Une seule passe sur le texte : les blocs <think> sont sautés et un automate
+suit les accolades hors des chaînes (guillemets doubles, échappements). Les
+objets maximaux (non contenus dans un autre objet fermé) sont les premiers
+candidats : ils sont disjoints, donc chaque caractère est analysé par
+json.loads au plus deux fois (tel quel, puis après réparation des guillemets
+simples et des virgules finales). Un candidat invalide ou sans champ du
+ticket (accolades de la prose autour du JSON) cède la place aux objets qu'il
+contient, sur MAX_NESTING niveaux au plus : le coût reste linéaire. Chaque
+candidat est noté par le nombre de champs du ticket qu'il contient ; le
+meilleur (le dernier à égalité, la version finale après les brouillons) est
+retenu. Si aucun ticket n'est trouvé et qu'il reste des accolades jamais
+refermées, une seconde et dernière passe les ignore : leurs guillemets
+avaient pu être pris pour des chaînes.
+"""
+import json
+import re
+
+from .llm_router import TICKET_FIELDS
+
+THINK_OPEN = '<think>'
+THINK_CLOSE = '</think>'
+
+# Nombre minimal de champs du ticket pour retenir un objet
+MIN_SCORE = 2
+
+# Niveaux d'objets invalides englobants explorés au plus (prose à accolades)
+MAX_NESTING = 3
+
+SINGLE_QUOTED_RE = re.compile(r"'([^']*)'")
+TRAILING_COMMA_RE = re.compile(r',(\s*[}\]])')
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+def object_spans(text, ignored=frozenset()):
+    """
+    ([(début, fin, objets contenus)] des objets JSON maximaux du texte hors
+    blocs <think>, positions des accolades jamais refermées) : accolades
+    suivies hors des chaînes en une passe, celles des positions `ignored` exceptées
+    """
+    spans = []
+    stack = []
+    in_string = False
+    escape = False
+    i = 0
+    n = len(text)
+    while i < n:
+        char = text[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif char == '\\':
+                escape = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            # Hors objet, les guillemets sont de la prose : seules les chaînes JSON comptent
+            in_string = bool(stack)
+        elif char == '{' and i not in ignored:
+            stack.append(i)
+        elif char == '}':
+            if stack:
+                start = stack.pop()
+                # Un objet fermé remplace les objets qu'il contient, gardés comme enfants
+                children = []
+                while spans and spans[-1][0] > start:
+                    children.append(spans.pop())
+                children.reverse()
+                spans.append((start, i + 1, children))
+        elif char == '<' and text.startswith(THINK_OPEN, i):
+            # Un raisonnement n'est jamais dans un objet : les accolades ouvertes avant sont de la prose
+            stack.clear()
+            end = text.find(THINK_CLOSE, i + len(THINK_OPEN))
+            # Bloc non refermé : seule la balise est ignorée
+            i = end + len(THINK_CLOSE) if end >= 0 else i + len(THINK_OPEN)
+            continue
+        i += 1
+    return spans, stack
+
+
+def repair(candidate):
+    """Réparations des sorties LLM courantes : espaces, guillemets simples, virgules finales"""
+    candidate = WHITESPACE_RE.sub(' ', candidate)
+    candidate = SINGLE_QUOTED_RE.sub(r'"\1"', candidate)
+    return TRAILING_COMMA_RE.sub(r'\1', candidate)
+
+
+def parse_candidate(candidate):
+    """Objet JSON du candidat (tel quel, sinon réparé), ou None"""
+    for attempt in (candidate, repair(candidate)):
+        try:
+            data = json.loads(attempt, strict=False)
+        except (ValueError, RecursionError):
+            # RecursionError : imbrication de tableaux trop profonde pour json.loads
+            continue
+        if isinstance(data, dict):
+            return data
+    return None
+
+
+def score(data):
+    return sum(1 for field in TICKET_FIELDS if field in data)
+
+
+def extract_ticket_json(text):
+    """Meilleur objet JSON de ticket de la réponse (au moins MIN_SCORE champs), ou None"""
+    if not text or not isinstance(text, str):
+        return None
+    spans, unclosed = object_spans(text)
+    best = best_candidate(text, spans)
+    if best is None and unclosed:
+        spans, _ = object_spans(text, frozenset(unclosed))
+        best = best_candidate(text, spans)
+    return best
+
+
+def best_candidate(text, spans, nesting=0):
+    """Meilleur ticket parmi les objets `spans` ; les objets contenus départagent les candidats rejetés"""
+    best, best_score = None, 0
+    for start, end, children in spans:
+        data = parse_candidate(text[start:end])
+        data_score = score(data) if data is not None else 0
+        if data_score < MIN_SCORE and children and nesting < MAX_NESTING:
+            data = best_candidate(text, children, nesting + 1)
+            data_score = score(data) if data is not None else 0
+        if data_score >= MIN_SCORE and data_score >= best_score:
+            best, best_score = data, data_score
+    return best
@@ -0,0 +1,924 @@
+"""
+Analyse LLM des textes OCR : HuggingFace (Qwen), Ollama (mistral, llama2),
+Google Gemini, parsing JSON des réponses et post-traitements (timbre fiscal,
+validation regex).
+
+Les SDK openai et google.generativeai sont importés et configurés au premier
+appel, pas au chargement du module : les commandes manage.py et le démarrage
+des workers ne paient ni leur import ni leur initialisation.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from functools import partial
+
+import requests
+from django.conf import settings
+from dotenv import load_dotenv
+
+from . import llm_cache, llm_router, llm_stream, metrics, progress
+from .circuit_breaker import breakers
+from .health import monitor as health_monitor
+from .http_client import client as http_client
+from .json_extract import extract_ticket_json
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Serveur Ollama local (remplaçable, ex. par le serveur factice des benchmarks)
+OLLAMA_BASE_URL = getattr(settings, 'OLLAMA_BASE_URL', "http://localhost:11434").rstrip('/')
+
+# Version des prompts d'extraction, incluse dans la clé du cache LLM :
+# à incrémenter à chaque modification d'un prompt ou du format de sortie
+PROMPT_VERSION = '2'
+
+# Schéma JSON d'un ticket : sortie contrainte des fournisseurs qui le
+# permettent (Ollama `format`, OpenAI `response_format`), analysée en un seul json.loads
+TICKET_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "Magasin": {"type": "string"},
+        "NumeroTicket": {"type": "string"},
+        "Date": {"type": "string"},
+        "Articles": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "nom": {"type": "string"},
+                    "prix": {"type": "string"},
+                },
+                "required": ["nom", "prix"],
+                "additionalProperties": False,
+            },
+        },
+        "Total": {"type": "string"},
+    },
+    "required": ["Magasin", "NumeroTicket", "Date", "Articles", "Total"],
+    "additionalProperties": False,
+}
+
+# Fournisseurs ayant refusé la sortie contrainte (version d'Ollama trop ancienne,
+# fournisseur du routeur HuggingFace sans json_schema) : texte libre pour ce processus
+_unconstrained = set()
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_hf_client():
+    """Client OpenAI du routeur HuggingFace, créé au premier appel ; None sans HF_TOKEN"""
+    with _clients_lock:
+        if 'huggingface' not in _clients:
+            hf_token = os.environ.get("HF_TOKEN", "")
+            if not hf_token:
+                print("âš ï¸ Token HuggingFace manquant dans .env")
+                _clients['huggingface'] = None
+            else:
+                try:
+                    from openai import OpenAI
+                    _clients['huggingface'] = OpenAI(
+                        base_url=getattr(settings, 'HF_BASE_URL', "https://router.huggingface.co/v1"),
+                        api_key=hf_token,
+                    )
+                    print("âœ… Client HuggingFace initialisÃ©")
+                except Exception as e:
+                    print(f"âŒ Erreur initialisation client HuggingFace: {e}")
+                    _clients['huggingface'] = None
+        return _clients['huggingface']
+
+
+def get_genai():
+    """Module google.generativeai, configuré une fois avec GOOGLE_API_KEY"""
+    with _clients_lock:
+        if 'gemini' not in _clients:
+            import google.generativeai as genai
+            genai.configure(api_key=os.environ.get("GOOGLE_API_KEY"))
+            _clients['gemini'] = genai
+        return _clients['gemini']
+
+
+def clean_json_response(text):
+    """
+    Extrait l'objet JSON du ticket d'une réponse LLM (blocs <think>, texte
+    autour, guillemets simples, virgules finales) en une passe : voir json_extract.py
+    """
+    if not text or not isinstance(text, str):
+        return None
+
+    print(f"Texte original reçu: {text[:200]}...")
+    result = extract_ticket_json(text)
+    if result is None:
+        print("❌ Aucun JSON valide trouvé")
+    return result
+
+
+def structured_output(provider):
+    return getattr(settings, 'LLM_STRUCTURED_OUTPUT', True) and provider not in _unconstrained
+
+
+def parse_ticket_json(text):
+    """
+    (données, issue) : une sortie contrainte est analysée en un seul json.loads
+    ('direct') ; sinon clean_json_response extrait le JSON du texte libre
+    ('repaired'), ou rien ('invalid')
+    """
+    try:
+        data = json.loads(text)
+        if isinstance(data, dict):
+            return data, 'direct'
+    except (TypeError, ValueError):
+        pass
+    data = clean_json_response(text)
+    return data, 'repaired' if data else 'invalid'
+
+
+def ollama_generate(model, prompt, timeout):
+    """
+    Texte de la réponse de /api/generate, avec le schéma du ticket en `format`
+    si Ollama le permet ; en flux, lecture arrêtée dès l'objet du ticket complet
+    """
+    stream = llm_stream.streaming_enabled()
+    payload = {"model": model, "prompt": llm_stream.suppress_reasoning(prompt, model), "stream": stream}
+    if structured_output('ollama'):
+        payload["format"] = TICKET_SCHEMA
+    url = f"{OLLAMA_BASE_URL}/api/generate"
+    started = time.perf_counter()
+    response = http_client.post(url, json=payload, timeout=timeout, stream=stream)
+    if response.status_code == 400 and "format" in payload:
+        # Ollama < 0.5 n'accepte pas de schéma : texte libre désormais
+        logger.warning("Ollama refuse la sortie contrainte (%s), texte libre", response.text[:200])
+        _unconstrained.add('ollama')
+        payload.pop("format")
+        response = http_client.post(url, json=payload, timeout=timeout, stream=stream)
+    if response.status_code >= 400:
+        response.close()
+    response.raise_for_status()
+    if not stream:
+        return response.json().get("response", "")
+    return llm_stream.collect(llm_stream.ollama_tokens(response), response.close, 'ollama', model,
+                              timeout=timeout, started=started)
+
+
+def hf_chat_completion(client, model, prompt, timeout):
+    """
+    Texte de la complétion du routeur HuggingFace, avec response_format
+    json_schema si le fournisseur l'accepte ; en flux, lecture arrêtée dès
+    l'objet du ticket complet
+    """
+    stream = llm_stream.streaming_enabled()
+    kwargs = dict(
+        model=model,
+        messages=[{"role": "user", "content": llm_stream.suppress_reasoning(prompt, model)}],
+        temperature=0,
+        timeout=timeout,
+        stream=stream,
+    )
+    completion = None
+    started = time.perf_counter()
+    if structured_output('huggingface'):
+        try:
+            completion = client.chat.completions.create(
+                response_format={
+                    "type": "json_schema",
+                    "json_schema": {"name": "ticket", "schema": TICKET_SCHEMA, "strict": True},
+                },
+                **kwargs
+            )
+        except Exception as e:
+            # 400/422 : fournisseur sans sortie contrainte ; les autres erreurs remontent
+            if getattr(e, 'status_code', None) not in (400, 422):
+                raise
+            logger.warning("HuggingFace refuse response_format (%s), texte libre", e)
+            _unconstrained.add('huggingface')
+    if completion is None:
+        completion = client.chat.completions.create(**kwargs)
+    if not stream:
+        return completion.choices[0].message.content or ""
+    return llm_stream.collect(
+        llm_stream.openai_tokens(completion),
+        lambda: llm_stream.close_openai_stream(completion),
+        'huggingface', model, timeout=timeout, started=started,
+    )
+
+
+def analyze_three_texts_with_llm_fast(ocr_results, fallback=True):
+    """
+    Version rapide avec un modÃ¨le plus lÃ©ger
+    (fallback=False : pas de repli sur llama2, utilisé par le routeur)
+    """
+    docling_text = ocr_results.get("docling", "")
+    tesseract_text = ocr_results.get("tesseract", "")
+    doctr_text = ocr_results.get("doctr", "")
+    
+    prompt = f"""Tu es un assistant expert en analyse de tickets de caisse.
+
+Voici trois extraits OCR du mÃªme ticket :
+
+--- OCR DocLing ---
+{docling_text}
+
+--- OCR Tesseract ---
+{tesseract_text}
+
+--- OCR Doctr ---
+{doctr_text}
+
+Extrais les Ã©lÃ©ments suivants et retourne UNIQUEMENT un objet JSON valide :
+
+{{
+  "Magasin": "Nom du magasin",
+  "NumeroTicket": "NumÃ©ro du ticket",
+  "Date": "JJ/MM/AAAA HH:MM",
+  "Articles": [
+    {{ "nom": "Nom article", "prix": "Prix en DT" }},
+    {{ "nom": "TIMBRE FISCAL", "prix": "0.100 DT" }}
+  ],
+  "Total": "Montant total en DT"
+}}
+
+RÃˆGLES IMPORTANTES :
+1. Le timbre fiscal (0.100 DT, 0.200 DT, etc.) doit Ãªtre inclus dans Articles avec nom "TIMBRE FISCAL"
+2. Si tu vois "100 DT", convertis-le en "0.100 DT" pour les timbres fiscaux
+3. Retourne UNIQUEMENT le JSON, sans commentaires ni texte supplÃ©mentaire
+4. Commence par {{ et termine par }}
+"""
+    cached = llm_cache.get_cached_result(ocr_results, 'ollama', "mistral", PROMPT_VERSION)
+    if cached:
+        return cached
+    if not health_monitor.is_available('ollama'):
+        # Ollama arrêté au dernier contrôle : repli immédiat sans attendre le délai
+        raise Exception("Ollama indisponible (contrôle de santé)")
+    try:
+        print("Tentative avec modÃ¨le rapide (mistral)...")
+        progress.emit('llm_attempt', provider='ollama/mistral', model="mistral")
+        with breakers['ollama'].guard(), metrics.span('llm', provider='ollama', model="mistral"):
+            result_text = ollama_generate("mistral", prompt, timeout=30)
+        print("RÃ©ponse reÃ§ue de l'API Ollama (modÃ¨le rapide)")
+        
+        # Parser le JSON de la rÃ©ponse LLM
+        with metrics.span('json_parse', provider='ollama', model="mistral") as parse_span:
+            parsed_data, parse_outcome = parse_ticket_json(result_text)
+            parse_span.tag(outcome=parse_outcome)
+        progress.emit('json_parsed', provider='ollama/mistral', ok=bool(parsed_data))
+        if parsed_data:
+            result_data = {
+                "Date": parsed_data.get("Date", ""),
+                "Magasin": parsed_data.get("Magasin", ""),
+                "NumeroTicket": parsed_data.get("NumeroTicket", ""),
+                "Total": parsed_data.get("Total", ""),
+                "Articles": parsed_data.get("Articles", []),
+                "Commentaire": "DonnÃ©es extraites par modÃ¨le rapide",
+                "texte_fusionne": result_text.strip()
+            }
+            
+            # Post-traitement pour s'assurer que le timbre fiscal est bien dÃ©tectÃ©
+            result_data = post_process_timbre_fiscal(result_data)
+            
+            # Validation et correction avec regex
+            texte_ocr_combined = f"{docling_text}\n{tesseract_text}\n{doctr_text}"
+            result_data = valider_et_corriger_avec_regex(result_data, texte_ocr_combined)
+            llm_cache.store_result(ocr_results, 'ollama', "mistral", PROMPT_VERSION, result_data)
+            
+            return result_data
+        
+        # Si pas de JSON, retourner le texte brut
+        return {
+            "Date": "",
+            "Magasin": "",
+            "NumeroTicket": "",
+            "Total": "",
+            "Articles": [],
+            "Commentaire": "Texte fusionnÃ© et corrigÃ© (modÃ¨le rapide)",
+            "texte_fusionne": result_text.strip()
+        }
+    except requests.exceptions.Timeout:
+        if not fallback:
+            return {"error": "Timeout (modèle rapide)"}
+        print("Timeout avec mistral, essai avec modÃ¨le ultra-rapide...")
+        progress.emit('llm_fallback', provider='ollama/mistral', to='ollama/llama2', reason='timeout')
+        return analyze_three_texts_with_llm_ultra_fast(ocr_results)
+    except Exception as e:
+        print("Erreur avec modÃ¨le rapide:", str(e))
+        return {"error": f"Erreur API (modÃ¨le rapide) : {str(e)}"}
+
+def analyze_three_texts_with_llm_ultra_fast(ocr_results):
+    """
+    Version ultra-rapide avec un modÃ¨le trÃ¨s lÃ©ger
+    """
+    docling_text = ocr_results.get("docling", "")
+    tesseract_text = ocr_results.get("tesseract", "")
+    doctr_text = ocr_results.get("doctr", "")
+    
+    prompt = f"""Tu es un assistant expert en analyse de tickets de caisse.
+
+Voici trois extraits OCR du mÃªme ticket :
+
+--- OCR DocLing ---
+{docling_text}
+
+--- OCR Tesseract ---
+{tesseract_text}
+
+--- OCR Doctr ---
+{doctr_text}
+
+Extrais les Ã©lÃ©ments suivants et retourne UNIQUEMENT un objet JSON valide :
+
+{{
+  "Magasin": "Nom du magasin",
+  "NumeroTicket": "NumÃ©ro du ticket",
+  "Date": "JJ/MM/AAAA HH:MM",
+  "Articles": [
+    {{ "nom": "Nom article", "prix": "Prix en DT" }},
+    {{ "nom": "TIMBRE FISCAL", "prix": "0.100 DT" }}
+  ],
+  "Total": "Montant total en DT"
+}}
+
+RÃˆGLES IMPORTANTES :
+1. Le timbre fiscal (0.100 DT, 0.200 DT, etc.) doit Ãªtre inclus dans Articles avec nom "TIMBRE FISCAL"
+2. Si tu vois "100 DT", convertis-le en "0.100 DT" pour les timbres fiscaux
+3. Retourne UNIQUEMENT le JSON, sans commentaires ni texte supplÃ©mentaire
+4. Commence par {{ et termine par }}
+"""
+    cached = llm_cache.get_cached_result(ocr_results, 'ollama', "llama2", PROMPT_VERSION)
+    if cached:
+        return cached
+    try:
+        print("Tentative avec modÃ¨le ultra-rapide (llama2)...")
+        progress.emit('llm_attempt', provider='ollama/llama2', model="llama2")
+        with breakers['ollama'].guard(), metrics.span('llm', provider='ollama', model="llama2"):
+            result_text = ollama_generate("llama2", prompt, timeout=15)
+        print("RÃ©ponse reÃ§ue de l'API Ollama (modÃ¨le ultra-rapide)")
+        
+        # Parser le JSON de la rÃ©ponse LLM
+        with metrics.span('json_parse', provider='ollama', model="llama2") as parse_span:
+            parsed_data, parse_outcome = parse_ticket_json(result_text)
+            parse_span.tag(outcome=parse_outcome)
+        progress.emit('json_parsed', provider='ollama/llama2', ok=bool(parsed_data))
+        if parsed_data:
+            result_data = {
+                "Date": parsed_data.get("Date", ""),
+                "Magasin": parsed_data.get("Magasin", ""),
+                "NumeroTicket": parsed_data.get("NumeroTicket", ""),
+                "Total": parsed_data.get("Total", ""),
+                "Articles": parsed_data.get("Articles", []),
+                "Commentaire": "DonnÃ©es extraites par modÃ¨le ultra-rapide",
+                "texte_fusionne": result_text.strip()
+            }
+            
+            # Post-traitement pour s'assurer que le timbre fiscal est bien dÃ©tectÃ©
+            result_data = post_process_timbre_fiscal(result_data)
+            
+            # Validation et correction avec regex
+            texte_ocr_combined = f"{docling_text}\n{tesseract_text}\n{doctr_text}"
+            result_data = valider_et_corriger_avec_regex(result_data, texte_ocr_combined)
+            llm_cache.store_result(ocr_results, 'ollama', "llama2", PROMPT_VERSION, result_data)
+            
+            return result_data
+        
+        # Si pas de JSON, retourner le texte brut
+        return {
+            "Date": "",
+            "Magasin": "",
+            "NumeroTicket": "",
+            "Total": "",
+            "Articles": [],
+            "Commentaire": "Texte fusionnÃ© et corrigÃ© (modÃ¨le ultra-rapide)",
+            "texte_fusionne": result_text.strip()
+        }
+    except Exception as e:
+        print("Erreur avec modÃ¨le ultra-rapide:", str(e))
+        return {"error": f"Erreur API (modÃ¨le ultra-rapide) : {str(e)}"}
+
+def analyze_three_texts_with_qwen(ocr_results, fallback=True):
+    """
+    Analyse via HuggingFace Qwen, avec repli en cascade sur Ollama puis regex
+    (fallback=False : erreur retournée telle quelle, utilisé par le routeur)
+    """
+    # ocr_results peut être partiel (mode OCR adaptatif) : moteurs absents = texte vide
+    docling_text = ocr_results.get("docling") or ""
+    tesseract_text = ocr_results.get("tesseract") or ""
+    doctr_text = ocr_results.get("doctr") or ""
+
+    if not docling_text.strip() and not tesseract_text.strip() and not doctr_text.strip():
+        return {
+            "Date": "",
+            "Magasin": "",
+            "NumeroTicket": "",
+            "Total": "",
+            "Articles": [],
+            "Commentaire": "Aucun texte OCR extrait - les textes sont vides"
+        }
+
+    # Doctr est la source de référence ; à défaut, on envoie les moteurs exécutés
+    if doctr_text.strip() and not doctr_text.startswith("Erreur"):
+        ocr_sections = f"--- OCR Doctr ---\n{doctr_text}"
+    else:
+        ocr_sections = "\n\n".join(
+            f"--- OCR {label} ---\n{text}"
+            for label, text in (("Tesseract", tesseract_text), ("DocLing", docling_text), ("Doctr", doctr_text))
+            if text.strip()
+        )
+
+    prompt = f"""Tu es un assistant expert en analyse de tickets de caisse.
+
+Voici un extrait OCR du ticket de caisse :
+
+{ocr_sections}
+
+Ta tÃ¢che est d'extraire les Ã©lÃ©ments suivants et de retourner UNIQUEMENT un objet JSON valide :
+
+{{
+  "Magasin": "Nom du magasin",
+  "NumeroTicket": "NumÃ©ro du ticket",
+  "Date": "JJ/MM/AAAA HH:MM",
+  "Articles": [
+    {{ "nom": "Nom article", "prix": "Prix en DT" }},
+    {{ "nom": "TIMBRE FISCAL", "prix": "0.100 DT" }}
+  ],
+  "Total": "Montant total en DT"
+}}
+
+RÃˆGLES IMPORTANTES :
+1. Le timbre fiscal (0.100 DT, 0.200 DT, etc.) doit Ãªtre inclus dans Articles avec nom "TIMBRE FISCAL"
+2. Si tu vois "100 DT", convertis-le en "0.100 DT" pour les timbres fiscaux
+3. Retourne UNIQUEMENT le JSON, sans commentaires ni texte supplÃ©mentaire
+4. Commence par {{ et termine par }}
+5. Assure-toi que tous les montants soient des chaÃ®nes terminÃ©es par 'DT'
+
+NE RENVOIE QUE UN OBJET JSON. PAS DE COMMENTAIRES, PAS DE TEXTE, PAS DE PENSÃ‰ES.
+Commence DIRECTEMENT par '{' et termine par '}'.
+"""
+
+    cached = llm_cache.get_cached_result(ocr_results, 'huggingface', "Qwen/Qwen3-30B-A3B:novita", PROMPT_VERSION)
+    if cached:
+        return cached
+
+    try:
+        # Client absent ou API en échec : comptés par le disjoncteur HuggingFace
+        with breakers['huggingface'].guard():
+            # VÃ©rifier si le client est disponible
+            client = get_hf_client()
+            if client is None:
+                print("âŒ Client HuggingFace non disponible, utilisation du fallback Ollama")
+                raise Exception("Client HuggingFace non initialisÃ©")
+
+            print("ðŸ”„ Appel Ã  l'API HuggingFace avec Qwen...")
+
+            progress.emit('llm_attempt', provider='huggingface', model="Qwen/Qwen3-30B-A3B:novita")
+            with metrics.span('llm', provider='huggingface', model="Qwen/Qwen3-30B-A3B:novita"):
+                result_text = hf_chat_completion(client, "Qwen/Qwen3-30B-A3B:novita", prompt, timeout=30)
+
+        result_text = result_text.strip()
+
+        # Clean and extract JSON with error handling
+        try:
+            # Utiliser la fonction de nettoyage amÃ©liorÃ©e
+            with metrics.span('json_parse', provider='huggingface') as parse_span:
+                parsed_data, parse_outcome = parse_ticket_json(result_text)
+                parse_span.tag(outcome=parse_outcome)
+            progress.emit('json_parsed', provider='huggingface', ok=bool(parsed_data))
+            
+            if not parsed_data:
+                print("âŒ Aucun JSON valide trouvÃ© dans la rÃ©ponse LLM")
+                return {
+                    "error": "Invalid JSON response from LLM: No valid JSON found",
+                    "raw_response": result_text,
+                    "Commentaire": "La rÃ©ponse LLM ne contient pas de JSON valide"
+                }
+                
+            print(f"âœ… JSON parsÃ© avec succÃ¨s")
+            
+            result_data = {
+                "Date": parsed_data.get("Date", ""),
+                "Magasin": parsed_data.get("Magasin", ""),
+                "NumeroTicket": parsed_data.get("NumeroTicket", ""),
+                "Total": parsed_data.get("Total", ""),
+                "Articles": parsed_data.get("Articles", []),
+                "Commentaire": "DonnÃ©es extraites via HuggingFace Qwen",
+                "texte_fusionne": result_text
+            }
+
+            # Post-traitement personnalisÃ©
+            result_data = post_process_timbre_fiscal(result_data)
+            texte_ocr_combined = f"{docling_text}\n{tesseract_text}\n{doctr_text}"
+            result_data = valider_et_corriger_avec_regex(result_data, texte_ocr_combined)
+            llm_cache.store_result(ocr_results, 'huggingface', "Qwen/Qwen3-30B-A3B:novita", PROMPT_VERSION, result_data)
+
+            return result_data
+            
+        except Exception as e:
+            logger.error(f"Erreur lors du parsing JSON: {str(e)}")
+            return {
+                "error": f"Invalid JSON response from LLM: {str(e)}",
+                "raw_response": result_text,
+                "Commentaire": f"Erreur lors du parsing JSON: {str(e)}"
+            }
+
+    except Exception as e:
+        print("Erreur lors de l'appel Ã  l'API HuggingFace:", str(e))
+        if not fallback:
+            return {"error": f"Erreur API HuggingFace : {str(e)}"}
+        # Fallback vers les modÃ¨les Ollama locaux
+        try:
+            print("Tentative de fallback vers Ollama...")
+            progress.emit('llm_fallback', provider='huggingface', to='ollama/mistral', reason=str(e))
+            return analyze_three_texts_with_llm_fast(ocr_results)
+        except Exception as fallback_error:
+            print(f"Erreur avec fallback Ollama: {str(fallback_error)}")
+            # Dernier recours : analyse simple avec regex
+            try:
+                texte_ocr_combined = f"{docling_text}\n{tesseract_text}\n{doctr_text}"
+                progress.emit('llm_fallback', provider='ollama', to='regex', reason=str(fallback_error))
+                regex_result = extraire_elements_avec_regex(texte_ocr_combined)
+                
+                return {
+                    "Date": regex_result.get("dates_valides", [""])[0] if regex_result.get("dates_valides") else "",
+                    "Magasin": "",
+                    "NumeroTicket": "",
+                    "Total": regex_result.get("total", ""),
+                    "Articles": regex_result.get("articles", []),
+                    "Commentaire": f"Analyse par regex (fallback) - Erreur API: {str(e)}",
+                    "texte_fusionne": texte_ocr_combined,
+                    "ValidationRegex": {
+                        "total_coherent": regex_result.get("total_coherent", False),
+                        "somme_articles": regex_result.get("somme_articles", ""),
+                        "total_detecte": regex_result.get("total", "")
+                    }
+                }
+            except Exception as regex_error:
+                return {
+                    "Date": "",
+                    "Magasin": "",
+                    "NumeroTicket": "",
+                    "Total": "",
+                    "Articles": [],
+                    "Commentaire": f"Erreur complÃ¨te - API: {str(e)}, Fallback: {str(fallback_error)}, Regex: {str(regex_error)}",
+                    "texte_fusionne": "Erreur de traitement"
+                }
+
+
+LLM_PROVIDERS = {
+    'huggingface': partial(analyze_three_texts_with_qwen, fallback=False),
+    'ollama/mistral': partial(analyze_three_texts_with_llm_fast, fallback=False),
+    'ollama/llama2': analyze_three_texts_with_llm_ultra_fast,
+}
+
+
+def analyze_three_texts_with_llm(ocr_results):
+    """
+    Analyse LLM d'un ticket. Les fournisseurs (LLM_ROUTER_PROVIDERS) sont
+    couverts par le routeur : le suivant part si le précédent échoue ou tarde
+    (voir llm_router.py) et la première réponse JSON valide est retenue.
+    LLM_ROUTER_MODE = 'waterfall' rétablit la cascade HuggingFace → mistral → llama2.
+    """
+    has_text = any((ocr_results.get(engine) or "").strip() for engine in ("docling", "tesseract", "doctr"))
+    if getattr(settings, 'LLM_ROUTER_MODE', 'hedge') == 'waterfall' or not has_text:
+        return analyze_three_texts_with_qwen(ocr_results)
+
+    providers = [
+        (name, LLM_PROVIDERS[name])
+        for name in getattr(settings, 'LLM_ROUTER_PROVIDERS', list(LLM_PROVIDERS))
+        if name in LLM_PROVIDERS
+    ]
+    result, winner = llm_router.route(ocr_results, providers)
+    if winner:
+        result['llm_provider'] = winner
+        return result
+
+    erreur = (result or {}).get('error') or "aucune réponse JSON valide"
+    progress.emit('llm_fallback', provider='llm', to='regex', reason=erreur)
+    return analyse_par_regex(ocr_results, erreur)
+
+
+def analyse_par_regex(ocr_results, erreur):
+    """Dernier recours quand aucun fournisseur LLM n'a répondu : extraction par regex"""
+    texte_ocr_combined = "\n".join(ocr_results.get(engine) or "" for engine in ("docling", "tesseract", "doctr"))
+    try:
+        regex_result = extraire_elements_avec_regex(texte_ocr_combined)
+        return {
+            "Date": regex_result.get("dates_valides", [""])[0] if regex_result.get("dates_valides") else "",
+            "Magasin": "",
+            "NumeroTicket": "",
+            "Total": regex_result.get("total", ""),
+            "Articles": regex_result.get("articles", []),
+            "Commentaire": f"Analyse par regex (fallback) - Erreur API: {erreur}",
+            "texte_fusionne": texte_ocr_combined,
+            "ValidationRegex": {
+                "total_coherent": regex_result.get("total_coherent", False),
+                "somme_articles": regex_result.get("somme_articles", ""),
+                "total_detecte": regex_result.get("total", "")
+            }
+        }
+    except Exception as regex_error:
+        return {
+            "Date": "",
+            "Magasin": "",
+            "NumeroTicket": "",
+            "Total": "",
+            "Articles": [],
+            "Commentaire": f"Erreur complète - API: {erreur}, Regex: {str(regex_error)}",
+            "texte_fusionne": "Erreur de traitement"
+        }
+
+def analyze_three_texts_with_gemini(ocr_results):
+    """
+    Analyse les 3 textes OCR avec Google Generative AI (Gemini)
+    """
+    try:
+        # Configuration de l'API Google Generative AI
+        api_key = os.getenv('GOOGLE_API_KEY')
+        if not api_key or api_key == 'your_google_api_key_here':
+            # Mode dÃ©mo - retourner des donnÃ©es d'exemple
+            logger.warning("ClÃ© API Google Generative AI manquante - Mode dÃ©mo activÃ©")
+            return {
+                "error": "ClÃ© API Google Generative AI manquante. Voici un exemple de rÃ©sultat.",
+                "demo_mode": True,
+                "Magasin": "DEMO - Magasin Exemple",
+                "Date": "2024-01-15",
+                "Heure": "14:30",
+                "Numero_ticket": "DEMO-001",
+                "Articles": [
+                    {
+                        "nom": "Article dÃ©mo 1",
+                        "quantite": 2,
+                        "prix_unitaire": 5.500,
+                        "prix_total": 11.000
+                    },
+                    {
+                        "nom": "TIMBRE FISCAL",
+                        "quantite": 1,
+                        "prix_unitaire": 0.100,
+                        "prix_total": 0.100
+                    }
+                ],
+                "Sous_total": 11.000,
+                "Remise": 0.000,
+                "Timbre_fiscal": 0.100,
+                "Total": 11.100,
+                "Methode_paiement": "espÃ¨ces",
+                "TVA_details": {
+                    "taux_19": 2.090,
+                    "taux_13": 0.000,
+                    "taux_7": 0.000
+                },
+                "model_used": "Google Gemini 1.5 Flash (Mode DÃ©mo)",
+                "analysis_timestamp": datetime.now().isoformat(),
+                "raw_response": "Mode dÃ©mo - Aucune API appelÃ©e",
+                "instructions": {
+                    "title": "Comment obtenir une clÃ© API Google Generative AI :",
+                    "steps": [
+                        "1. Allez sur https://makersuite.google.com/app/apikey",
+                        "2. Connectez-vous avec votre compte Google",
+                        "3. Cliquez sur 'Create API Key'",
+                        "4. Copiez la clÃ© gÃ©nÃ©rÃ©e",
+                        "5. Remplacez 'your_google_api_key_here' dans le fichier .env",
+                        "6. RedÃ©marrez le serveur Django"
+                    ]
+                }
+            }
+        
+        cached = llm_cache.get_cached_result(ocr_results, 'gemini', "gemini-1.5-flash", PROMPT_VERSION)
+        if cached:
+            return cached
+
+        model = get_genai().GenerativeModel('gemini-1.5-flash')
+        
+        # Fusionner les 3 textes OCR
+        texte_fusionne = f"""
+        === TEXTE DOCTR ===
+        {ocr_results.get('doctr', '')}
+        
+        === TEXTE TESSERACT ===
+        {ocr_results.get('tesseract', '')}
+        
+        === TEXTE DOCLING ===
+        {ocr_results.get('docling', '')}
+        """
+        
+        # Prompt simplifiÃ© pour correspondre au format Qwen
+        prompt = f"""
+        Tu es un expert en extraction de donnÃ©es de tickets de caisse. Analyse ces 3 textes OCR d'un mÃªme ticket et extrais les informations suivantes au format JSON strict :
+        
+        {{
+            "Magasin": "nom du magasin",
+            "Date": "YYYY-MM-DD",
+            "NumeroTicket": "numÃ©ro du ticket" ou null,
+            "Articles": [
+                {{
+                    "nom": "nom de l'article",
+                    "prix": "prix de l'article avec unitÃ© (ex: 5.500 DT)"
+                }}
+            ],
+            "Total": "montant total avec unitÃ© (ex: 39.500 DT)"
+        }}
+        
+        RÃˆGLES IMPORTANTES :
+        - Utilise les 3 textes pour obtenir la meilleure prÃ©cision
+        - Corrige les erreurs OCR courantes : Oâ†’0, Iâ†’1, etc.
+        - Si une information n'est pas trouvÃ©e, utilise null
+        - RÃ©ponds UNIQUEMENT avec le JSON, sans texte supplÃ©mentaire
+        
+        TEXTES OCR Ã€ ANALYSER :
+        {texte_fusionne}
+        """
+        
+        logger.info("Envoi de la requÃªte Ã  Google Generative AI...")
+        
+        # GÃ©nÃ©rer la rÃ©ponse
+        progress.emit('llm_attempt', provider='gemini', model='gemini-1.5-flash')
+        with breakers['gemini'].guard(), metrics.span('llm', provider='gemini', model='gemini-1.5-flash'):
+            response = model.generate_content(prompt)
+            raw_response = response.text
+        
+        logger.info(f"RÃ©ponse brute reÃ§ue de Gemini: {raw_response[:200]}...")
+        
+        # Nettoyer et parser la rÃ©ponse JSON
+        with metrics.span('json_parse', provider='gemini', model='gemini-1.5-flash') as parse_span:
+            result_data, parse_outcome = parse_ticket_json(raw_response)
+            parse_span.tag(outcome=parse_outcome)
+        progress.emit('json_parsed', provider='gemini', ok=isinstance(result_data, dict))
+        
+        if result_data and isinstance(result_data, dict):
+            logger.info("Analyse Gemini rÃ©ussie")
+            
+            # Ajouter des mÃ©tadonnÃ©es
+            result_data['texte_fusionne'] = texte_fusionne
+            result_data['raw_response'] = raw_response
+            result_data['model_used'] = 'Google Gemini 1.5 Flash'
+            result_data['analysis_timestamp'] = datetime.now().isoformat()
+            
+            # Validation et correction avec regex
+            result_data = valider_et_corriger_avec_regex(result_data, texte_fusionne)
+            llm_cache.store_result(ocr_results, 'gemini', "gemini-1.5-flash", PROMPT_VERSION, result_data)
+            
+            return result_data
+        else:
+            logger.error("Erreur de parsing JSON Gemini: RÃ©ponse invalide")
+            return {
+                "error": "RÃ©ponse JSON invalide de Gemini",
+                "raw_response": raw_response,
+                "parsed_response": result_data
+            }
+    
+    except Exception as e:
+        logger.error(f"Erreur lors de l'analyse avec Gemini: {str(e)}")
+        return {
+            "error": f"Erreur lors de l'analyse Gemini: {str(e)}",
+            "raw_response": None
+        }
+
+#############################
+# FONCTION DÉSACTIVÉE PAR L'UTILISATEUR
+# Ancienne implémentation de extraire_elements_avec_regex mise en commentaire pour alléger le code.
+# Elle servait à analyser le texte OCR par expressions régulières afin de valider/corriger les
+# résultats retournés par le LLM (dates, montants, articles, cohérence total).
+# Si besoin de la réactiver, restaurer le corps précédent ou récupérer l'historique git.
+# Ancienne implémentation retirée (mise en commentaire) pour réduire le code.
+# Historique: cette fonction extrayait dates, montants, articles et vérifiait la cohérence.
+# Pour la restaurer, récupérer l'ancienne version via l'historique git.
+
+# Stub actif minimal pour éviter les erreurs d'appel ailleurs dans le code.
+def extraire_elements_avec_regex(texte):
+    return {}
+
+def post_process_timbre_fiscal(result_data):
+    """
+    Post-traitement pour s'assurer que le timbre fiscal est bien dÃ©tectÃ© et inclus dans les articles
+    """
+    if not result_data or not isinstance(result_data, dict):
+        return result_data
+    
+    articles = result_data.get("Articles", [])
+    
+    # Chercher le timbre fiscal dans les articles
+    for article in articles:
+        if isinstance(article, dict):
+            nom = article.get("nom", "").lower()
+            prix = article.get("prix", "")
+            
+            # DÃ©tecter le timbre fiscal par le montant (0.100 DT, 0.200 DT, etc.)
+            if prix in ["0.100 DT", "0.200 DT", "0.300 DT", "0.400 DT", "0.500 DT"]:
+                # S'assurer que le nom est "TIMBRE FISCAL"
+                if "timbre" not in nom and "fiscal" not in nom:
+                    article["nom"] = "TIMBRE FISCAL"
+                    print(f"Nom de l'article timbre fiscal corrigÃ©: {article['nom']}")
+                break
+            
+            # DÃ©tecter par le nom aussi
+            if any(keyword in nom for keyword in ["timbre", "fiscal", "taxe", "stamp"]):
+                # S'assurer que le nom est "TIMBRE FISCAL"
+                article["nom"] = "TIMBRE FISCAL"
+                print(f"Nom de l'article timbre fiscal corrigÃ©: {article['nom']}")
+                break
+            
+            # Conversion des montants : 100 DT â†’ 0.100 DT pour les timbres fiscaux
+            if prix == "100 DT" and any(keyword in nom for keyword in ["timbre", "fiscal", "taxe", "stamp"]):
+                article["prix"] = "0.100 DT"
+                article["nom"] = "TIMBRE FISCAL"
+                print(f"Montant timbre fiscal converti: 100 DT â†’ 0.100 DT")
+                break
+    
+    return result_data
+
+def valider_et_corriger_avec_regex(result_data, texte_ocr):
+    """
+    Valide et corrige les rÃ©sultats LLM avec l'extraction regex
+    """
+    if not result_data or not isinstance(result_data, dict):
+        return result_data
+    
+    # Extraire les Ã©lÃ©ments avec regex
+    regex_result = extraire_elements_avec_regex(texte_ocr)
+    
+    print("=== VALIDATION REGEX ===")
+    print(f"Dates trouvÃ©es: {regex_result.get('dates_valides', [])}")
+    print(f"Timbres fiscaux: {regex_result.get('timbres_fiscaux', [])}")
+    print(f"Total regex: {regex_result.get('total', '')}")
+    print(f"Articles regex: {len(regex_result.get('articles', []))}")
+    print(f"Total cohÃ©rent: {regex_result.get('total_coherent', False)}")
+    print("========================")
+    
+    # Corriger la date si nÃ©cessaire
+    if not result_data.get("Date") and regex_result.get("dates_valides"):
+        result_data["Date"] = regex_result["dates_valides"][0]
+        print(f"Date corrigÃ©e avec regex: {result_data['Date']}")
+    
+    
+    
+    # Corriger le total si nÃ©cessaire
+    if not result_data.get("Total") and regex_result.get("total"):
+        result_data["Total"] = regex_result["total"]
+        print(f"Total corrigÃ© avec regex: {result_data['Total']}")
+    
+    # Corriger les articles si nÃ©cessaire (si le LLM n'a pas bien dÃ©tectÃ©)
+    if not result_data.get("Articles") and regex_result.get("articles"):
+        result_data["Articles"] = regex_result["articles"]
+        print(f"Articles corrigÃ©s avec regex: {len(result_data['Articles'])} articles")
+    
+    # Ajouter des informations de validation
+    if regex_result.get("alerte"):
+        result_data["AlerteValidation"] = regex_result["alerte"]
+        print(f"Alerte ajoutÃ©e: {regex_result['alerte']}")
+    
+    result_data["ValidationRegex"] = {
+        "total_coherent": regex_result.get("total_coherent", False),
+        "somme_articles": regex_result.get("somme_articles", ""),
+        "total_detecte": regex_result.get("total", "")
+    }
+    
+    return result_data
+
+
+def verifier_par_gemini(qwen_data, ocr_texts_combined):
+    """
+    Utilise Gemini 2.5 Flash pour valider les informations extraites par Qwen
+    """
+    prompt = f"""
+Tu es un assistant spÃ©cialisÃ© dans la validation de donnÃ©es extraites de tickets de caisse.
+
+Voici un texte brut issu de plusieurs OCR :
+-------------------------------
+{ocr_texts_combined}
+-------------------------------
+
+Et voici les donnÃ©es extraites par un autre modÃ¨le (Qwen) :
+
+{json.dumps(qwen_data, indent=2, ensure_ascii=False)}
+
+Analyse attentivement le texte OCR et dis-moi si les informations suivantes semblent cohÃ©rentes avec le contenu :
+- Le nom du magasin
+- La date et heure
+- Le numÃ©ro du ticket
+- Les articles (noms et prix)
+- Le montant total
+
+RÃ‰PONDS uniquement avec un JSON structurÃ© comme ceci :
+
+{{
+  "verdict": "valide" ou "invalide",
+  "problemes_detectes": ["description 1", "description 2", ...],
+  "suggestions": ["correction 1", "correction 2", ...]
+}}
+
+IMPORTANT : ne donne que ce JSON.
+    """
+
+    try:
+        with breakers['gemini'].guard():
+            model = get_genai().GenerativeModel("gemini-1.5-flash")  # Ou "gemini-2.5-flash" si dispo
+            response = model.generate_content(prompt)
+        return clean_json_response(response.text)
+    except Exception as e:
+        print("Erreur avec Gemini:", str(e))
+        return {
+            "verdict": "erreur",
+            "problemes_detectes": [f"Erreur Gemini: {str(e)}"],
+            "suggestions": []
+        }
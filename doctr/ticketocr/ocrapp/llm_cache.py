@@ -0,0 +1,161 @@
+"""
+Cache persistant des extractions LLM.
+
+La clé est le SHA-256 des trois textes OCR (espaces normalisés), du
+fournisseur, du modèle et de la version du prompt : un formulaire re-posté
+avec les mêmes champs ocr_doctr/ocr_tesseract/ocr_docling, ou un ticket déjà
+analysé par Qwen puis par Gemini, ne repaie pas l'aller-retour LLM.
+Les entrées expirent après LLM_CACHE_TTL_HOURS et, au-delà de
+LLM_CACHE_MAX_ENTRIES, les moins récemment utilisées sont supprimées.
+"""
+import copy
+import hashlib
+import json
+import logging
+import re
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from . import metrics
+from .models import LLMResultCache
+
+logger = logging.getLogger(__name__)
+
+OCR_ENGINES = ('doctr', 'tesseract', 'docling')
+
+CACHE_TAG = "(réponse en cache)"
+
+_stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+_stats_lock = threading.Lock()
+
+
+def _count(key, n=1):
+    with _stats_lock:
+        _stats[key] += n
+
+
+def cache_enabled():
+    return getattr(settings, 'LLM_CACHE_ENABLED', True)
+
+
+def normalize_text(text):
+    """Espaces, tabulations et sauts de ligne multiples réduits à un espace"""
+    return re.sub(r'\s+', ' ', text or '').strip()
+
+
+def cache_key(ocr_results, provider, model, prompt_version):
+    payload = json.dumps({
+        'texts': {engine: normalize_text(ocr_results.get(engine)) for engine in OCR_ENGINES},
+        'provider': provider,
+        'model': model,
+        'prompt_version': str(prompt_version),
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def is_cacheable(result):
+    """Seules les extractions réussies sont mises en cache (ni erreur, ni mode démo)"""
+    return isinstance(result, dict) and not result.get('error') and not result.get('demo_mode')
+
+
+def tag_cached(result):
+    result = copy.deepcopy(result)
+    commentaire = result.get('Commentaire') or ""
+    result['Commentaire'] = f"{commentaire} {CACHE_TAG}".strip()
+    result['cache_hit'] = True
+    return result
+
+
+def get_cached_result(ocr_results, provider, model, prompt_version):
+    """Extraction en cache (copie marquée dans Commentaire), ou None"""
+    if not cache_enabled():
+        return None
+    key = cache_key(ocr_results, provider, model, prompt_version)
+    row = None
+    with metrics.span('llm_cache', provider=provider, model=model) as cache_span:
+        try:
+            row = LLMResultCache.objects.filter(key=key).first()
+            ttl_hours = getattr(settings, 'LLM_CACHE_TTL_HOURS', 0)
+            if row is not None and ttl_hours and row.created_at < timezone.now() - timedelta(hours=ttl_hours):
+                row.delete()
+                _count('evictions')
+                row = None
+            if row is not None:
+                LLMResultCache.objects.filter(pk=row.pk).update(
+                    hit_count=F('hit_count') + 1,
+                    last_hit_at=timezone.now()
+                )
+        except Exception as e:
+            logger.error("Lecture du cache LLM impossible: %s", e)
+            row = None
+        cache_span.tag(outcome='hit' if row is not None else 'miss')
+
+    if row is None:
+        _count('misses')
+        return None
+    _count('hits')
+    logger.info("Cache LLM: extraction %s/%s servie depuis le cache", provider, model)
+    return tag_cached(row.result)
+
+
+def store_result(ocr_results, provider, model, prompt_version, result):
+    if not cache_enabled() or not is_cacheable(result):
+        return
+    try:
+        LLMResultCache.objects.update_or_create(
+            key=cache_key(ocr_results, provider, model, prompt_version),
+            defaults={
+                'provider': provider,
+                'model': model,
+                'prompt_version': str(prompt_version),
+                'result': json.loads(json.dumps(result, default=str)),
+                'created_at': timezone.now(),
+                'last_hit_at': timezone.now(),
+            }
+        )
+    except Exception as e:
+        logger.error("Écriture du cache LLM impossible (%s/%s): %s", provider, model, e)
+        return
+    _count('stores')
+    evict()
+
+
+def evict():
+    """
+    Supprime les entrées plus anciennes que LLM_CACHE_TTL_HOURS puis, au-delà
+    de LLM_CACHE_MAX_ENTRIES, les moins récemment utilisées
+    """
+    removed = 0
+    try:
+        ttl_hours = getattr(settings, 'LLM_CACHE_TTL_HOURS', 0)
+        if ttl_hours:
+            cutoff = timezone.now() - timedelta(hours=ttl_hours)
+            removed += LLMResultCache.objects.filter(created_at__lt=cutoff).delete()[0]
+
+        max_entries = getattr(settings, 'LLM_CACHE_MAX_ENTRIES', 0)
+        if max_entries:
+            overflow = LLMResultCache.objects.count() - max_entries
+            if overflow > 0:
+                oldest = LLMResultCache.objects.order_by('last_hit_at').values_list('pk', flat=True)[:overflow]
+                removed += LLMResultCache.objects.filter(pk__in=list(oldest)).delete()[0]
+    except Exception as e:
+        logger.error("Éviction du cache LLM impossible: %s", e)
+    if removed:
+        _count('evictions', removed)
+    return removed
+
+
+def cache_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = round(stats['hits'] / lookups, 3) if lookups else None
+    try:
+        stats['entries'] = LLMResultCache.objects.count()
+    except Exception:
+        stats['entries'] = None
+    return stats
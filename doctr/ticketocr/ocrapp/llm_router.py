@@ -0,0 +1,148 @@
+"""
+Routage des analyses LLM entre fournisseurs : requêtes couvertes (hedging).
+
+Au lieu de la cascade HuggingFace (30 s) → mistral (30 s) → llama2 (15 s),
+jusqu'à 75 s d'attente en série, le routeur lance le premier fournisseur puis
+le suivant dès que le précédent échoue ou, au plus tard, après
+LLM_HEDGE_DELAY secondes sans réponse. Mode 'race' : tous les fournisseurs
+partent en même temps. La première réponse qui donne un JSON de ticket
+valide l'emporte ; les requêtes perdantes sont annulées (celles qui n'ont
+pas démarré) ou interrompues (les flux en cours voient l'événement
+d'annulation et ferment leur connexion), et le gagnant est enregistré (événement
+llm_winner, métriques). Les threads reçoivent une copie du contexte
+(collecteur de spans, rapporteur du job).
+"""
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from . import metrics, progress
+from .circuit_breaker import CallAbandoned
+
+logger = logging.getLogger(__name__)
+
+TICKET_FIELDS = ('Magasin', 'NumeroTicket', 'Date', 'Total', 'Articles')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+_wins = {}
+_wins_lock = threading.Lock()
+
+# Événement d'annulation de la course, lu par les flux LLM (llm_stream.collect)
+_cancel_event = contextvars.ContextVar('llm_route_cancelled', default=None)
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'LLM_ROUTER_WORKERS', 6),
+                thread_name_prefix='llm-router',
+            )
+        return _executor
+
+
+def is_valid_ticket(result):
+    """Réponse exploitable : pas d'erreur et au moins un champ du ticket renseigné"""
+    if not isinstance(result, dict) or result.get('error'):
+        return False
+    return any(result.get(field) for field in TICKET_FIELDS)
+
+
+def current_cancel_event():
+    """Événement levé quand la course du fournisseur courant est jouée (None hors routeur)"""
+    return _cancel_event.get()
+
+
+def _run(name, analyze, ocr_results, cancelled):
+    if cancelled.is_set():
+        return None
+    token = _cancel_event.set(cancelled)
+    try:
+        return analyze(ocr_results)
+    except CallAbandoned:
+        logger.info("Fournisseur LLM %s interrompu : la course est jouée", name)
+        return None
+    except Exception as e:
+        logger.warning("Fournisseur LLM %s en échec: %s", name, e)
+        return {'error': str(e)}
+    finally:
+        _cancel_event.reset(token)
+        close_old_connections()
+
+
+def route(ocr_results, providers, mode=None, hedge_delay=None, timeout=None):
+    """
+    Exécute les fournisseurs [(nom, fonction)] selon le mode ('hedge' ou
+    'race') ; retourne (résultat, nom du gagnant). Sans réponse valide,
+    retourne la dernière réponse reçue et None.
+    """
+    mode = mode or getattr(settings, 'LLM_ROUTER_MODE', 'hedge')
+    hedge_delay = getattr(settings, 'LLM_HEDGE_DELAY', 4.0) if hedge_delay is None else hedge_delay
+    timeout = timeout or getattr(settings, 'LLM_ROUTER_TIMEOUT', 45)
+    if mode == 'race':
+        hedge_delay = 0
+
+    executor = get_executor()
+    cancelled = threading.Event()
+    pending = list(providers)
+    running = {}
+    launched = []
+    last_result = None
+    deadline = time.monotonic() + timeout
+
+    def launch():
+        name, analyze = pending.pop(0)
+        context = contextvars.copy_context()
+        future = executor.submit(context.run, _run, name, analyze, ocr_results, cancelled)
+        running[future] = (name, time.monotonic())
+        if launched:
+            progress.emit('llm_hedge', provider=name, after=launched[-1], in_flight=len(running))
+        launched.append(name)
+
+    with metrics.span('llm_route') as route_span:
+        launch()
+        while mode == 'race' and pending:
+            launch()
+        try:
+            while running:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                wait_for = min(remaining, hedge_delay) if pending else remaining
+                done, _ = wait(list(running), timeout=wait_for, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, started = running.pop(future)
+                    result = future.result()
+                    if is_valid_ticket(result):
+                        elapsed = time.monotonic() - started
+                        with _wins_lock:
+                            _wins[name] = _wins.get(name, 0) + 1
+                        route_span.tag(provider=name, outcome='ok')
+                        progress.emit('llm_winner', provider=name, duration=round(elapsed, 2),
+                                      cancelled=[running_name for running_name, _ in running.values()])
+                        logger.info("Analyse LLM: %s retenu en %.2fs", name, elapsed)
+                        return result, name
+                    last_result = result
+                    logger.info("Analyse LLM: réponse de %s inexploitable", name)
+                # Échec d'un fournisseur ou délai de couverture écoulé : le suivant part
+                if pending:
+                    launch()
+            route_span.tag(outcome='timeout' if running else 'invalid')
+            return last_result, None
+        finally:
+            cancelled.set()
+            for future in running:
+                future.cancel()
+
+
+def router_stats():
+    with _wins_lock:
+        return {'wins': dict(_wins)}
@@ -0,0 +1,254 @@
+"""
+Réponses LLM en flux (Ollama `stream: true`, OpenAI `stream=True`).
+
+Les jetons sont passés au fur et à mesure à TicketStreamParser, qui suit les
+accolades (hors chaînes et hors blocs <think>) : dès qu'un objet JSON de
+premier niveau contenant des champs du ticket est complet, le flux est fermé
+et le serveur cesse de générer (explications finales, seconde version...).
+Le raisonnement est désactivé quand le modèle le permet (`/no_think` pour
+Qwen3, LLM_SUPPRESS_REASONING). Chaque appel enregistre le délai avant le
+premier jeton (span 'llm_ttft'), les jetons reçus, ceux qui précèdent le
+JSON (raisonnement, préambule) et l'arrêt anticipé : stream_stats(). Un flux
+lancé par le routeur est interrompu (et fermé) dès que la course est jouée.
+En flux, le délai HTTP ne borne que l'attente entre deux jetons : collect()
+impose aussi un délai total, et son dépassement lève une exception de type
+requests Timeout, comme un appel non streamé (repli mistral → llama2 compris).
+"""
+import json
+import logging
+import threading
+import time
+
+import requests
+from django.conf import settings
+
+from . import metrics
+from .circuit_breaker import CallAbandoned
+from .llm_router import TICKET_FIELDS, current_cancel_event
+
+logger = logging.getLogger(__name__)
+
+THINK_OPEN = '<think>'
+THINK_CLOSE = '</think>'
+
+_stats = {'calls': 0, 'early_stops': 0, 'cancelled': 0, 'timeouts': 0, 'tokens': 0, 'preamble_tokens': 0}
+_ttfts = []
+_stats_lock = threading.Lock()
+
+TTFT_SAMPLES = 512
+
+
+class StreamCancelled(CallAbandoned):
+    """Flux interrompu : un autre fournisseur a déjà répondu"""
+
+
+class StreamTimeout(requests.exceptions.Timeout):
+    """Délai total de la réponse dépassé alors que les jetons arrivaient encore"""
+
+
+def streaming_enabled():
+    return getattr(settings, 'LLM_STREAMING', True)
+
+
+def suppress_reasoning(prompt, model):
+    """Ajoute `/no_think` au prompt des modèles Qwen3 (mode sans raisonnement)"""
+    if getattr(settings, 'LLM_SUPPRESS_REASONING', True) and 'qwen3' in model.lower():
+        return f"{prompt}\n/no_think"
+    return prompt
+
+
+def looks_like_ticket(candidate):
+    """Objet JSON complet portant au moins un champ du ticket (même s'il reste à réparer)"""
+    try:
+        data = json.loads(candidate)
+        if isinstance(data, dict):
+            return any(field in data for field in TICKET_FIELDS)
+    except ValueError:
+        pass
+    return any(f'"{field}"' in candidate or f"'{field}'" in candidate for field in TICKET_FIELDS)
+
+
+class TicketStreamParser:
+    """
+    Analyse incrémentale d'une réponse : chaque caractère n'est lu qu'une
+    fois, quel que soit le découpage en jetons (balises et échappements à
+    cheval sur deux jetons compris)
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self.pos = 0
+        self.depth = 0
+        self.start = None
+        self.in_string = False
+        self.escape = False
+        self.in_think = False
+        self.result = None
+
+    @property
+    def started(self):
+        """Un objet JSON est en cours ou trouvé (le préambule est passé)"""
+        return self.start is not None or self.result is not None
+
+    def feed(self, chunk):
+        """Ajoute un jeton ; True quand l'objet du ticket est complet (self.result)"""
+        if self.result is not None:
+            return True
+        self.buffer += chunk
+        buffer = self.buffer
+        i = self.pos
+        n = len(buffer)
+        while i < n:
+            if self.in_think:
+                end = buffer.find(THINK_CLOSE, i)
+                if end < 0:
+                    # Garder un éventuel début de balise fermante pour le jeton suivant
+                    i = max(i, n - len(THINK_CLOSE) + 1)
+                    break
+                i = end + len(THINK_CLOSE)
+                self.in_think = False
+                continue
+            char = buffer[i]
+            if self.start is None:
+                if char == '<':
+                    if buffer.startswith(THINK_OPEN, i):
+                        self.in_think = True
+                        i += len(THINK_OPEN)
+                        continue
+                    if THINK_OPEN.startswith(buffer[i:]):
+                        break
+                elif char == '{':
+                    self.start = i
+                    self.depth = 1
+                i += 1
+                continue
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == '\\':
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char == '{':
+                self.depth += 1
+            elif char == '}':
+                self.depth -= 1
+                if self.depth == 0:
+                    candidate = buffer[self.start:i + 1]
+                    self.start = None
+                    if looks_like_ticket(candidate):
+                        self.result = candidate
+                        self.pos = i + 1
+                        return True
+            i += 1
+        self.pos = i
+        return False
+
+    def text(self):
+        """L'objet du ticket s'il est complet, sinon toute la réponse (à réparer)"""
+        return self.result if self.result is not None else self.buffer
+
+
+def collect(tokens, close, provider, model, cancelled=None, timeout=None, started=None):
+    """
+    Lit les jetons (itérable de textes) jusqu'à la fin du flux ou jusqu'à
+    l'objet du ticket complet, puis appelle close(). Retourne le texte.
+    `cancelled` (par défaut l'événement du routeur) interrompt la lecture :
+    le flux est fermé et StreamCancelled levée. Au-delà de `timeout` secondes
+    depuis `started` (time.perf_counter() de l'envoi de la requête, par
+    défaut le début de la lecture), le flux est fermé et StreamTimeout levée
+    """
+    if cancelled is None:
+        cancelled = current_cancel_event()
+    parser = TicketStreamParser()
+    start = time.perf_counter()
+    ttft = None
+    count = 0
+    preamble = 0
+    if started is None:
+        started = start
+    early_stop = False
+    stopped = False
+    timed_out = False
+    try:
+        for token in tokens:
+            if cancelled is not None and cancelled.is_set():
+                stopped = True
+                break
+            if timeout is not None and time.perf_counter() - started > timeout:
+                timed_out = True
+                break
+            if not token:
+                continue
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            count += 1
+            done = parser.feed(token)
+            if not parser.started:
+                preamble += 1
+            if done:
+                early_stop = True
+                break
+    finally:
+        close()
+
+    if ttft is not None:
+        metrics.record('llm_ttft', ttft, provider=provider, model=model)
+    with _stats_lock:
+        _stats['calls'] += 1
+        _stats['early_stops'] += int(early_stop)
+        _stats['cancelled'] += int(stopped)
+        _stats['timeouts'] += int(timed_out)
+        _stats['tokens'] += count
+        _stats['preamble_tokens'] += preamble
+        if ttft is not None:
+            _ttfts.append(ttft)
+            del _ttfts[:-TTFT_SAMPLES]
+    logger.info("Flux %s/%s: premier jeton en %s ms, %d jetons (%d avant le JSON)%s",
+                provider, model, round(ttft * 1000, 1) if ttft is not None else '-', count, preamble,
+                ", arrêt dès l'objet complet" if early_stop else ", interrompu (course jouée)" if stopped
+                else f", délai total de {timeout}s dépassé" if timed_out else "")
+    if timed_out:
+        raise StreamTimeout(f"{provider}/{model}: délai total de {timeout}s dépassé")
+    if stopped:
+        raise StreamCancelled(f"{provider}/{model}: flux interrompu, réponse déjà retenue")
+    return parser.text()
+
+
+def ollama_tokens(response):
+    """Jetons d'une réponse /api/generate en flux (une ligne JSON par jeton)"""
+    for line in response.iter_lines():
+        if not line:
+            continue
+        chunk = json.loads(line)
+        if chunk.get('error'):
+            raise Exception(f"Erreur Ollama: {chunk['error']}")
+        # Modèles à raisonnement : la pensée arrive à part ('thinking'), lue comme un bloc <think>
+        thinking = chunk.get('thinking')
+        yield f"{THINK_OPEN}{thinking}{THINK_CLOSE}" if thinking else chunk.get('response', '')
+        if chunk.get('done'):
+            return
+
+
+def openai_tokens(stream):
+    """Jetons d'une complétion OpenAI en flux"""
+    for chunk in stream:
+        if chunk.choices:
+            yield chunk.choices[0].delta.content or ''
+
+
+def close_openai_stream(stream):
+    response = getattr(stream, 'response', None)
+    if response is not None:
+        response.close()
+
+
+def stream_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+        ttfts = sorted(_ttfts)
+    stats['ttft_p50_ms'] = round(ttfts[len(ttfts) // 2] * 1000, 1) if ttfts else None
+    stats['ttft_p95_ms'] = round(ttfts[min(len(ttfts) - 1, int(0.95 * len(ttfts)))] * 1000, 1) if ttfts else None
+    return stats
@@ -0,0 +1,63 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ocrapp.ingest import ANALYSES, Ingestion
+
+
+class Command(BaseCommand):
+    help = "Ingère en masse les tickets d'un dossier ou d'une archive zip (OCR + extraction + écritures comptables)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help="Dossier de tickets (parcouru récursivement) ou archive .zip")
+        parser.add_argument('--analysis', choices=list(ANALYSES), default='llm', help="Extraction après l'OCR (llm par défaut)")
+        parser.add_argument('--workers', type=int, default=getattr(settings, 'OCR_INGEST_WORKERS', 2), help="Nombre de processus OCR")
+        parser.add_argument('--chunk-size', type=int, default=getattr(settings, 'OCR_DOCTR_BATCH_SIZE', 8), help="Fichiers par lot OCR envoyé à un processus")
+        parser.add_argument('--batch-size', type=int, default=20, help="Tickets écrits par transaction")
+        parser.add_argument('--checkpoint', default=None, help="Fichier de reprise (par défaut <source>.ingest.json)")
+        parser.add_argument('--no-cache', action='store_true', help="Ne pas utiliser le cache OCR")
+        parser.add_argument('--json', action='store_true', help="Afficher le bilan en JSON")
+
+    def handle(self, *args, **options):
+        source = os.path.abspath(options['source'])
+        if not os.path.exists(source):
+            raise CommandError(f"Source introuvable: {source}")
+        checkpoint = options['checkpoint'] or f"{source.rstrip(os.sep)}.ingest.json"
+
+        ingestion = Ingestion(
+            source,
+            analysis=options['analysis'],
+            workers=options['workers'],
+            chunk_size=options['chunk_size'],
+            batch_size=options['batch_size'],
+            checkpoint_path=checkpoint,
+            use_cache=not options['no_cache'],
+            log=self.stdout.write,
+        )
+        try:
+            summary = ingestion.run()
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING(f"Interrompu : relancer la commande pour reprendre ({checkpoint})"))
+            return
+
+        if options['json']:
+            self.stdout.write(json.dumps(summary, indent=2))
+            return
+
+        counts = summary['counts']
+        self.stdout.write(self.style.SUCCESS(
+            f"{counts.get('ingested', 0)} tickets ingérés en {summary['elapsed_s']:.1f}s "
+            f"({summary['tickets_per_s']:.2f} tickets/s)"
+        ))
+        self.stdout.write(
+            f"Trouvés: {counts.get('found', 0)}  déjà ingérés: {counts.get('skipped', 0)}  "
+            f"avec écriture comptable: {counts.get('accounted', 0)}  OCR seul: {counts.get('ocr_only', 0)}  "
+            f"échecs: {counts.get('failed', 0)}"
+        )
+        self.stdout.write("Durées par étape :")
+        for stage, timing in summary['stages'].items():
+            self.stdout.write(f"  {stage:<11} total={timing['total_s']:8.2f}s  moyenne={timing['mean_ms']:8.1f} ms  ({timing['count']})")
+        if counts.get('failed'):
+            self.stdout.write(self.style.WARNING("Des tickets ont échoué : ils seront retentés au prochain lancement."))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from ocrapp.jobs import worker_pool
+
+
+class Command(BaseCommand):
+    help = "Traite la file des jobs OCR/LLM dans un processus dédié (sans broker externe)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help="Nombre de threads de traitement (OCR_JOB_WORKERS par défaut)")
+        parser.add_argument('--once', action='store_true', help="Traiter les jobs en attente puis s'arrêter")
+
+    def handle(self, *args, **options):
+        if options['once']:
+            worker_pool.work('process_ocr_jobs', once=True, recover=True)
+            self.stdout.write(self.style.SUCCESS('File des jobs vidée.'))
+            return
+
+        worker_pool.start(options['workers'])
+        self.stdout.write(self.style.SUCCESS(f"Workers démarrés ({worker_pool.stats()['workers']}), Ctrl+C pour arrêter."))
+        try:
+            worker_pool.join()
+        except KeyboardInterrupt:
+            worker_pool.stop()
+            self.stdout.write(self.style.WARNING('Arrêt des workers.'))
@@ -0,0 +1,57 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ocrapp.watch import TicketWatcher
+
+
+class Command(BaseCommand):
+    help = "Surveille un dossier (inotify) et traite les tickets déposés : OCR, analyse LLM et écriture comptable"
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help="Dossier de dépôt des scanners (surveillé récursivement)")
+        parser.add_argument('--analysis', choices=['ocr', 'ocr_llm', 'ocr_gemini'], default='ocr_llm', help="Traitement appliqué (ocr_llm par défaut)")
+        parser.add_argument('--workers', type=int, default=None, help="Tickets traités simultanément (OCR_WATCH_WORKERS)")
+        parser.add_argument('--queue-size', type=int, default=None, help="Taille de la file de traitement (OCR_WATCH_QUEUE_SIZE)")
+        parser.add_argument('--debounce', type=float, default=None, help="Secondes sans écriture avant prise en charge (OCR_WATCH_DEBOUNCE_SECONDS)")
+        parser.add_argument('--archive-dir', default=None, help="Déplacer les tickets traités dans ce dossier")
+        parser.add_argument('--polling', action='store_true', help="Sondage du dossier au lieu d'inotify (partages réseau)")
+        parser.add_argument('--stats-interval', type=int, default=300, help="Secondes entre deux bilans (0 pour désactiver)")
+
+    def handle(self, *args, **options):
+        directory = os.path.abspath(options['directory'])
+        if not os.path.isdir(directory):
+            raise CommandError(f"Dossier introuvable: {directory}")
+        archive_dir = os.path.abspath(options['archive_dir']) if options['archive_dir'] else None
+
+        watcher = TicketWatcher(
+            directory,
+            workers=options['workers'],
+            queue_size=options['queue_size'],
+            debounce=options['debounce'],
+            analysis=options['analysis'],
+            archive_dir=archive_dir,
+            polling=options['polling'],
+            log=self.stdout.write,
+        )
+        try:
+            watcher.start()
+        except ImportError:
+            raise CommandError("watchdog n'est pas installé (pip install watchdog)")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Surveillance de {directory} ({'sondage' if options['polling'] else 'inotify'}, "
+            f"{watcher.workers} traitements simultanés), Ctrl+C pour arrêter."
+        ))
+        last_stats = time.monotonic()
+        try:
+            while True:
+                time.sleep(1)
+                if options['stats_interval'] and time.monotonic() - last_stats >= options['stats_interval']:
+                    self.stdout.write(f"Bilan: {watcher.stats()}")
+                    last_stats = time.monotonic()
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING("Arrêt de la surveillance..."))
+            watcher.stop(timeout=5)
+            self.stdout.write(f"Bilan: {watcher.stats()}")
@@ -0,0 +1,285 @@
+"""
+Mesure des étapes du pipeline : spans chronométrés et métriques Prometheus.
+
+Chaque étape (prétraitement, moteurs OCR, appels LLM, parsing JSON,
+écritures en base) est mesurée par un span étiqueté (engine, provider,
+model, outcome). Les durées alimentent des histogrammes agrégés par
+processus, exposés au format texte Prometheus sur /metrics, et la liste des
+spans d'un ticket est conservée sur son extraction (ocr_details['timings']).
+
+Les spans d'un ticket sont collectés via un contextvar (voir collecting()) ;
+les threads du pool OCR ne l'héritent pas : OCRRun capture le collecteur à
+sa création, comme le reporter d'avancement.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Secondes : des lectures en cache (ms) aux appels LLM lents (dizaines de s)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+LABELS = ('stage', 'engine', 'provider', 'model', 'outcome')
+
+_collector = contextvars.ContextVar('ocr_timings', default=None)
+
+
+class StageMetrics:
+    """
+    Histogrammes de durée et compteurs par combinaison d'étiquettes
+    """
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, **labels):
+        key = tuple(str(labels.get(name) or '') for name in LABELS)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series['buckets'][index] += 1
+            series['sum'] += seconds
+            series['count'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                key: {'buckets': list(series['buckets']), 'sum': series['sum'], 'count': series['count']}
+                for key, series in self._series.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self):
+        """Histogramme ticketocr_stage_duration_seconds au format texte Prometheus"""
+        lines = [
+            "# HELP ticketocr_stage_duration_seconds Durée des étapes du pipeline OCR/LLM",
+            "# TYPE ticketocr_stage_duration_seconds histogram",
+        ]
+        for key, series in sorted(self.snapshot().items()):
+            labels = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(LABELS, key) if value)
+            for bound, count in zip(self.buckets, series['buckets']):
+                lines.append(f'ticketocr_stage_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'ticketocr_stage_duration_seconds_bucket{{{labels},le="+Inf"}} {series["count"]}')
+            lines.append(f'ticketocr_stage_duration_seconds_sum{{{labels}}} {series["sum"]:.6f}')
+            lines.append(f'ticketocr_stage_duration_seconds_count{{{labels}}} {series["count"]}')
+        return "\n".join(lines)
+
+
+def _render_histogram(name, help_text, counts, total):
+    """
+    Histogramme Prometheus à partir de comptes par borne non cumulés
+    ({borne: n, ..., '+Inf': n}, dans l'ordre des bornes)
+    """
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    cumulative = 0
+    for bound, count in counts.items():
+        cumulative += count
+        lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+    lines.append(f"{name}_sum {total:.6f}" if isinstance(total, float) else f"{name}_sum {total}")
+    lines.append(f"{name}_count {cumulative}")
+    return "\n".join(lines)
+
+
+def _render_doctr_histograms(stats):
+    """Taille des lots, attente avant le lot (ms) et profondeur de file du micro-batching doctr"""
+    from .doctr_batcher import BATCH_SIZE_BUCKETS, _empty_histogram
+
+    batch_sizes = _empty_histogram(BATCH_SIZE_BUCKETS)
+    for size, count in stats['batch_sizes'].items():
+        bound = next((bound for bound in BATCH_SIZE_BUCKETS if size <= bound), '+Inf')
+        batch_sizes[bound] += count
+    processed = sum(size * count for size, count in stats['batch_sizes'].items())
+    return "\n".join([
+        _render_histogram(
+            "ticketocr_doctr_batch_size", "Images par lot doctr", batch_sizes, processed,
+        ),
+        _render_histogram(
+            "ticketocr_doctr_wait_ms", "Attente d'une image en file avant son lot doctr (ms)",
+            stats['wait_ms'], stats['wait_ms_sum'],
+        ),
+        _render_histogram(
+            "ticketocr_doctr_queue_depth_observed", "Profondeur de la file doctr à chaque soumission",
+            stats['queue_depth'], stats['queue_depth_sum'],
+        ),
+    ])
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+stage_metrics = StageMetrics()
+
+
+class TimingCollector:
+    """Spans d'un ticket, dans l'ordre de fin"""
+
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, entry):
+        with self._lock:
+            self.spans.append(entry)
+
+    def summary(self):
+        """Liste des spans et total par étape (ms), pour ocr_details['timings']"""
+        with self._lock:
+            spans = list(self.spans)
+        totals = {}
+        for entry in spans:
+            totals[entry['stage']] = round(totals.get(entry['stage'], 0.0) + entry['ms'], 1)
+        return {'spans': spans, 'stages_ms': totals}
+
+
+@contextmanager
+def collecting():
+    """Collecte les spans émis dans ce contexte (un ticket)"""
+    collector = TimingCollector()
+    token = _collector.set(collector)
+    try:
+        yield collector
+    finally:
+        _collector.reset(token)
+
+
+def current_collector():
+    return _collector.get()
+
+
+def record(stage, seconds, collector=None, **labels):
+    """Enregistre une durée : histogramme du processus et spans du ticket en cours"""
+    labels = {name: value for name, value in labels.items() if value}
+    labels.setdefault('outcome', 'ok')
+    stage_metrics.observe(seconds, stage=stage, **labels)
+    collector = collector or current_collector()
+    if collector is not None:
+        collector.add(dict(labels, stage=stage, ms=round(seconds * 1000, 1)))
+
+
+class Span:
+    def __init__(self, stage, labels):
+        self.stage = stage
+        self.labels = labels
+
+    def tag(self, **labels):
+        self.labels.update(labels)
+
+
+@contextmanager
+def span(stage, collector=None, **labels):
+    """
+    Chronomètre un bloc. L'issue vaut 'ok' par défaut, 'timeout' ou 'error'
+    si le bloc lève une exception ; span.tag(outcome=...) la précise.
+    """
+    current = Span(stage, labels)
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.labels['outcome'] = 'timeout' if 'timeout' in type(e).__name__.lower() else 'error'
+        raise
+    finally:
+        record(stage, time.perf_counter() - start, collector, **current.labels)
+
+
+def render_metrics():
+    """Texte Prometheus complet : étapes, file des jobs, micro-batching doctr, pool Tesseract, client HTTP, routeur, flux et disjoncteurs LLM"""
+    sections = [stage_metrics.render()]
+    try:
+        from .jobs import worker_pool
+        stats = worker_pool.stats()
+        sections.append("# TYPE ticketocr_jobs gauge")
+        sections.extend(f'ticketocr_jobs{{status="{status}"}} {count}' for status, count in stats['jobs'].items())
+        sections.append("# TYPE ticketocr_job_workers gauge")
+        sections.append(f"ticketocr_job_workers {stats['workers']}")
+    except Exception:
+        pass
+    try:
+        from .doctr_batcher import batcher
+        stats = batcher.stats()
+        sections.append("# TYPE ticketocr_doctr_batches_total counter")
+        sections.append(f"ticketocr_doctr_batches_total {stats['batches']}")
+        sections.append("# TYPE ticketocr_doctr_queue_depth gauge")
+        sections.append(f"ticketocr_doctr_queue_depth {stats['current_queue_depth']}")
+        sections.append(_render_doctr_histograms(stats))
+    except Exception:
+        pass
+    try:
+        from .tesseract_pool import pool
+        stats = pool.stats()
+        sections.append("# TYPE ticketocr_tesseract_calls_total counter")
+        sections.append(f"ticketocr_tesseract_calls_total {stats['calls']}")
+        sections.append("# TYPE ticketocr_tesseract_instances gauge")
+        sections.append(f"ticketocr_tesseract_instances {stats['instances']}")
+    except Exception:
+        pass
+    try:
+        from .llm_router import router_stats
+        stats = router_stats()
+        sections.append("# TYPE ticketocr_llm_router_wins_total counter")
+        sections.extend(
+            f'ticketocr_llm_router_wins_total{{provider="{_escape(provider)}"}} {count}'
+            for provider, count in stats['wins'].items()
+        )
+    except Exception:
+        pass
+    try:
+        from .llm_stream import stream_stats
+        stats = stream_stats()
+        sections.append("# TYPE ticketocr_llm_stream_calls_total counter")
+        sections.append(f"ticketocr_llm_stream_calls_total {stats['calls']}")
+        sections.append("# TYPE ticketocr_llm_stream_early_stops_total counter")
+        sections.append(f"ticketocr_llm_stream_early_stops_total {stats['early_stops']}")
+        sections.append("# TYPE ticketocr_llm_stream_cancelled_total counter")
+        sections.append(f"ticketocr_llm_stream_cancelled_total {stats['cancelled']}")
+        sections.append("# TYPE ticketocr_llm_stream_timeouts_total counter")
+        sections.append(f"ticketocr_llm_stream_timeouts_total {stats['timeouts']}")
+        sections.append("# TYPE ticketocr_llm_stream_tokens_total counter")
+        sections.append(f'ticketocr_llm_stream_tokens_total{{part="all"}} {stats["tokens"]}')
+        sections.append(f'ticketocr_llm_stream_tokens_total{{part="preamble"}} {stats["preamble_tokens"]}')
+    except Exception:
+        pass
+    try:
+        from .circuit_breaker import OPEN, HALF_OPEN, breakers
+        sections.append("# HELP ticketocr_llm_breaker_state État du disjoncteur (0 fermé, 1 semi-ouvert, 2 ouvert)")
+        sections.append("# TYPE ticketocr_llm_breaker_state gauge")
+        for provider, state in breakers.snapshot().items():
+            value = {HALF_OPEN: 1, OPEN: 2}.get(state['state'], 0)
+            sections.append(f'ticketocr_llm_breaker_state{{provider="{_escape(provider)}"}} {value}')
+    except Exception:
+        pass
+    try:
+        from .http_client import http_stats
+        stats = http_stats()
+        sections.append("# TYPE ticketocr_http_requests_total counter")
+        sections.extend(
+            f'ticketocr_http_requests_total{{endpoint="{_escape(endpoint)}"}} {summary["requests"]}'
+            for endpoint, summary in stats['endpoints'].items()
+        )
+        sections.append("# TYPE ticketocr_http_retries_total counter")
+        sections.extend(
+            f'ticketocr_http_retries_total{{endpoint="{_escape(endpoint)}"}} {summary["retries"]}'
+            for endpoint, summary in stats['endpoints'].items()
+        )
+        sections.append("# TYPE ticketocr_http_connections_opened_total counter")
+        sections.extend(
+            f'ticketocr_http_connections_opened_total{{host="{_escape(host)}"}} {pool["connections_opened"]}'
+            for host, pool in stats['pools'].items()
+        )
+        sections.append("# TYPE ticketocr_http_idle_connections gauge")
+        sections.extend(
+            f'ticketocr_http_idle_connections{{host="{_escape(host)}"}} {pool["idle_connections"]}'
+            for host, pool in stats['pools'].items()
+        )
+    except Exception:
+        pass
+    return "\n".join(sections) + "\n"
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:42
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ocrapp', '0004_tickethistory_tva_amount_tickethistory_tva_rate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OCRResultCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64)),
+                ('engine', models.CharField(max_length=20)),
+                ('engine_version', models.CharField(max_length=100)),
+                ('config_hash', models.CharField(max_length=16)),
+                ('text', models.TextField()),
+                ('hit_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_hit_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['last_hit_at'], name='ocrapp_ocrr_last_hi_cf7824_idx')],
+                'unique_together': {('content_hash', 'engine', 'engine_version', 'config_hash')},
+            },
+        ),
+    ]
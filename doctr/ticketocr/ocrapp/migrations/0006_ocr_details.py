@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ocrapp', '0005_ocrresultcache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='extractionhistory',
+            name='ocr_details',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='ocrresultcache',
+            name='details',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ocrapp', '0006_ocr_details'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='extractionhistory',
+            name='ocr_layout',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
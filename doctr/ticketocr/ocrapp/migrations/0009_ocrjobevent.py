@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:55
+
+import django.core.serializers.json
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ocrapp', '0008_ocrjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OCRJobEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=30)),
+                ('data', models.JSONField(blank=True, default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='ocrapp.ocrjob')),
+            ],
+            options={
+                'ordering': ['pk'],
+            },
+        ),
+    ]
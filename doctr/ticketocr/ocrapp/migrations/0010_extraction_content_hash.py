@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ocrapp', '0009_ocrjobevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='extractionhistory',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:08
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ocrapp', '0010_extraction_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LLMResultCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('provider', models.CharField(max_length=30)),
+                ('model', models.CharField(max_length=100)),
+                ('prompt_version', models.CharField(max_length=20)),
+                ('result', models.JSONField(default=dict)),
+                ('hit_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_hit_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['last_hit_at'], name='ocrapp_llmr_last_hi_7d050c_idx'), models.Index(fields=['created_at'], name='ocrapp_llmr_created_49d7e2_idx')],
+            },
+        ),
+    ]
@@ -1,14 +1,25 @@
 from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
 from django.utils import timezone
 
 class ExtractionHistory(models.Model):
     image = models.ImageField(upload_to='tickets/')
     extracted_text = models.TextField(blank=True, null=True)
+    ocr_details = models.JSONField(default=dict, blank=True)  # Décisions et scores de l'étape OCR
+    ocr_layout = models.BinaryField(null=True, blank=True)  # Mise en page doctr compacte (voir ocr_layout.py)
+    content_hash = models.CharField(max_length=64, blank=True, default='', db_index=True)  # SHA-256 de l'image
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f"Ticket du {self.uploaded_at.strftime('%Y-%m-%d %H:%M:%S')}"
 
+    def get_ocr_layout(self):
+        """Mise en page doctr (OCRLayout) de l'extraction, ou None"""
+        if not self.ocr_layout:
+            return None
+        from .ocr_layout import OCRLayout
+        return OCRLayout.from_bytes(self.ocr_layout)
+
 class TicketHistory(models.Model):
     """Historique des tickets analysés"""
     date_ticket = models.DateField()
@@ -91,3 +102,86 @@ class Budget(models.Model):
                 )
             except cls.DoesNotExist:
                 return None
+
+class OCRResultCache(models.Model):
+    """Cache des textes OCR, adressé par le contenu de l'image et la configuration du moteur"""
+    content_hash = models.CharField(max_length=64)  # SHA-256 des octets de l'image
+    engine = models.CharField(max_length=20)
+    engine_version = models.CharField(max_length=100)
+    config_hash = models.CharField(max_length=16)
+    text = models.TextField()
+    details = models.JSONField(default=dict, blank=True)  # Métadonnées du moteur (confiance, ...)
+    hit_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_hit_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ['content_hash', 'engine', 'engine_version', 'config_hash']
+        indexes = [models.Index(fields=['last_hit_at'])]
+
+    def __str__(self):
+        return f"{self.engine} - {self.content_hash[:12]}"
+
+class LLMResultCache(models.Model):
+    """Cache des extractions LLM, adressé par les textes OCR normalisés, le fournisseur, le modèle et le prompt"""
+    key = models.CharField(max_length=64, unique=True)  # SHA-256 (textes OCR + fournisseur + modèle + version du prompt)
+    provider = models.CharField(max_length=30)
+    model = models.CharField(max_length=100)
+    prompt_version = models.CharField(max_length=20)
+    result = models.JSONField(default=dict)
+    hit_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_hit_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=['last_hit_at']), models.Index(fields=['created_at'])]
+
+    def __str__(self):
+        return f"{self.provider}/{self.model} - {self.key[:12]}"
+
+class OCRJob(models.Model):
+    """Traitement OCR/LLM d'un ticket exécuté en arrière-plan (file d'attente en base)"""
+    STATUS_CHOICES = [
+        ('pending', 'En attente'),
+        ('running', 'En cours'),
+        ('done', 'Terminé'),
+        ('failed', 'Échec'),
+    ]
+
+    extraction = models.ForeignKey(ExtractionHistory, on_delete=models.CASCADE, related_name='jobs')
+    analysis = models.CharField(max_length=20)  # ocr, ocr_llm, ocr_gemini, regex, llm, gemini
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    stage = models.CharField(max_length=50, blank=True, default='')  # Étape en cours (ocr, llm, ...)
+    payload = models.JSONField(default=dict, blank=True)  # Textes OCR fournis pour une ré-analyse
+    result = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
+    error = models.TextField(blank=True, default='')
+    worker = models.CharField(max_length=100, blank=True, default='')
+    attempts = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(null=True, blank=True)  # Battement du worker (étapes, événements)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    def __str__(self):
+        return f"Job {self.pk} - {self.analysis} ({self.status})"
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'failed')
+
+class OCRJobEvent(models.Model):
+    """Événement d'avancement d'un job (moteur OCR terminé, fournisseur LLM essayé, ...)"""
+    job = models.ForeignKey(OCRJob, on_delete=models.CASCADE, related_name='events')
+    kind = models.CharField(max_length=30)
+    data = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['pk']
+
+    def __str__(self):
+        return f"Job {self.job_id} - {self.kind}"
@@ -0,0 +1,188 @@
+"""
+Cache persistant des résultats OCR.
+
+La clé est le SHA-256 des octets de l'image, le nom du moteur, sa version et
+un hash de sa configuration : une image ré-uploadée (aziza4_2VNdPTX.jpg,
+rec1_6yBuEIv.jpg, ...) retrouve directement ses textes sans relancer l'OCR.
+"""
+import hashlib
+import json
+import logging
+import threading
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OCRResultCache
+
+logger = logging.getLogger(__name__)
+
+# Distributions dont la version fait partie de la clé de cache
+ENGINE_PACKAGES = {
+    'tesseract': 'pytesseract',
+    'doctr': 'python-doctr',
+    'docling': 'docling',
+}
+
+# Paramètres des moteurs qui influencent le texte produit
+ENGINE_CONFIGS = {
+    'tesseract': {'lang': 'fra+eng'},
+    'doctr': {'pretrained': True},
+    'docling': {},
+}
+
+_stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+_stats_lock = threading.Lock()
+
+
+def _count(key, n=1):
+    with _stats_lock:
+        _stats[key] += n
+
+
+def cache_enabled():
+    return getattr(settings, 'OCR_CACHE_ENABLED', True)
+
+
+def hash_file(file_path, chunk_size=1024 * 1024):
+    """SHA-256 du contenu du fichier, lu par blocs"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@lru_cache(maxsize=None)
+def engine_version(engine):
+    from importlib import metadata
+
+    package = ENGINE_PACKAGES.get(engine, engine)
+    try:
+        version = metadata.version(package)
+    except metadata.PackageNotFoundError:
+        # doctr est aussi publié sous le nom "doctr" selon l'installation
+        try:
+            version = metadata.version(engine)
+        except metadata.PackageNotFoundError:
+            version = 'inconnu'
+    if engine == 'tesseract':
+        from .tesseract_pool import tesseract_status
+        status = tesseract_status()
+        if status['available']:
+            version = f"{version}/{status['version']}/{status['backend']}"
+    return version
+
+
+def engine_config_hash(engine, extra=None):
+    config = dict(ENGINE_CONFIGS.get(engine, {}))
+    if extra:
+        config.update(extra)
+    payload = json.dumps(config, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def is_cacheable(text):
+    """Les messages d'erreur et les marqueurs de délai ne sont jamais mis en cache"""
+    if not text or not isinstance(text, str):
+        return False
+    return not (text.startswith('Erreur') or text.startswith('Tesseract non disponible'))
+
+
+def get_cached_results(content_hash, engines, config=None):
+    """
+    Retourne {moteur: {'text': ..., 'details': ...}} pour les moteurs présents en cache
+    """
+    if not cache_enabled():
+        return {}
+
+    keys = {
+        engine: (engine_version(engine), engine_config_hash(engine, config))
+        for engine in engines
+    }
+    found = {}
+    try:
+        rows = OCRResultCache.objects.filter(content_hash=content_hash, engine__in=list(engines))
+        for row in rows:
+            if keys.get(row.engine) == (row.engine_version, row.config_hash):
+                found[row.engine] = row
+        if found:
+            OCRResultCache.objects.filter(pk__in=[row.pk for row in found.values()]).update(
+                hit_count=F('hit_count') + 1,
+                last_hit_at=timezone.now()
+            )
+    except Exception as e:
+        logger.error("Lecture du cache OCR impossible: %s", e)
+        found = {}
+
+    _count('hits', len(found))
+    _count('misses', len(engines) - len(found))
+    return {engine: {'text': row.text, 'details': row.details} for engine, row in found.items()}
+
+
+def store_results(content_hash, ocr_results, config=None, details=None):
+    if not cache_enabled():
+        return
+    details = details or {}
+    stored = 0
+    for engine, text in ocr_results.items():
+        if not is_cacheable(text):
+            continue
+        try:
+            OCRResultCache.objects.update_or_create(
+                content_hash=content_hash,
+                engine=engine,
+                engine_version=engine_version(engine),
+                config_hash=engine_config_hash(engine, config),
+                defaults={
+                    'text': text,
+                    'details': details.get(engine, {}),
+                    'last_hit_at': timezone.now(),
+                }
+            )
+            stored += 1
+        except Exception as e:
+            logger.error("Écriture du cache OCR impossible (%s): %s", engine, e)
+    if stored:
+        _count('stores', stored)
+        evict()
+
+
+def evict():
+    """
+    Supprime les entrées plus anciennes que OCR_CACHE_MAX_AGE_DAYS puis, au-delà
+    de OCR_CACHE_MAX_ENTRIES, les moins récemment utilisées
+    """
+    removed = 0
+    try:
+        max_age_days = getattr(settings, 'OCR_CACHE_MAX_AGE_DAYS', 0)
+        if max_age_days:
+            cutoff = timezone.now() - timedelta(days=max_age_days)
+            removed += OCRResultCache.objects.filter(last_hit_at__lt=cutoff).delete()[0]
+
+        max_entries = getattr(settings, 'OCR_CACHE_MAX_ENTRIES', 0)
+        if max_entries:
+            overflow = OCRResultCache.objects.count() - max_entries
+            if overflow > 0:
+                oldest = OCRResultCache.objects.order_by('last_hit_at').values_list('pk', flat=True)[:overflow]
+                removed += OCRResultCache.objects.filter(pk__in=list(oldest)).delete()[0]
+    except Exception as e:
+        logger.error("Éviction du cache OCR impossible: %s", e)
+    if removed:
+        _count('evictions', removed)
+    return removed
+
+
+def cache_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = round(stats['hits'] / lookups, 3) if lookups else None
+    try:
+        stats['entries'] = OCRResultCache.objects.count()
+    except Exception:
+        stats['entries'] = None
+    return stats
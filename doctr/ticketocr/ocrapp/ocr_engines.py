@@ -0,0 +1,173 @@
+"""
+Moteurs OCR : extraction du texte brut d'un ticket avec doctr, docling et tesseract
+"""
+import os
+from io import BytesIO
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+from django.conf import settings
+
+from .ocr_layout import OCRLayout
+from .ocr_registry import registry as ocr_registry
+from .pdf_stream import iter_pdf_pages, pdf_dpi
+from .preprocessing import PreparedImage
+from .tesseract_pool import pool as tesseract_pool, tesseract_status
+
+
+def doctr_page_details(pages):
+    """
+    Confiance moyenne des mots reconnus par doctr sur un ensemble de pages,
+    avec la mise en page complète (mots, lignes, boîtes, confiances) encodée
+    sous forme compacte (voir ocr_layout.py)
+    """
+    layout = OCRLayout.from_doctr_pages(pages)
+    return {
+        'word_count': len(layout),
+        'confidence': round(layout.mean_confidence, 4),
+        'layout': layout.encode(),
+    }
+
+
+def _doctr_pages(source):
+    if isinstance(source, PreparedImage):
+        return [source.as_array()]
+    if isinstance(source, Image.Image):
+        return [np.asarray(source.convert('RGB'))]
+    # doctr (et torch) n'est importé qu'au premier fichier à lire
+    from doctr.io import DocumentFile
+    if os.path.splitext(source)[1].lower() == '.pdf':
+        return DocumentFile.from_pdf(source, scale=pdf_dpi() / 72)
+    return DocumentFile.from_images(source)
+
+
+def ocr_doctr_batch(sources, batch_size=None):
+    """
+    OCR doctr groupé : les pages de plusieurs tickets passent ensemble dans
+    les passes de détection et de reconnaissance (tenseurs groupés par le
+    prédicteur) au lieu d'une passe par image. Retourne une liste de
+    (texte, détails) dans l'ordre des sources.
+    """
+    batch_size = batch_size or getattr(settings, 'OCR_DOCTR_BATCH_SIZE', 8)
+    outputs = []
+    for offset in range(0, len(sources), batch_size):
+        chunk = sources[offset:offset + batch_size]
+        try:
+            pages, owners = [], []
+            for index, source in enumerate(chunk):
+                source_pages = _doctr_pages(source)
+                pages.extend(source_pages)
+                owners.extend([index] * len(source_pages))
+
+            with ocr_registry.use('doctr') as model:
+                result = model(pages)
+
+            per_source = [[] for _ in chunk]
+            for owner, page in zip(owners, result.pages):
+                per_source[owner].append(page)
+            for source_pages in per_source:
+                text = "\n\n\n".join(page.render() for page in source_pages)
+                outputs.append((text, doctr_page_details(source_pages)))
+            print(f"Doctr: lot de {len(chunk)} ticket(s), {len(pages)} page(s)")
+        except Exception as e:
+            # Un fichier illisible ne doit pas faire échouer tout le lot
+            print(f"Erreur Doctr (lot): {str(e)} - traitement image par image")
+            outputs.extend(ocr_doctr(source) for source in chunk)
+    return outputs
+
+
+def ocr_doctr(source):
+    """
+    OCR doctr avec détails : retourne (texte, détails).
+    `source` est un chemin de fichier ou une image déjà prétraitée (PreparedImage)
+    """
+    try:
+        print(f"Doctr: Processing {source}")
+        # Image déjà décodée par l'étape de prétraitement, ou chargée depuis le chemin
+        doc = _doctr_pages(source)
+
+        # Modèle Doctr partagé par le worker (chargé une seule fois)
+        with ocr_registry.use('doctr') as model:
+            # Faire la prédiction
+            result = model(doc)
+
+        # Extraire le texte brut
+        extracted_text = result.render()
+        details = doctr_page_details(result.pages)
+        print(f"Doctr: Extracted {len(extracted_text)} characters")
+        return extracted_text, details
+    except Exception as e:
+        error_msg = f"Erreur Doctr: {str(e)}"
+        print(error_msg)
+        return error_msg, {}
+
+
+def extract_text_doctr(source):
+    return ocr_doctr(source)[0]
+
+def extract_text_docling(source):
+    try:
+        print(f"Docling: Processing {source}")
+        if isinstance(source, PreparedImage):
+            from docling.datamodel.base_models import DocumentStream
+            document_source = DocumentStream(name=f"{Path(source.name).stem}.png", stream=BytesIO(source.as_png_bytes()))
+        else:
+            document_source = Path(source)
+        with ocr_registry.use('docling') as converter:
+            result = converter.convert(document_source)
+        document = result.document
+
+        text_lines = {}
+        if hasattr(document, 'texts'):
+            for text_item in document.texts:
+                if hasattr(text_item, 'prov') and text_item.prov:
+                    y_pos = sum([prov.bbox.t for prov in text_item.prov]) / len(text_item.prov)
+                    text_lines[y_pos] = text_lines.get(y_pos, "") + " " + text_item.text
+
+        sorted_lines = sorted(text_lines.items(), key=lambda x: -x[0])
+        extracted_text = "\n".join([line[1].strip() for line in sorted_lines])
+        print(f"Docling: Extracted {len(extracted_text)} characters")
+        return extracted_text
+
+    except Exception as e:
+        error_msg = f"Erreur Docling: {str(e)}"
+        print(error_msg)
+        return error_msg
+
+def extract_text_tesseract(source):
+    try:
+        print(f"Tesseract: Processing {source}")
+        
+        # Vérifier si Tesseract est disponible (vérification faite une fois par worker)
+        status = tesseract_status()
+        if not status['available']:
+            error_msg = f"Tesseract non disponible: {status['error']}\n\nPour installer Tesseract:\n1. Téléchargez: https://github.com/UB-Mannheim/tesseract/wiki\n2. Installez dans C:\\Program Files\\Tesseract-OCR\\\n3. Ajoutez au PATH système"
+            print(error_msg)
+            return error_msg
+        
+        images = []
+        if isinstance(source, PreparedImage):
+            images = [source.as_pil()]
+        elif isinstance(source, Image.Image):
+            images = [source]
+        elif os.path.splitext(source)[1].lower() == '.pdf':
+            try:
+                import pdf2image  # noqa: F401
+            except ImportError:
+                return "Erreur: pdf2image non installé pour traiter les PDF"
+            # Pages rastérisées une à une, pas tout le document en mémoire
+            images = (image for _, image in iter_pdf_pages(source))
+        else:
+            images = [Image.open(source)]
+        
+        text = ""
+        for img in images:
+            text += tesseract_pool.image_to_string(img) + "\n"
+        extracted_text = text.strip()
+        print(f"Tesseract: Extracted {len(extracted_text)} characters")
+        return extracted_text
+    except Exception as e:
+        error_msg = f"Erreur Tesseract: {str(e)}"
+        print(error_msg)
+        return error_msg
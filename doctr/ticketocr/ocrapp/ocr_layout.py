@@ -0,0 +1,183 @@
+"""
+Mise en page doctr compacte : mots, lignes, boîtes et confiances.
+
+La structure de `export()` de doctr (pages > blocs > lignes > mots) est
+aplatie en tableaux numpy : une ligne par mot (boîte, confiance, ligne) et
+une ligne par ligne de texte (boîte, bloc, page). L'ensemble est sérialisé
+en npz compressé, stocké avec l'extraction (ExtractionHistory.ocr_layout)
+et dans le cache OCR, pour être réutilisé sans relancer l'inférence :
+lecture ligne par ligne, relecture d'une zone, décisions selon la confiance.
+Les coordonnées sont relatives à la page (0 à 1).
+"""
+import base64
+import io
+
+import numpy as np
+
+
+class OCRLayout:
+    """
+    Mots et lignes d'un document lu par doctr, sous forme de tableaux
+    """
+
+    def __init__(self, words, word_boxes, word_confidences, word_lines,
+                 line_boxes, line_blocks, line_pages, page_dimensions):
+        self.words = np.asarray(words, dtype=str)
+        self.word_boxes = np.asarray(word_boxes, dtype=np.float32).reshape(-1, 4)
+        self.word_confidences = np.asarray(word_confidences, dtype=np.float32)
+        self.word_lines = np.asarray(word_lines, dtype=np.int32)
+        self.line_boxes = np.asarray(line_boxes, dtype=np.float32).reshape(-1, 4)
+        self.line_blocks = np.asarray(line_blocks, dtype=np.int32)
+        self.line_pages = np.asarray(line_pages, dtype=np.int32)
+        self.page_dimensions = np.asarray(page_dimensions, dtype=np.int32).reshape(-1, 2)
+
+    def __len__(self):
+        return len(self.words)
+
+    def __repr__(self):
+        return f"<OCRLayout {len(self.page_dimensions)} page(s), {len(self.line_boxes)} lignes, {len(self)} mots>"
+
+    @classmethod
+    def empty(cls):
+        return cls([], [], [], [], [], [], [], [])
+
+    @classmethod
+    def from_export(cls, export):
+        """Construit la mise en page depuis Document.export() ou une liste de Page.export()"""
+        pages = export['pages'] if isinstance(export, dict) else export
+        words, word_boxes, word_confidences, word_lines = [], [], [], []
+        line_boxes, line_blocks, line_pages, page_dimensions = [], [], [], []
+        block_index = 0
+        for page_index, page in enumerate(pages):
+            page_dimensions.append(page.get('dimensions', (0, 0)))
+            for block in page.get('blocks', []):
+                for line in block.get('lines', []):
+                    line_index = len(line_boxes)
+                    (x0, y0), (x1, y1) = line['geometry'][:2]
+                    line_boxes.append((x0, y0, x1, y1))
+                    line_blocks.append(block_index)
+                    line_pages.append(page_index)
+                    for word in line.get('words', []):
+                        (x0, y0), (x1, y1) = word['geometry'][:2]
+                        words.append(word['value'])
+                        word_boxes.append((x0, y0, x1, y1))
+                        word_confidences.append(word['confidence'])
+                        word_lines.append(line_index)
+                block_index += 1
+        return cls(words, word_boxes, word_confidences, word_lines,
+                   line_boxes, line_blocks, line_pages, page_dimensions)
+
+    @classmethod
+    def from_doctr_pages(cls, pages):
+        return cls.from_export([page.export() for page in pages])
+
+    @classmethod
+    def concat(cls, layouts):
+        """Assemble les mises en page de plusieurs pages lues séparément (PDF)"""
+        layouts = [layout for layout in layouts if layout is not None]
+        if not layouts:
+            return cls.empty()
+        line_offset = block_offset = page_offset = 0
+        parts = []
+        for layout in layouts:
+            parts.append((
+                layout.word_lines + line_offset,
+                layout.line_blocks + block_offset,
+                layout.line_pages + page_offset,
+            ))
+            line_offset += len(layout.line_boxes)
+            block_offset += int(layout.line_blocks.max()) + 1 if len(layout.line_blocks) else 0
+            page_offset += len(layout.page_dimensions)
+        return cls(
+            np.concatenate([layout.words for layout in layouts]),
+            np.concatenate([layout.word_boxes for layout in layouts]),
+            np.concatenate([layout.word_confidences for layout in layouts]),
+            np.concatenate([part[0] for part in parts]),
+            np.concatenate([layout.line_boxes for layout in layouts]),
+            np.concatenate([part[1] for part in parts]),
+            np.concatenate([part[2] for part in parts]),
+            np.concatenate([layout.page_dimensions for layout in layouts]),
+        )
+
+    # Sérialisation
+
+    def to_bytes(self):
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer,
+            words=self.words,
+            word_boxes=self.word_boxes,
+            word_confidences=self.word_confidences,
+            word_lines=self.word_lines,
+            line_boxes=self.line_boxes,
+            line_blocks=self.line_blocks,
+            line_pages=self.line_pages,
+            page_dimensions=self.page_dimensions,
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        with np.load(io.BytesIO(bytes(data)), allow_pickle=False) as arrays:
+            return cls(**{name: arrays[name] for name in arrays.files})
+
+    def encode(self):
+        """Représentation texte (base64) pour les champs JSON"""
+        return base64.b64encode(self.to_bytes()).decode('ascii')
+
+    @classmethod
+    def decode(cls, encoded):
+        return cls.from_bytes(base64.b64decode(encoded))
+
+    # Lecture
+
+    @property
+    def mean_confidence(self):
+        return float(self.word_confidences.mean()) if len(self) else 0.0
+
+    def lines(self):
+        """
+        Lignes dans l'ordre de lecture doctr : liste de dicts
+        {'text', 'confidence', 'box', 'page'}
+        """
+        result = []
+        if not len(self.line_boxes):
+            return result
+        order = np.argsort(self.word_lines, kind='stable')
+        words_by_line = np.split(order, np.searchsorted(self.word_lines[order], np.arange(1, len(self.line_boxes))))
+        for line_index, indices in enumerate(words_by_line):
+            result.append({
+                'text': " ".join(self.words[indices]),
+                'confidence': round(float(self.word_confidences[indices].min()), 4) if len(indices) else 0.0,
+                'box': tuple(round(float(v), 4) for v in self.line_boxes[line_index]),
+                'page': int(self.line_pages[line_index]),
+            })
+        return result
+
+    def text(self):
+        return "\n".join(line['text'] for line in self.lines())
+
+    def words_in_region(self, box, page=0):
+        """Mots dont le centre est dans la zone (x0, y0, x1, y1) de la page"""
+        x0, y0, x1, y1 = box
+        centers_x = (self.word_boxes[:, 0] + self.word_boxes[:, 2]) / 2
+        centers_y = (self.word_boxes[:, 1] + self.word_boxes[:, 3]) / 2
+        mask = (
+            (centers_x >= x0) & (centers_x <= x1) & (centers_y >= y0) & (centers_y <= y1)
+            & (self.line_pages[self.word_lines] == page)
+        )
+        return [
+            {'text': str(word), 'confidence': round(float(confidence), 4), 'box': tuple(round(float(v), 4) for v in word_box)}
+            for word, confidence, word_box in zip(self.words[mask], self.word_confidences[mask], self.word_boxes[mask])
+        ]
+
+    def low_confidence_words(self, threshold=0.5):
+        """Mots sous le seuil de confiance (candidats à une relecture)"""
+        mask = self.word_confidences < threshold
+        return [
+            {'text': str(word), 'confidence': round(float(confidence), 4), 'box': tuple(round(float(v), 4) for v in word_box),
+             'page': int(self.line_pages[line])}
+            for word, confidence, word_box, line in zip(
+                self.words[mask], self.word_confidences[mask], self.word_boxes[mask], self.word_lines[mask]
+            )
+        ]
@@ -0,0 +1,497 @@
+"""
+Étape OCR du pipeline : exécution concurrente des moteurs avec délai par moteur,
+cache par contenu d'image et mode adaptatif (arrêt anticipé sur une bonne lecture)
+"""
+import functools
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from django.conf import settings
+
+from . import metrics, ocr_cache, ocr_registry, progress
+from .doctr_batcher import microbatch_enabled, ocr_doctr_microbatched
+from .ocr_engines import ocr_doctr, ocr_doctr_batch, extract_text_docling, extract_text_tesseract
+from .pdf_stream import pdf_dpi, pdf_streaming_enabled, page_workers, submit_pdf_ocr
+from .preprocessing import prepare_image, preprocess_config
+
+logger = logging.getLogger(__name__)
+
+
+def _text_only(extract):
+    def run(source):
+        return extract(source), {}
+    return run
+
+
+def _doctr_engine(source):
+    # Sous charge, les lectures doctr des requêtes concurrentes partagent un lot
+    if microbatch_enabled():
+        # Requête abandonnée au délai du moteur : elle ne retient ni place de lot ni thread du pool
+        return ocr_doctr_microbatched(source, timeout=engine_timeout('doctr'))
+    return ocr_doctr(source)
+
+
+# Chaque moteur retourne (texte, détails). Ordre conservé dans ocr_results
+# (identique à l'ancien code séquentiel)
+OCR_ENGINES = {
+    'tesseract': _text_only(extract_text_tesseract),
+    'doctr': _doctr_engine,
+    'docling': _text_only(extract_text_docling),
+}
+
+ENGINE_LABELS = {
+    'tesseract': 'Tesseract',
+    'doctr': 'Doctr',
+    'docling': 'Docling',
+}
+
+DEFAULT_ENGINE_TIMEOUTS = {
+    'tesseract': 60,
+    'doctr': 120,
+    'docling': 180,
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_ocr_executor():
+    """
+    Pool de threads partagé : tesseract est un sous-processus et torch libère
+    le GIL pendant l'inférence, les threads suffisent pour paralléliser
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'OCR_MAX_WORKERS', 6),
+                thread_name_prefix='ocr'
+            )
+        return _executor
+
+
+def engine_timeout(name):
+    timeouts = getattr(settings, 'OCR_ENGINE_TIMEOUTS', {})
+    return timeouts.get(name, DEFAULT_ENGINE_TIMEOUTS.get(name, 120))
+
+
+def waits_for_slot(name):
+    """
+    Le moteur attend, dans le thread du pool, le verrou de son instance du
+    registre : il ne démarre qu'à l'obtention de ce verrou. Doctr en
+    micro-batching attend son lot, borné par le délai du batcher
+    """
+    return name == 'docling' or (name == 'doctr' and not microbatch_enabled())
+
+
+def timeout_marker(name, timeout):
+    return f"Erreur {ENGINE_LABELS.get(name, name)}: délai dépassé ({timeout}s)"
+
+
+# Intervalle de vérification du démarrage d'une tâche en attente d'un thread du pool
+QUEUE_POLL_INTERVAL = 0.2
+
+
+def wait_from_start(future, started_at, timeout, queued_since, queue_timeout=None):
+    """
+    Résultat du Future au plus `timeout` s après le démarrage effectif de la
+    tâche (started_at() : instant time.monotonic(), None tant qu'elle attend
+    un thread du pool ou le verrou de son moteur). L'attente en file est
+    bornée par queue_timeout (par défaut le même délai), comptée depuis
+    queued_since ; lève FutureTimeout
+    """
+    queue_timeout = timeout if queue_timeout is None else queue_timeout
+    while True:
+        started = started_at()
+        now = time.monotonic()
+        if started is not None:
+            return future.result(timeout=max(0, started + timeout - now))
+        remaining = queued_since + queue_timeout - now
+        if remaining <= 0:
+            raise FutureTimeout()
+        try:
+            return future.result(timeout=min(remaining, QUEUE_POLL_INTERVAL))
+        except FutureTimeout:
+            continue
+
+
+def is_error_text(text):
+    return not text or not isinstance(text, str) or not ocr_cache.is_cacheable(text)
+
+
+class OCRRun:
+    """
+    Exécution OCR d'un fichier : le hash, le prétraitement et le cache sont
+    partagés entre les appels successifs à run() (utile au mode adaptatif)
+    """
+
+    def __init__(self, file_path, use_cache=True):
+        self.file_path = file_path
+        self.use_cache = use_cache and ocr_cache.cache_enabled()
+        self.is_pdf = os.path.splitext(file_path)[1].lower() == '.pdf'
+        # Le prétraitement (et la résolution des PDF) modifie le texte produit :
+        # il fait partie de la clé de cache
+        self.config = {'preprocess': preprocess_config()}
+        if self.is_pdf:
+            self.config['pdf_dpi'] = pdf_dpi()
+        # Délais multipliés pour les PDF selon le nombre de vagues de pages
+        self.timeout_scale = 1
+        # Événements d'avancement émis depuis les threads des moteurs
+        self.reporter = progress.current_reporter()
+        self.timings = metrics.current_collector()
+        self.details = {}
+        self.cached_engines = []
+        # Un moteur est soit terminé, soit hors délai : son événement final n'est émis qu'une fois
+        self.finished = set()
+        self.timed_out = set()
+        # Démarrage effectif de chaque moteur : son délai court à partir de là
+        self.started = {}
+        # Verrou du registre tenu par chaque moteur : (moteur, numéro de prise)
+        self.slots = {}
+        self._state_lock = threading.Lock()
+        self._content_hash = None
+        self._source = None
+
+    @property
+    def content_hash(self):
+        if self._content_hash is None:
+            self._content_hash = ocr_cache.hash_file(self.file_path)
+        return self._content_hash
+
+    @property
+    def source(self):
+        """Image décodée une seule fois, partagée par tous les moteurs"""
+        if self._source is None:
+            self._source = self.file_path
+            if not self.is_pdf:
+                try:
+                    with metrics.span('preprocess', self.timings):
+                        self._source = prepare_image(self.file_path, self.config['preprocess'])
+                except Exception as e:
+                    logger.error("Prétraitement de %s impossible, lecture directe par les moteurs: %s", self.file_path, e)
+        return self._source
+
+    def lookup_cache(self, engines):
+        cached = {}
+        if self.use_cache:
+            try:
+                with metrics.span('ocr_cache', self.timings) as cache_span:
+                    cached = ocr_cache.get_cached_results(self.content_hash, engines, self.config)
+                    cache_span.tag(outcome='hit' if cached else 'miss')
+            except OSError as e:
+                logger.error("Hash de %s impossible: %s", self.file_path, e)
+                self.use_cache = False
+        if cached:
+            logger.info("Cache OCR: %s servis depuis le cache", ", ".join(cached))
+            self.cached_engines.extend(cached)
+        for name, entry in cached.items():
+            self.details[name] = entry['details'] or {}
+            progress.emit('engine_cached', self.reporter, engine=name, text=entry['text'])
+        return {name: entry['text'] for name, entry in cached.items()}
+
+    def store(self, computed):
+        if self.use_cache and computed:
+            with metrics.span('ocr_cache_write', self.timings):
+                ocr_cache.store_results(self.content_hash, computed, self.config, self.details)
+
+    def collect(self, futures, start, queue_depth=1):
+        """
+        Attend chaque moteur jusqu'à son délai, compté depuis son démarrage
+        effectif : thread du pool obtenu et, pour doctr et docling, verrou de
+        l'instance partagée obtenu. L'attente en amont, depuis `start`, est
+        bornée à `queue_depth` délais (nombre d'inférences pouvant passer
+        avant celle-ci) ; retourne {moteur: texte}
+        """
+        computed = {}
+        for name, future in futures.items():
+            timeout = engine_timeout(name) * self.timeout_scale
+            try:
+                computed[name], self.details[name] = wait_from_start(
+                    future, functools.partial(self.started.get, name), timeout, start,
+                    queue_timeout=timeout * queue_depth,
+                )
+            except FutureTimeout:
+                with self._state_lock:
+                    finished = name in self.finished
+                    if not finished:
+                        self.timed_out.add(name)
+                if finished:
+                    # Terminé à l'instant même du délai : son résultat est déjà publié
+                    computed[name], self.details[name] = future.result()
+                    continue
+                # Un thread en cours ne s'annule pas : s'il retient l'instance
+                # partagée, le moteur est signalé bloqué (refusé, visible sur /health)
+                future.cancel()
+                if name in self.slots:
+                    ocr_registry.registry.mark_stuck(*self.slots[name])
+                computed[name] = timeout_marker(name, timeout)
+                metrics.record('ocr', timeout, self.timings, engine=name, outcome='timeout')
+                progress.emit('engine_timeout', self.reporter, engine=name, timeout=timeout)
+                logger.warning("OCR %s: délai de %ss dépassé pour %s", name, timeout, self.file_path)
+            except Exception as e:
+                computed[name] = f"Erreur {ENGINE_LABELS.get(name, name)}: {str(e)}"
+        return computed
+
+    def report_finished(self, name, text, duration):
+        with self._state_lock:
+            if name in self.timed_out:
+                # engine_timeout déjà émis et mesure 'timeout' déjà enregistrée : ni second
+                # événement final pour l'interface, ni double comptage dans les métriques
+                logger.info("OCR %s terminé après son délai (%.2fs) pour %s", name, duration, self.file_path)
+                return
+            self.finished.add(name)
+        metrics.record('ocr', duration, self.timings, engine=name, outcome='error' if is_error_text(text) else 'ok')
+        if is_error_text(text):
+            progress.emit('engine_finished', self.reporter, engine=name, duration=round(duration, 3), error=text)
+        else:
+            progress.emit('engine_finished', self.reporter, engine=name, duration=round(duration, 3), text=text)
+
+    def report_future(self, name, start, future):
+        if future.exception() is None:
+            self.report_finished(name, future.result()[0], time.monotonic() - start)
+
+    def mark_started(self, name, slot=None, acquisition=None):
+        self.started.setdefault(name, time.monotonic())
+        if slot is not None:
+            self.slots[name] = (slot, acquisition)
+
+    def run_engine(self, name, source):
+        """
+        Exécute un moteur dans le pool ; son texte est publié dès qu'il est
+        prêt. Son délai court dès ce thread obtenu, ou pour doctr et docling
+        dès le verrou de l'instance partagée obtenu (voir ocr_registry.on_acquired)
+        """
+        with ocr_registry.on_acquired(functools.partial(self.mark_started, name)):
+            if not waits_for_slot(name):
+                self.mark_started(name)
+            text, details = OCR_ENGINES[name](source)
+        start = self.started.get(name)
+        duration = time.monotonic() - start if start is not None else 0.0
+        self.report_finished(name, text, duration)
+        return text, details
+
+    def submit(self, engines):
+        """Lance les moteurs demandés ; retourne {moteur: Future de (texte, détails)}"""
+        for name in engines:
+            progress.emit('engine_started', self.reporter, engine=name)
+        if self.is_pdf and pdf_streaming_enabled():
+            try:
+                start = time.monotonic()
+                futures, page_count = submit_pdf_ocr(
+                    self.file_path, {name: OCR_ENGINES[name] for name in engines},
+                    self.config['preprocess'], self.config['pdf_dpi']
+                )
+                self.timeout_scale = max(1, -(-page_count // page_workers()))
+                for name, future in futures.items():
+                    # Les pages ont leur propre pool : le délai court dès la soumission
+                    self.started[name] = start
+                    future.add_done_callback(functools.partial(self.report_future, name, start))
+                return futures
+            except Exception as e:
+                logger.error("Lecture page par page de %s impossible: %s", self.file_path, e)
+        source = self.source
+        executor = get_ocr_executor()
+        return {name: executor.submit(self.run_engine, name, source) for name in engines}
+
+    def run(self, engines):
+        start = time.monotonic()
+        cached = self.lookup_cache(engines)
+
+        pending = [name for name in engines if name not in cached]
+        futures = self.submit(pending) if pending else {}
+
+        computed = self.collect(futures, start)
+        self.store(computed)
+
+        results = {name: cached[name] if name in cached else computed[name] for name in engines}
+        logger.info("OCR parallèle terminé en %.2fs (%s)", time.monotonic() - start, ", ".join(engines))
+        return results
+
+
+def run_ocr_engines(file_path, engines=None, use_cache=True):
+    """
+    Lance les moteurs OCR en parallèle sur le même fichier, décodé et
+    prétraité une seule fois (hors PDF). Les textes déjà connus pour ce
+    contenu d'image sont servis par le cache ; un moteur qui dépasse son délai
+    renvoie un marqueur d'erreur au lieu de bloquer la requête, son thread
+    termine en arrière-plan.
+    """
+    return OCRRun(file_path, use_cache).run(engines or list(OCR_ENGINES))
+
+
+def _timed_doctr_batch(sources, started):
+    # Délai compté dès la première passe du lot entrée dans le modèle
+    def acquired(slot, acquisition):
+        started.setdefault('doctr', time.monotonic())
+        started['slot'] = (slot, acquisition)
+
+    with ocr_registry.on_acquired(acquired):
+        with metrics.span('ocr_batch', engine='doctr'):
+            return ocr_doctr_batch(sources)
+
+
+def run_ocr_batch(file_paths, engines=None, use_cache=True):
+    """
+    OCR d'un lot de fichiers (ingestion en masse) : les lectures doctr
+    absentes du cache passent en une seule inférence groupée, les autres
+    moteurs restent exécutés fichier par fichier dans le pool partagé.
+    Retourne une liste de (ocr_results, détails par moteur) dans l'ordre des fichiers.
+    """
+    engines = engines or list(OCR_ENGINES)
+    start = time.monotonic()
+    runs = [OCRRun(file_path, use_cache) for file_path in file_paths]
+    cached = [run.lookup_cache(engines) for run in runs]
+
+    executor = get_ocr_executor()
+    submitted = time.monotonic()
+    futures = []
+    doctr_runs = []
+    for index, (run, hits) in enumerate(zip(runs, cached)):
+        pending = [name for name in engines if name not in hits]
+        # Les PDF sont lus page par page, hors lot doctr
+        if 'doctr' in pending and not run.is_pdf:
+            pending.remove('doctr')
+            doctr_runs.append(index)
+        futures.append(run.submit(pending) if pending else {})
+
+    doctr_batch = None
+    batch_started = {}
+    if doctr_runs:
+        doctr_batch = executor.submit(
+            _timed_doctr_batch, [runs[index].source for index in doctr_runs], batch_started
+        )
+
+    # Délais comptés depuis le démarrage effectif de chaque moteur. Un moteur
+    # partagé (docling) traite les fichiers du lot l'un après l'autre : chacun
+    # peut attendre jusqu'à un délai par fichier passé avant lui
+    computed = [run.collect(run_futures, submitted, queue_depth=len(runs)) for run, run_futures in zip(runs, futures)]
+
+    if doctr_batch is not None:
+        # Délai doctr proportionnel au nombre de passes d'inférence du lot
+        batch_size = getattr(settings, 'OCR_DOCTR_BATCH_SIZE', 8)
+        passes = -(-len(doctr_runs) // batch_size)
+        timeout = engine_timeout('doctr') * passes
+        try:
+            outputs = wait_from_start(
+                doctr_batch, functools.partial(batch_started.get, 'doctr'), timeout, submitted,
+                queue_timeout=timeout * len(runs),
+            )
+        except FutureTimeout:
+            doctr_batch.cancel()
+            if 'slot' in batch_started:
+                ocr_registry.registry.mark_stuck(*batch_started['slot'])
+            outputs = [(timeout_marker('doctr', timeout), {})] * len(doctr_runs)
+            logger.warning("OCR doctr groupé: délai de %ss dépassé pour %d fichiers", timeout, len(doctr_runs))
+        except Exception as e:
+            outputs = [(f"Erreur Doctr: {str(e)}", {})] * len(doctr_runs)
+        for index, (text, details) in zip(doctr_runs, outputs):
+            computed[index]['doctr'] = text
+            runs[index].details['doctr'] = details
+
+    results = []
+    for run, hits, run_computed in zip(runs, cached, computed):
+        run.store(run_computed)
+        ocr_results = {name: hits[name] if name in hits else run_computed[name] for name in engines}
+        results.append((ocr_results, run.details))
+    logger.info(
+        "OCR groupé: %d fichiers en %.2fs (%d lectures doctr groupées)",
+        len(runs), time.monotonic() - start, len(doctr_runs)
+    )
+    return results
+
+
+# Montant précédé de TOTAL / NET A PAYER, avec décimales (4.090, 12,500)
+TOTAL_RE = re.compile(r'(total|net\s*a\s*payer|a\s*payer)[^\d\n]{0,20}\d+[.,]\d{2,3}', re.IGNORECASE)
+DATE_RE = re.compile(r'\b(\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}|\d{4}[/.-]\d{1,2}[/.-]\d{1,2})\b')
+
+
+def score_ocr_output(text, details=None):
+    """
+    Score de qualité d'une lecture OCR entre 0 et 1 : confiance moyenne des
+    mots (doctr), total lisible, date lisible et nombre de lignes
+    """
+    if is_error_text(text) or not text.strip():
+        return {'score': 0.0}
+
+    details = details or {}
+    lines = [line for line in text.splitlines() if line.strip()]
+    components = {
+        'total': 1.0 if TOTAL_RE.search(text) else 0.0,
+        'date': 1.0 if DATE_RE.search(text) else 0.0,
+        'lines': min(len(lines) / 8, 1.0),
+    }
+    weights = {'total': 0.3, 'date': 0.2, 'lines': 0.15}
+    if details.get('confidence') is not None:
+        components['confidence'] = float(details['confidence'])
+        weights['confidence'] = 0.35
+
+    score = sum(components[k] * weights[k] for k in weights) / sum(weights.values())
+    return dict(components, score=round(score, 3))
+
+
+def run_ocr_adaptive(file_path, order=None, threshold=None, use_cache=True):
+    """
+    Mode adaptatif : le premier moteur de l'ordre configuré est exécuté seul ;
+    les autres ne sont lancés (en parallèle) que si sa lecture est jugée
+    insuffisante. Retourne (ocr_results, décision) ; ocr_results peut ne
+    contenir que le premier moteur.
+    """
+    order = order or getattr(settings, 'OCR_ADAPTIVE_ORDER', ['doctr', 'tesseract', 'docling'])
+    threshold = threshold if threshold is not None else getattr(settings, 'OCR_ADAPTIVE_THRESHOLD', 0.75)
+
+    run = OCRRun(file_path, use_cache)
+    first = order[0]
+    ocr_results = run.run([first])
+    scores = {first: score_ocr_output(ocr_results[first], run.details.get(first))}
+    early_exit = scores[first]['score'] >= threshold
+    progress.emit('ocr_score', run.reporter, engine=first, score=scores[first]['score'],
+                  threshold=threshold, early_exit=early_exit)
+
+    if not early_exit and len(order) > 1:
+        ocr_results.update(run.run(order[1:]))
+        for name in order[1:]:
+            scores[name] = score_ocr_output(ocr_results[name], run.details.get(name))
+
+    decision = {
+        'mode': 'adaptive',
+        'order': order,
+        'threshold': threshold,
+        'scores': scores,
+        'early_exit': early_exit,
+        'engines_run': list(ocr_results),
+        'cached_engines': run.cached_engines,
+        'doctr_layout': run.details.get('doctr', {}).get('layout'),
+    }
+    logger.info(
+        "OCR adaptatif: %s score=%.3f (seuil %.2f) -> %s",
+        first, scores[first]['score'], threshold,
+        "arrêt anticipé" if early_exit else "moteurs complémentaires"
+    )
+    # Ordre d'affichage habituel (tesseract, doctr, docling)
+    ocr_results = {name: ocr_results[name] for name in OCR_ENGINES if name in ocr_results}
+    return ocr_results, decision
+
+
+def run_ocr_stage(file_path):
+    """
+    Point d'entrée de l'étape OCR selon OCR_MODE ('adaptive' ou 'all').
+    Retourne (ocr_results, rapport à conserver sur l'extraction) ; le rapport
+    contient aussi la mise en page doctr encodée ('doctr_layout', voir ocr_layout.py)
+    """
+    if getattr(settings, 'OCR_MODE', 'all') == 'adaptive':
+        return run_ocr_adaptive(file_path)
+
+    run = OCRRun(file_path)
+    ocr_results = run.run(list(OCR_ENGINES))
+    report = {
+        'mode': 'all',
+        'engines_run': list(ocr_results),
+        'cached_engines': run.cached_engines,
+        'scores': {name: score_ocr_output(text, run.details.get(name)) for name, text in ocr_results.items()},
+        'doctr_layout': run.details.get('doctr', {}).get('layout'),
+    }
+    return ocr_results, report
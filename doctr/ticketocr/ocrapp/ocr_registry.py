@@ -0,0 +1,334 @@
+"""
+Registre process-wide des moteurs OCR lourds (doctr, docling).
+
+Les modèles sont chargés une seule fois par worker puis réutilisés par toutes
+les requêtes. Chaque moteur est protégé par son propre verrou : deux moteurs
+différents peuvent tourner en parallèle, mais une même instance n'exécute
+qu'une inférence à la fois. Les moteurs inactifs sont déchargés lorsque le
+budget mémoire configuré est dépassé ou après un délai d'inactivité.
+
+Un appelant peut être prévenu de l'obtention effective du verrou (voir
+on_acquired()) : le délai d'un moteur ne court qu'à partir de là, pas
+pendant l'attente derrière une autre inférence.
+
+Un thread Python ne s'interrompt pas : une inférence hors délai garde le
+verrou de son instance. Le pipeline la signale (mark_stuck()) ; tant
+qu'elle ne rend pas la main, use() refuse immédiatement ce moteur au lieu
+de mettre de nouveaux appels en file derrière elle, et /health l'indique.
+"""
+import contextvars
+import gc
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class EngineStuck(RuntimeError):
+    """Le moteur est retenu par une inférence hors délai"""
+
+
+_acquired_callback = contextvars.ContextVar('ocr_slot_acquired', default=None)
+
+
+def _load_doctr():
+    from doctr.models import ocr_predictor
+    # Taille de lot de détection alignée sur les lots de tickets (run_ocr_batch)
+    batch_size = getattr(settings, 'OCR_DOCTR_BATCH_SIZE', 8)
+    return ocr_predictor(pretrained=True, det_bs=batch_size)
+
+
+def _load_docling():
+    from docling.document_converter import DocumentConverter
+    return DocumentConverter()
+
+
+def _estimate_size_mb(instance, default_mb):
+    """
+    Estime l'empreinte mémoire d'un moteur à partir de ses paramètres torch,
+    sinon retourne l'estimation configurée
+    """
+    try:
+        parameters = instance.parameters()
+        size = sum(p.numel() * p.element_size() for p in parameters)
+        if size:
+            return size / (1024 * 1024)
+    except Exception:
+        pass
+    return default_mb
+
+
+class _EngineSlot:
+    def __init__(self, name, loader, default_size_mb):
+        self.name = name
+        self.loader = loader
+        self.default_size_mb = default_size_mb
+        self.instance = None
+        self.size_mb = 0
+        self.last_used = 0.0
+        self.load_count = 0
+        self.in_use = 0
+        # Verrou d'inférence : une seule prédiction à la fois par instance
+        self.lock = threading.Lock()
+        # Numéro de la prise de verrou en cours (None : libre) ; une prise
+        # signalée hors délai bloque le moteur jusqu'à sa libération
+        self.acquisitions = 0
+        self.holder = None
+        self.stuck_since = None
+
+
+class OCREngineRegistry:
+    """
+    Registre des moteurs OCR partagés par un worker
+    """
+
+    def __init__(self):
+        self._slots = {}
+        self._lock = threading.RLock()
+
+    def register(self, name, loader, default_size_mb=0):
+        with self._lock:
+            self._slots[name] = _EngineSlot(name, loader, default_size_mb)
+
+    @property
+    def memory_budget_mb(self):
+        return getattr(settings, 'OCR_ENGINE_MEMORY_BUDGET_MB', 0)
+
+    @property
+    def idle_timeout(self):
+        return getattr(settings, 'OCR_ENGINE_IDLE_TIMEOUT', 0)
+
+    def _slot(self, name):
+        try:
+            return self._slots[name]
+        except KeyError:
+            raise KeyError(f"Moteur OCR inconnu: {name}")
+
+    def _load(self, slot):
+        """Charge le moteur si nécessaire (appelé avec le verrou du slot)"""
+        if slot.instance is not None:
+            return slot.instance
+
+        start = time.perf_counter()
+        instance = slot.loader()
+        slot.size_mb = _estimate_size_mb(instance, slot.default_size_mb)
+        slot.load_count += 1
+        with self._lock:
+            slot.instance = instance
+        logger.info(
+            "Moteur %s chargé en %.2fs (~%.0f MB)",
+            slot.name, time.perf_counter() - start, slot.size_mb
+        )
+        self._enforce_budget(keep=slot.name)
+        return instance
+
+    def get(self, name):
+        """
+        Retourne l'instance chargée du moteur (sans verrou d'inférence)
+        """
+        slot = self._slot(name)
+        with slot.lock:
+            slot.last_used = time.monotonic()
+            return self._load(slot)
+
+    @contextmanager
+    def use(self, name):
+        """
+        Fournit le moteur pour une inférence, en exclusivité sur cette instance
+        """
+        self.evict_idle()
+        slot = self._slot(name)
+        stuck_since = slot.stuck_since
+        if stuck_since is not None:
+            raise EngineStuck(
+                f"Moteur {name} bloqué par une inférence hors délai depuis {time.monotonic() - stuck_since:.0f}s"
+            )
+        with slot.lock:
+            with self._lock:
+                slot.acquisitions += 1
+                slot.holder = acquisition = slot.acquisitions
+            try:
+                callback = _acquired_callback.get()
+                if callback is not None:
+                    callback(name, acquisition)
+                instance = self._load(slot)
+                slot.in_use += 1
+                try:
+                    yield instance
+                finally:
+                    slot.in_use -= 1
+                    slot.last_used = time.monotonic()
+            finally:
+                self._release(slot)
+
+    def _release(self, slot):
+        with self._lock:
+            slot.holder = None
+            stuck_since, slot.stuck_since = slot.stuck_since, None
+        if stuck_since is not None:
+            logger.warning("Moteur %s libéré après %.0fs de blocage", slot.name, time.monotonic() - stuck_since)
+
+    def mark_stuck(self, name, acquisition):
+        """
+        Signale la prise de verrou `acquisition` (voir on_acquired) comme hors
+        délai ; sans effet si elle est déjà terminée. Retourne True si le
+        moteur est désormais bloqué
+        """
+        slot = self._slot(name)
+        with self._lock:
+            if slot.holder != acquisition:
+                return False
+            if slot.stuck_since is None:
+                slot.stuck_since = time.monotonic()
+                logger.error("Moteur %s bloqué par une inférence hors délai : nouveaux appels refusés", name)
+            return True
+
+    def stuck_engines(self):
+        """{moteur: secondes de blocage} des moteurs retenus par une inférence hors délai"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                name: round(now - slot.stuck_since, 1)
+                for name, slot in self._slots.items() if slot.stuck_since is not None
+            }
+
+    def preload(self, names=None):
+        """Charge les moteurs demandés (tous par défaut), sans lever d'erreur"""
+        for name in names or list(self._slots):
+            try:
+                self.get(name)
+            except Exception as e:
+                logger.error("Préchargement du moteur %s impossible: %s", name, e)
+
+    def preload_async(self, names=None):
+        thread = threading.Thread(
+            target=self.preload, args=(names,), name="ocr-preload", daemon=True
+        )
+        thread.start()
+        return thread
+
+    def unload(self, name):
+        slot = self._slot(name)
+        if slot.instance is None:
+            return False
+        # Ne jamais décharger un moteur en cours d'inférence
+        if not slot.lock.acquire(blocking=False):
+            return False
+        try:
+            with self._lock:
+                slot.instance = None
+                slot.size_mb = 0
+        finally:
+            slot.lock.release()
+        gc.collect()
+        try:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except Exception:
+            pass
+        logger.info("Moteur %s déchargé", name)
+        return True
+
+    def clear(self):
+        for name in list(self._slots):
+            self.unload(name)
+
+    def loaded_size_mb(self):
+        with self._lock:
+            return sum(s.size_mb for s in self._slots.values() if s.instance is not None)
+
+    def _enforce_budget(self, keep=None):
+        """Décharge les moteurs les moins récemment utilisés au-delà du budget"""
+        budget = self.memory_budget_mb
+        if not budget:
+            return
+        with self._lock:
+            candidates = sorted(
+                (s for s in self._slots.values() if s.instance is not None and s.name != keep),
+                key=lambda s: s.last_used
+            )
+        for slot in candidates:
+            if self.loaded_size_mb() <= budget:
+                break
+            self.unload(slot.name)
+
+    def evict_idle(self, now=None):
+        """Décharge les moteurs inactifs depuis plus de OCR_ENGINE_IDLE_TIMEOUT secondes"""
+        timeout = self.idle_timeout
+        if not timeout:
+            return []
+        now = now if now is not None else time.monotonic()
+        evicted = []
+        with self._lock:
+            idle = [
+                s.name for s in self._slots.values()
+                if s.instance is not None and s.in_use == 0 and now - s.last_used > timeout
+            ]
+        for name in idle:
+            if self.unload(name):
+                evicted.append(name)
+        return evicted
+
+    def stats(self):
+        with self._lock:
+            return {
+                name: {
+                    'loaded': slot.instance is not None,
+                    'size_mb': round(slot.size_mb, 1),
+                    'load_count': slot.load_count,
+                    'in_use': slot.in_use,
+                    'idle_seconds': round(time.monotonic() - slot.last_used, 1) if slot.last_used else None,
+                    'stuck_seconds': round(time.monotonic() - slot.stuck_since, 1) if slot.stuck_since else None,
+                }
+                for name, slot in self._slots.items()
+            }
+
+
+@contextmanager
+def on_acquired(callback):
+    """
+    callback(nom du moteur, numéro de prise) est appelé dans le thread
+    courant dès que use() obtient le verrou d'inférence, avant le chargement
+    éventuel du modèle ; le numéro sert à mark_stuck()
+    """
+    token = _acquired_callback.set(callback)
+    try:
+        yield
+    finally:
+        _acquired_callback.reset(token)
+
+
+registry = OCREngineRegistry()
+registry.register('doctr', _load_doctr, default_size_mb=350)
+registry.register('docling', _load_docling, default_size_mb=900)
+
+
+_SERVER_EXECUTABLES = ('gunicorn', 'uvicorn', 'daphne', 'hypercorn', 'uwsgi', 'waitress-serve')
+
+
+def should_preload():
+    """
+    Indique si le processus courant sert des requêtes et doit précharger les moteurs.
+    Les commandes de gestion (migrate, purge_aziza_payments, ...) et les scripts
+    de test ne chargent rien.
+    """
+    return getattr(settings, 'OCR_PRELOAD_ENGINES', False) and is_server_process()
+
+
+def is_server_process():
+    """Processus qui sert des requêtes HTTP (runserver, gunicorn, uvicorn, ...)"""
+    argv = sys.argv
+    executable = os.path.basename(argv[0]) if argv else ''
+    if executable in ('manage.py', 'django-admin'):
+        if len(argv) < 2 or argv[1] != 'runserver':
+            return False
+        # Avec l'autoreloader, seul le processus enfant sert les requêtes
+        return os.environ.get('RUN_MAIN') == 'true' or '--noreload' in argv
+    return executable in _SERVER_EXECUTABLES or 'mod_wsgi' in sys.modules
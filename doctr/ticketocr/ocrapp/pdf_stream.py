@@ -0,0 +1,149 @@
+"""
+OCR des PDF page par page.
+
+Les pages sont rastérisées une à une (pdf2image, first_page = last_page) à la
+résolution OCR_PDF_DPI puis confiées aux moteurs dès qu'elles sont produites.
+Au plus OCR_PDF_PAGE_WORKERS pages sont en mémoire à la fois : le pic mémoire
+ne dépend pas du nombre de pages du document.
+"""
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from django.conf import settings
+
+from .ocr_layout import OCRLayout
+from .preprocessing import prepare_image
+
+logger = logging.getLogger(__name__)
+
+PAGE_SEPARATOR = "\n\n"
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def pdf_streaming_enabled():
+    return getattr(settings, 'OCR_PDF_STREAMING', True)
+
+
+def pdf_dpi():
+    return getattr(settings, 'OCR_PDF_DPI', 200)
+
+
+def page_workers():
+    return max(1, getattr(settings, 'OCR_PDF_PAGE_WORKERS', 2))
+
+
+def get_page_executor():
+    """Pool dédié aux pages : indépendant du pool OCR qui attend les résultats"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=page_workers(), thread_name_prefix='ocr-pdf')
+        return _executor
+
+
+def pdf_page_count(file_path):
+    from pdf2image import pdfinfo_from_path
+    return int(pdfinfo_from_path(file_path)['Pages'])
+
+
+def render_page(file_path, page_number, dpi=None):
+    """Rastérise une seule page (numérotée à partir de 1)"""
+    from pdf2image import convert_from_path
+    return convert_from_path(
+        file_path, dpi=dpi or pdf_dpi(), first_page=page_number, last_page=page_number
+    )[0]
+
+
+def iter_pdf_pages(file_path, dpi=None):
+    """Produit (numéro, image PIL) page par page"""
+    for page_number in range(1, pdf_page_count(file_path) + 1):
+        yield page_number, render_page(file_path, page_number, dpi)
+
+
+def _is_error(text):
+    return not isinstance(text, str) or text.startswith('Erreur') or text.startswith('Tesseract non disponible')
+
+
+def merge_pages(page_outputs):
+    """
+    Assemble les sorties (texte, détails) d'un moteur page par page. Les pages
+    en erreur sont ignorées ; si toutes le sont, la première erreur est renvoyée.
+    """
+    texts = [text for text, _ in page_outputs if not _is_error(text)]
+    if not texts and page_outputs:
+        return page_outputs[0][0], {}
+
+    details = {'pages': len(page_outputs)}
+    page_details = [dict(page) for _, page in page_outputs if page]
+    layouts = [OCRLayout.decode(page.pop('layout')) for page in page_details if page.get('layout')]
+    if layouts:
+        details['layout'] = OCRLayout.concat(layouts).encode()
+    if page_details:
+        word_count = sum(page.get('word_count', 0) for page in page_details)
+        weighted = sum(page.get('confidence', 0.0) * page.get('word_count', 0) for page in page_details)
+        details.update({
+            'word_count': word_count,
+            'confidence': round(weighted / word_count, 4) if word_count else 0.0,
+            'page_details': page_details,
+        })
+    return PAGE_SEPARATOR.join(texts), details
+
+
+def submit_pdf_ocr(file_path, engines, preprocess=None, dpi=None):
+    """
+    Lance l'OCR page par page d'un PDF avec les moteurs {nom: fonction}.
+    Retourne ({nom: Future de (texte, détails)}, nombre de pages) ; les
+    futures sont résolus quand toutes les pages ont été lues.
+    """
+    futures = {name: Future() for name in engines}
+    page_count = pdf_page_count(file_path)
+    for future in futures.values():
+        future.set_running_or_notify_cancel()
+
+    def read_page(page_number, image, outputs, slots):
+        try:
+            try:
+                source = prepare_image(image, preprocess)
+            except Exception as e:
+                logger.error("Prétraitement de la page %s impossible: %s", page_number, e)
+                source = image
+            for name, engine in engines.items():
+                try:
+                    outputs[name][page_number - 1] = engine(source)
+                except Exception as e:
+                    outputs[name][page_number - 1] = (f"Erreur {name}: {str(e)}", {})
+        finally:
+            slots.release()
+
+    def drive():
+        outputs = {name: [None] * page_count for name in engines}
+        slots = threading.BoundedSemaphore(page_workers())
+        executor = get_page_executor()
+        pending = []
+        try:
+            for page_number in range(1, page_count + 1):
+                # Rendu de la page suivante seulement quand une place se libère
+                slots.acquire()
+                try:
+                    image = render_page(file_path, page_number, dpi)
+                except Exception:
+                    slots.release()
+                    raise
+                pending.append(executor.submit(read_page, page_number, image, outputs, slots))
+                del image
+            for future in pending:
+                future.result()
+        except Exception as e:
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for name, future in futures.items():
+            future.set_result(merge_pages([o for o in outputs[name] if o is not None]))
+        logger.info("PDF %s: %d pages lues (%s)", file_path, page_count, ", ".join(engines))
+
+    threading.Thread(target=drive, name="ocr-pdf-driver", daemon=True).start()
+    return futures, page_count
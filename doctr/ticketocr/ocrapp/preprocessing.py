@@ -0,0 +1,182 @@
+"""
+Prétraitement des images de tickets, partagé par tous les moteurs OCR.
+
+L'image est décodée une seule fois : pour les JPEG, le mode draft de Pillow
+laisse le décodeur réduire directement l'image (1/2, 1/4, 1/8) au lieu de
+décoder les 12 MP de la photo puis de la redimensionner. Viennent ensuite
+l'orientation EXIF, le passage en niveaux de gris, la limitation de taille
+et, en option, le redressement et la binarisation.
+"""
+import io
+import logging
+import os
+import threading
+
+import numpy as np
+from PIL import Image, ImageOps
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PREPROCESS_CONFIG = {
+    'max_side': 2000,     # plus grand côté en pixels, 0 = taille d'origine
+    'grayscale': True,
+    'deskew': False,
+    'binarize': False,
+}
+
+
+def preprocess_config():
+    config = dict(DEFAULT_PREPROCESS_CONFIG)
+    config.update(getattr(settings, 'OCR_PREPROCESS', {}))
+    return config
+
+
+class PreparedImage:
+    """
+    Image décodée et prétraitée, avec les représentations attendues par
+    chaque moteur calculées à la demande puis mémorisées
+    """
+
+    def __init__(self, image, source_path=None, original_size=None, config=None):
+        self.image = image
+        self.source_path = source_path
+        self.original_size = original_size or image.size
+        self.config = config or {}
+        self._lock = threading.Lock()
+        self._array = None
+        self._png = None
+
+    def __repr__(self):
+        return f"<PreparedImage {self.name} {self.size[0]}x{self.size[1]}>"
+
+    @property
+    def size(self):
+        return self.image.size
+
+    @property
+    def name(self):
+        return os.path.basename(self.source_path) if self.source_path else 'ticket.png'
+
+    def as_pil(self):
+        """Image PIL (tesseract)"""
+        return self.image
+
+    def as_array(self):
+        """Tableau RGB uint8 (H, W, 3), format d'entrée des prédicteurs doctr"""
+        with self._lock:
+            if self._array is None:
+                self._array = np.asarray(self.image.convert('RGB'))
+            return self._array
+
+    def as_png_bytes(self):
+        """Image encodée en PNG en mémoire (docling)"""
+        with self._lock:
+            if self._png is None:
+                buffer = io.BytesIO()
+                self.image.save(buffer, format='PNG')
+                self._png = buffer.getvalue()
+            return self._png
+
+
+def _otsu_threshold(gray):
+    histogram = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    total = gray.size
+    cumulative = np.cumsum(histogram)
+    cumulative_mean = np.cumsum(histogram * np.arange(256))
+    global_mean = cumulative_mean[-1]
+    background = cumulative
+    foreground = total - cumulative
+    valid = (background > 0) & (foreground > 0)
+    between = np.zeros(256)
+    between[valid] = (
+        (global_mean * background[valid] - total * cumulative_mean[valid]) ** 2
+        / (background[valid] * foreground[valid])
+    )
+    return int(np.argmax(between))
+
+
+def binarize(image):
+    """Binarisation globale par seuil d'Otsu"""
+    gray = np.asarray(image.convert('L'))
+    threshold = _otsu_threshold(gray)
+    return Image.fromarray(np.where(gray > threshold, 255, 0).astype(np.uint8), mode='L')
+
+
+def estimate_skew(image, max_angle=5.0, step=0.5):
+    """
+    Estime l'inclinaison du texte par profil de projection : l'angle qui
+    maximise la variance des sommes de lignes aligne les lignes du ticket
+    """
+    thumb = image.convert('L')
+    thumb.thumbnail((800, 800))
+    ink = np.asarray(thumb) < _otsu_threshold(np.asarray(thumb))
+    ink_image = Image.fromarray((ink * 255).astype(np.uint8), mode='L')
+
+    best_angle, best_score = 0.0, -1.0
+    for angle in np.arange(-max_angle, max_angle + step / 2, step):
+        rotated = np.asarray(ink_image.rotate(angle, resample=Image.NEAREST, expand=False))
+        score = float(np.var(rotated.sum(axis=1)))
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+
+def deskew(image):
+    angle = estimate_skew(image)
+    if abs(angle) < 0.25:
+        return image
+    fill = 255 if image.mode == 'L' else (255, 255, 255)
+    return image.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=fill)
+
+
+def _process(image, config):
+    """Prétraitement d'une image ouverte ; retourne (image traitée, taille d'origine)"""
+    max_side = config.get('max_side') or 0
+    original_size = image.size
+    if max_side and image.format == 'JPEG' and max(original_size) > max_side:
+        # Réduction pendant le décodage JPEG (DCT), sans passer par la pleine
+        # résolution : draft garde une taille >= à la cible sur les deux côtés
+        ratio = max_side / max(original_size)
+        target = (int(original_size[0] * ratio), int(original_size[1] * ratio))
+        image.draft('L' if config.get('grayscale') else 'RGB', target)
+
+    image = ImageOps.exif_transpose(image)
+    if config.get('grayscale'):
+        image = image.convert('L')
+    elif image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+
+    if max_side and max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+    if config.get('deskew'):
+        image = deskew(image)
+    if config.get('binarize'):
+        image = binarize(image)
+    return image, original_size
+
+
+def prepare_image(source, config=None):
+    """
+    Décode l'image une seule fois et applique le prétraitement configuré.
+    `source` est un chemin, un objet fichier ou une image PIL déjà décodée
+    (page de PDF). Le fichier ouvert est refermé dès le décodage : l'image
+    retournée est une copie en mémoire.
+    """
+    config = config or preprocess_config()
+
+    if isinstance(source, Image.Image):
+        image, original_size = _process(source, config)
+        source_path = None
+    else:
+        with Image.open(source) as opened:
+            image, original_size = _process(opened, config)
+            if image is opened:
+                image = image.copy()
+            image.load()
+        if isinstance(source, (str, os.PathLike)):
+            source_path = os.fspath(source)
+        else:
+            source_path = getattr(source, 'name', None)
+    logger.info("Prétraitement: %s -> %s", original_size, image.size)
+    return PreparedImage(image, source_path=source_path, original_size=original_size, config=config)
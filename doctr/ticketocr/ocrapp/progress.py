@@ -0,0 +1,69 @@
+"""
+Événements d'avancement du pipeline OCR/LLM.
+
+Le job en cours installe un rapporteur dans le contexte ; le pipeline émet
+des événements (moteur démarré/terminé avec sa durée et son texte,
+fournisseur LLM essayé, repli, JSON analysé) qui sont enregistrés en base et
+diffusés à la page d'upload par l'endpoint SSE /jobs/<id>/events/. Hors job
+(traitement dans la requête), emit() ne fait rien. Chaque événement sert
+aussi de battement au job (OCRJob.updated_at) : un job 'running' sans
+battement récent est considéré abandonné (jobs.requeue_stale_jobs).
+"""
+import contextvars
+import logging
+import time
+from contextlib import contextmanager
+
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+_current_reporter = contextvars.ContextVar('ocr_progress_reporter', default=None)
+
+# Intervalle minimal entre deux battements enregistrés (secondes)
+HEARTBEAT_INTERVAL = 5
+
+
+class JobReporter:
+    """Enregistre les événements d'un job (OCRJobEvent)"""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self._last_beat = None
+
+    def emit(self, kind, **data):
+        from .models import OCRJobEvent
+        try:
+            OCRJobEvent.objects.create(job_id=self.job_id, kind=kind, data=data)
+            self.beat()
+        except Exception as e:
+            logger.error("Événement %s du job %s non enregistré: %s", kind, self.job_id, e)
+
+    def beat(self):
+        """Met à jour OCRJob.updated_at, au plus une fois par HEARTBEAT_INTERVAL"""
+        from .models import OCRJob
+        now = time.monotonic()
+        if self._last_beat is not None and now - self._last_beat < HEARTBEAT_INTERVAL:
+            return
+        self._last_beat = now
+        OCRJob.objects.filter(pk=self.job_id).update(updated_at=timezone.now())
+
+
+@contextmanager
+def reporting(reporter):
+    token = _current_reporter.set(reporter)
+    try:
+        yield reporter
+    finally:
+        _current_reporter.reset(token)
+
+
+def current_reporter():
+    """Rapporteur du contexte courant, à transmettre explicitement aux threads des moteurs"""
+    return _current_reporter.get()
+
+
+def emit(kind, reporter=None, **data):
+    reporter = reporter or _current_reporter.get()
+    if reporter is not None:
+        reporter.emit(kind, **data)
@@ -0,0 +1,150 @@
+"""
+Pool persistant de moteurs Tesseract.
+
+Avec tesserocr (binding de l'API C de Tesseract), chaque instance charge les
+données de langue fra+eng une seule fois puis reconnaît les images en mémoire,
+sans lancer de sous-processus. Les instances ne sont pas thread-safe : le pool
+en prête une par thread OCR. Sans tesserocr, le pool se rabat sur pytesseract
+(un sous-processus par image) mais la vérification de version n'est faite
+qu'une fois par worker. tesserocr est optionnel (requirements-tesserocr.txt,
+sans wheel Windows).
+"""
+import logging
+import queue
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+TESSERACT_LANG = 'fra+eng'
+
+
+@lru_cache(maxsize=1)
+def tesseract_status():
+    """
+    Disponibilité et version de Tesseract, vérifiées une seule fois par worker.
+    Retourne {'available', 'backend', 'version', 'error'}
+    """
+    try:
+        import tesserocr
+        return {
+            'available': True,
+            'backend': 'tesserocr',
+            'version': tesserocr.tesseract_version().splitlines()[0],
+            'error': None,
+        }
+    except ImportError:
+        pass
+    except Exception as e:
+        logger.warning("tesserocr inutilisable, repli sur pytesseract: %s", e)
+
+    try:
+        import pytesseract
+        return {
+            'available': True,
+            'backend': 'pytesseract',
+            'version': str(pytesseract.get_tesseract_version()),
+            'error': None,
+        }
+    except Exception as e:
+        return {'available': False, 'backend': None, 'version': None, 'error': str(e)}
+
+
+class TesseractPool:
+    """
+    Instances PyTessBaseAPI réutilisées entre les requêtes du worker
+    """
+
+    def __init__(self, lang=TESSERACT_LANG, size=None):
+        self.lang = lang
+        self._size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    @property
+    def size(self):
+        return self._size or getattr(settings, 'OCR_TESSERACT_POOL_SIZE', 2)
+
+    def _create(self):
+        import tesserocr
+        kwargs = {'lang': self.lang}
+        tessdata = getattr(settings, 'TESSDATA_PREFIX', None)
+        if tessdata:
+            kwargs['path'] = tessdata
+        api = tesserocr.PyTessBaseAPI(**kwargs)
+        logger.info("Instance Tesseract %s créée (%s)", self._created + 1, self.lang)
+        return api
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return self._create()
+                except Exception:
+                    self._created -= 1
+                    raise
+        # Pool complet : attendre qu'une instance se libère
+        return self._idle.get()
+
+    def image_to_string(self, image):
+        """Texte reconnu sur une image PIL"""
+        status = tesseract_status()
+        if status['backend'] != 'tesserocr':
+            import pytesseract
+            return pytesseract.image_to_string(image, lang=self.lang)
+
+        api = self._acquire()
+        try:
+            api.SetImage(image)
+            text = api.GetUTF8Text()
+            with self._lock:
+                self.calls += 1
+            return text
+        finally:
+            # Libère l'image et les résultats même en cas d'erreur : l'instance est réutilisée
+            api.Clear()
+            self._idle.put(api)
+
+    def warm_up(self):
+        """Crée les instances à l'avance (chargement des données de langue)"""
+        if tesseract_status()['backend'] != 'tesserocr':
+            return
+        apis = []
+        try:
+            while len(apis) < self.size:
+                apis.append(self._acquire())
+        finally:
+            for api in apis:
+                self._idle.put(api)
+
+    def close(self):
+        while True:
+            try:
+                api = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            api.End()
+            with self._lock:
+                self._created -= 1
+
+    def stats(self):
+        status = tesseract_status()
+        return {
+            'backend': status['backend'],
+            'version': status['version'],
+            'instances': self._created,
+            'idle': self._idle.qsize(),
+            'calls': self.calls,
+        }
+
+
+pool = TesseractPool()
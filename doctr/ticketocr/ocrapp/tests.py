@@ -1,3 +1,234 @@
-from django.test import TestCase
+import json
 
-# Create your tests here.
+from django.test import SimpleTestCase, override_settings
+
+from .accounting import is_accountable
+from .circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+from .json_extract import extract_ticket_json
+from .llm_stream import TicketStreamParser
+from .ocr_layout import OCRLayout
+from .ocr_registry import EngineStuck, OCREngineRegistry, on_acquired
+
+
+class AccountableAnalysisTests(SimpleTestCase):
+    """Analyses comptabilisées sans validation humaine (ingestion, surveillance)"""
+
+    def ticket(self, **fields):
+        analysis = {"Magasin": "AZIZA", "Date": "18/01/2025 16:44", "Total": "16.070 DT", "Articles": []}
+        analysis.update(fields)
+        return analysis
+
+    def test_complete_ticket(self):
+        self.assertTrue(is_accountable(self.ticket()))
+        self.assertTrue(is_accountable(self.ticket(Date="2025-01-18", Total="16,070")))
+
+    def test_missing_or_unparseable_fields(self):
+        self.assertFalse(is_accountable(self.ticket(Magasin="")))
+        self.assertFalse(is_accountable(self.ticket(Date="")))
+        self.assertFalse(is_accountable(self.ticket(Date="hier")))
+        self.assertFalse(is_accountable(self.ticket(Total="")))
+        self.assertFalse(is_accountable(self.ticket(Total="0.000 DT")))
+        self.assertFalse(is_accountable(self.ticket(Total="NaN")))
+
+    def test_degraded_llm_answers(self):
+        self.assertFalse(is_accountable(None))
+        self.assertFalse(is_accountable({}))
+        self.assertFalse(is_accountable(self.ticket(error="Invalid JSON response from LLM")))
+        # Repli regex : ni magasin ni date
+        self.assertFalse(is_accountable({
+            "Date": "", "Magasin": "", "NumeroTicket": "", "Total": "4.090", "Articles": [],
+            "Commentaire": "Analyse par regex (fallback) - Erreur API: délai dépassé",
+        }))
+
+
+@override_settings(LLM_BREAKER_WINDOW=60, LLM_BREAKER_MIN_CALLS=3, LLM_BREAKER_ERROR_RATE=0.5,
+                   LLM_BREAKER_OPEN_SECONDS=30, LLM_BREAKER_HALF_OPEN_PROBES=1)
+class CircuitBreakerTests(SimpleTestCase):
+    """Machine à états du disjoncteur : fermé, ouvert, semi-ouvert"""
+
+    def failing_call(self, breaker, exception=RuntimeError):
+        with self.assertRaises(exception):
+            with breaker.guard():
+                raise exception("panne")
+
+    def open_breaker(self):
+        breaker = CircuitBreaker('test')
+        for _ in range(3):
+            self.failing_call(breaker)
+        return breaker
+
+    def half_open(self, breaker):
+        # Délai d'ouverture écoulé
+        breaker._opened_at -= breaker.open_seconds
+
+    def test_opens_after_error_rate(self):
+        breaker = CircuitBreaker('test')
+        with breaker.guard():
+            pass
+        self.failing_call(breaker)
+        self.assertEqual(breaker.state, CLOSED)
+        self.failing_call(breaker)
+        self.assertEqual(breaker.state, OPEN)
+        with self.assertRaises(CircuitOpenError):
+            with breaker.guard():
+                pass
+
+    def test_half_open_probe_limit(self):
+        breaker = self.open_breaker()
+        self.half_open(breaker)
+        with breaker.guard():
+            self.assertEqual(breaker.state, HALF_OPEN)
+            # Une seule sonde à la fois
+            with self.assertRaises(CircuitOpenError):
+                with breaker.guard():
+                    pass
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test_failed_probe_reopens(self):
+        breaker = self.open_breaker()
+        self.half_open(breaker)
+        self.failing_call(breaker)
+        self.assertEqual(breaker.state, OPEN)
+
+    def test_interrupted_probe_releases_its_slot(self):
+        breaker = self.open_breaker()
+        self.half_open(breaker)
+        self.failing_call(breaker, KeyboardInterrupt)
+        self.assertEqual(breaker.state, OPEN)
+        self.assertEqual(breaker._probes, 0)
+        self.half_open(breaker)
+        with breaker.guard():
+            pass
+        self.assertEqual(breaker.state, CLOSED)
+
+
+class OCREngineRegistryTests(SimpleTestCase):
+    """Moteur retenu par une inférence hors délai"""
+
+    def setUp(self):
+        self.registry = OCREngineRegistry()
+        self.registry.register('fake', object)
+
+    def test_stuck_engine_is_refused_until_released(self):
+        acquired = []
+        with on_acquired(lambda name, acquisition: acquired.append(acquisition)):
+            with self.registry.use('fake'):
+                self.assertTrue(self.registry.mark_stuck('fake', acquired[0]))
+                self.assertIn('fake', self.registry.stuck_engines())
+                with self.assertRaises(EngineStuck):
+                    with self.registry.use('fake'):
+                        pass
+        self.assertEqual(self.registry.stuck_engines(), {})
+        with self.registry.use('fake'):
+            pass
+
+    def test_finished_inference_is_not_marked(self):
+        acquired = []
+        with on_acquired(lambda name, acquisition: acquired.append(acquisition)):
+            with self.registry.use('fake'):
+                pass
+        self.assertFalse(self.registry.mark_stuck('fake', acquired[0]))
+        self.assertEqual(self.registry.stuck_engines(), {})
+
+
+class OCRLayoutTests(SimpleTestCase):
+    """Mise en page doctr aplatie (user-010)"""
+
+    def export(self):
+        def word(value, confidence, x0, x1, y):
+            return {'value': value, 'confidence': confidence, 'geometry': ((x0, y), (x1, y + 0.05))}
+        return {'pages': [{
+            'dimensions': (1000, 400),
+            'blocks': [
+                {'lines': [{'geometry': ((0.1, 0.1), (0.5, 0.15)), 'words': [
+                    word('AZIZA', 0.99, 0.1, 0.3, 0.1), word('TUNIS', 0.4, 0.32, 0.5, 0.1),
+                ]}]},
+                {'lines': [{'geometry': ((0.1, 0.8), (0.6, 0.85)), 'words': [
+                    word('TOTAL', 0.95, 0.1, 0.3, 0.8), word('4.090', 0.9, 0.4, 0.6, 0.8),
+                ]}]},
+            ],
+        }]}
+
+    def test_lines_and_confidences(self):
+        layout = OCRLayout.from_export(self.export())
+        self.assertEqual(len(layout), 4)
+        self.assertEqual(layout.text(), "AZIZA TUNIS\nTOTAL 4.090")
+        self.assertEqual([line['confidence'] for line in layout.lines()], [0.4, 0.9])
+        self.assertEqual([word['text'] for word in layout.low_confidence_words()], ['TUNIS'])
+        self.assertEqual([word['text'] for word in layout.words_in_region((0, 0.7, 1, 1))], ['TOTAL', '4.090'])
+        self.assertEqual(layout.words_in_region((0, 0.7, 1, 1), page=1), [])
+
+    def test_serialization_round_trip(self):
+        layout = OCRLayout.from_export(self.export())
+        for restored in (OCRLayout.from_bytes(layout.to_bytes()), OCRLayout.decode(layout.encode())):
+            self.assertEqual(restored.lines(), layout.lines())
+            self.assertEqual(restored.page_dimensions.tolist(), [[1000, 400]])
+
+    def test_concat_offsets_pages(self):
+        layout = OCRLayout.from_export(self.export())
+        merged = OCRLayout.concat([layout, None, layout])
+        self.assertEqual(len(merged), 8)
+        self.assertEqual([line['page'] for line in merged.lines()], [0, 0, 1, 1])
+        self.assertEqual(merged.line_blocks.tolist(), [0, 1, 2, 3])
+        self.assertEqual(len(OCRLayout.concat([])), 0)
+
+
+class TicketStreamParserTests(SimpleTestCase):
+    """Détection incrémentale de l'objet du ticket dans un flux (user-024)"""
+
+    TICKET = '{"Magasin": "AZIZA", "Note": "accolade } dans une chaîne \\" échappée", "Total": "4.090 DT"}'
+
+    def feed(self, chunks):
+        parser = TicketStreamParser()
+        for index, chunk in enumerate(chunks):
+            if parser.feed(chunk):
+                return parser, index
+        return parser, None
+
+    def test_split_at_every_character(self):
+        response = '<think>brouillon {"Magasin": "X"}</think>\nVoici : ' + self.TICKET + ' et une explication'
+        parser, index = self.feed(list(response))
+        self.assertEqual(parser.text(), self.TICKET)
+        self.assertEqual(index, response.index(self.TICKET) + len(self.TICKET) - 1)
+
+    def test_skips_objects_without_ticket_fields(self):
+        parser, index = self.feed(['Format {"a": 1} puis ', self.TICKET[:20], self.TICKET[20:]])
+        self.assertEqual(index, 2)
+        self.assertEqual(parser.text(), self.TICKET)
+
+    def test_incomplete_response_is_returned_whole(self):
+        parser, index = self.feed(['Réponse : ', self.TICKET[:30]])
+        self.assertIsNone(index)
+        self.assertTrue(parser.started)
+        self.assertEqual(parser.text(), 'Réponse : ' + self.TICKET[:30])
+
+
+class ExtractTicketJsonTests(SimpleTestCase):
+    """Extraction linéaire du JSON du ticket d'une réponse LLM (user-025)"""
+
+    TICKET = {"Magasin": "AZIZA", "Date": "18/01/2025", "Total": "4.090 DT", "Articles": []}
+
+    def test_reasoning_prose_and_drafts(self):
+        ticket = json.dumps(self.TICKET)
+        response = ('<think>{"Magasin": "brouillon", "Total": "1"}</think>\n'
+                    'Exemple {champ: valeur}. Premier essai : {"Magasin": "X"}\nVersion finale : ' + ticket)
+        self.assertEqual(extract_ticket_json(response), self.TICKET)
+
+    def test_repairs_single_quotes_and_trailing_commas(self):
+        response = "{'Magasin': 'AZIZA', 'Date': '18/01/2025', 'Total': '4.090 DT', 'Articles': [],}"
+        self.assertEqual(extract_ticket_json(response), self.TICKET)
+
+    def test_prose_braces_around_the_ticket(self):
+        response = "Le total } est { selon le ticket " + json.dumps(self.TICKET) + " fin }"
+        self.assertEqual(extract_ticket_json(response), self.TICKET)
+
+    def test_deep_nesting(self):
+        depth = 5000
+        nested = '{"Magasin": "AZIZA", "Total": "4.090 DT", "X": ' + '[' * depth + ']' * depth + '}'
+        self.assertIsNone(extract_ticket_json(nested))
+        self.assertEqual(extract_ticket_json(nested + json.dumps(self.TICKET)), self.TICKET)
+
+    def test_no_ticket(self):
+        self.assertIsNone(extract_ticket_json(None))
+        self.assertIsNone(extract_ticket_json('{"Magasin": "AZIZA"'))
+        self.assertIsNone(extract_ticket_json('{"a": 1} {"Magasin": "seul champ"}'))
@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import upload_ticket, download_accounting_excel, download_cumulative_excel, view_history, filter_accounting_data, manage_budget, get_ticket_details, update_ticket, save_ticket_analysis
+from .views import upload_ticket, download_accounting_excel, download_cumulative_excel, view_history, filter_accounting_data, manage_budget, get_ticket_details, update_ticket, save_ticket_analysis, job_status, job_events, pipeline_metrics, health_status
 
 urlpatterns = [
     path('', upload_ticket, name='upload_ticket'),
@@ -11,4 +11,8 @@ urlpatterns = [
     path('ticket/<int:ticket_id>/', get_ticket_details, name='get_ticket_details'),
     path('ticket/<int:ticket_id>/update/', update_ticket, name='update_ticket'),
     path('save-ticket-analysis/', save_ticket_analysis, name='save_ticket_analysis'),
+    path('jobs/<int:job_id>/', job_status, name='job_status'),
+    path('jobs/<int:job_id>/events/', job_events, name='job_events'),
+    path('metrics', pipeline_metrics, name='pipeline_metrics'),
+    path('health', health_status, name='health_status'),
 ]
@@ -0,0 +1,243 @@
+"""
+Dossier surveillé : les tickets déposés par les scanners sont traités dès
+leur arrivée.
+
+Les événements inotify (watchdog) marquent un fichier comme « en cours
+d'écriture » ; il n'est pris en charge qu'après OCR_WATCH_DEBOUNCE_SECONDS
+sans nouvel événement et à taille stable. Les fichiers prêts passent par une
+file bornée (OCR_WATCH_QUEUE_SIZE) vers OCR_WATCH_WORKERS threads qui
+exécutent le même pipeline que upload_ticket (OCR → LLM) puis l'écriture
+comptable. File pleine : les fichiers restent sur le disque, en attente,
+jusqu'à ce qu'une place se libère (aucun traitement n'est perdu ni dupliqué).
+"""
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+
+from django.conf import settings
+from django.core.files import File
+from django.db import close_old_connections
+
+from .ingest import is_ticket_file
+from .models import ExtractionHistory
+from .ocr_cache import hash_file
+
+logger = logging.getLogger(__name__)
+
+
+class TicketWatcher:
+    """
+    Surveillance d'un dossier et traitement des tickets déposés
+    """
+
+    def __init__(self, directory, workers=None, queue_size=None, debounce=None,
+                 analysis='ocr_llm', archive_dir=None, polling=False, log=print):
+        self.directory = os.path.abspath(directory)
+        self.workers = workers or getattr(settings, 'OCR_WATCH_WORKERS', 2)
+        self.debounce = debounce if debounce is not None else getattr(settings, 'OCR_WATCH_DEBOUNCE_SECONDS', 2.0)
+        self.analysis = analysis
+        self.archive_dir = archive_dir
+        self.polling = polling
+        self.log = log
+        self._queue = queue.Queue(maxsize=queue_size or getattr(settings, 'OCR_WATCH_QUEUE_SIZE', 16))
+        self._pending = {}  # chemin -> (dernier événement, taille)
+        self._active = set()  # chemins en file ou en traitement
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+        self._observer = None
+        self.counts = {'processed': 0, 'accounted': 0, 'ocr_only': 0, 'skipped': 0, 'failed': 0, 'deferred': 0}
+
+    # Détection
+
+    def notify(self, path):
+        """Événement sur un fichier : (re)lance le délai d'attente"""
+        if not is_ticket_file(path) or self._is_archived(path):
+            return
+        with self._lock:
+            if path in self._active:
+                return
+            self._pending[path] = (time.monotonic(), self._size(path))
+
+    def scan(self):
+        """Fichiers déjà présents au démarrage (déposés pendant un arrêt)"""
+        for root, dirs, files in os.walk(self.directory):
+            for name in files:
+                self.notify(os.path.join(root, name))
+
+    def _is_archived(self, path):
+        return bool(self.archive_dir) and os.path.abspath(path).startswith(os.path.abspath(self.archive_dir) + os.sep)
+
+    @staticmethod
+    def _size(path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return None
+
+    def ready_paths(self, now=None):
+        """
+        Fichiers sans événement depuis le délai et dont la taille n'a pas
+        bougé depuis le dernier événement ; les autres restent en attente
+        """
+        now = now if now is not None else time.monotonic()
+        ready = []
+        with self._lock:
+            for path, (last_event, size) in list(self._pending.items()):
+                if now - last_event < self.debounce:
+                    continue
+                current = self._size(path)
+                if current is None:
+                    # Fichier supprimé ou renommé avant d'être pris en charge
+                    del self._pending[path]
+                elif current != size or current == 0:
+                    self._pending[path] = (now, current)
+                else:
+                    ready.append((last_event, path))
+        return [path for _, path in sorted(ready)]
+
+    # Distribution
+
+    def dispatch(self):
+        """Boucle de distribution : fichiers prêts vers la file bornée"""
+        interval = max(0.1, self.debounce / 4)
+        while not self._stop.is_set():
+            for path in self.ready_paths():
+                if not self._enqueue(path):
+                    break
+            self._stop.wait(interval)
+
+    def _enqueue(self, path):
+        try:
+            self._queue.put(path, timeout=1)
+        except queue.Full:
+            # Contre-pression : le fichier reste en attente sur le disque
+            self._count('deferred')
+            logger.info("File de traitement pleine (%s), %s reporté", self._queue.maxsize, path)
+            return False
+        with self._lock:
+            self._pending.pop(path, None)
+            self._active.add(path)
+        return True
+
+    def work(self):
+        while not self._stop.is_set():
+            try:
+                path = self._queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            try:
+                self.process_file(path)
+            finally:
+                with self._lock:
+                    self._active.discard(path)
+                self._queue.task_done()
+
+    # Traitement
+
+    def process_file(self, path):
+        """OCR → LLM → écriture comptable d'un ticket déposé"""
+        from .accounting import is_accountable
+        from .views import generate_accounting_report, run_ticket_analysis
+
+        close_old_connections()
+        name = os.path.relpath(path, self.directory)
+        start = time.perf_counter()
+        try:
+            content_hash = hash_file(path)
+            if ExtractionHistory.objects.filter(content_hash=content_hash).exists():
+                self._count('skipped')
+                self.log(f"Déjà ingéré: {name}")
+                self._archive(path)
+                return None
+
+            instance = ExtractionHistory(content_hash=content_hash)
+            with open(path, 'rb') as f:
+                instance.image.save(os.path.basename(path), File(f))
+            results = run_ticket_analysis(instance, self.analysis)
+            analysis = results.get('llm_analysis') or results.get('gemini_analysis')
+            # Sans magasin, date et total lisibles : OCR seul, à valider à la main
+            if is_accountable(analysis):
+                generate_accounting_report(analysis, save_to_db=True)
+                self._count('accounted')
+            else:
+                self._count('ocr_only')
+            self._count('processed')
+            self.log(f"Ticket traité: {name} ({time.perf_counter() - start:.1f}s, extraction {instance.pk})")
+            self._archive(path)
+            return instance
+        except Exception as e:
+            self._count('failed')
+            logger.exception("Traitement de %s impossible", path)
+            self.log(f"Échec {name}: {e}")
+            return None
+
+    def _count(self, key):
+        with self._lock:
+            self.counts[key] += 1
+
+    def _archive(self, path):
+        if not self.archive_dir:
+            return
+        target = os.path.join(self.archive_dir, os.path.relpath(path, self.directory))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.move(path, target)
+
+    # Cycle de vie
+
+    def _observer_class(self):
+        if self.polling:
+            # Partages réseau (SMB/NFS) : inotify n'y voit pas les écritures distantes
+            from watchdog.observers.polling import PollingObserver
+            return PollingObserver
+        from watchdog.observers import Observer
+        return Observer
+
+    def start(self):
+        from watchdog.events import FileSystemEventHandler
+
+        watcher = self
+
+        class Handler(FileSystemEventHandler):
+            def on_created(self, event):
+                if not event.is_directory:
+                    watcher.notify(event.src_path)
+
+            def on_modified(self, event):
+                if not event.is_directory:
+                    watcher.notify(event.src_path)
+
+            def on_moved(self, event):
+                if not event.is_directory:
+                    watcher.notify(event.dest_path)
+
+        if self.archive_dir:
+            os.makedirs(self.archive_dir, exist_ok=True)
+        self._stop.clear()
+        self._observer = self._observer_class()()
+        self._observer.schedule(Handler(), self.directory, recursive=True)
+        self._observer.start()
+        self.scan()
+
+        self._threads = [threading.Thread(target=self.dispatch, name='watch-dispatch', daemon=True)]
+        self._threads += [
+            threading.Thread(target=self.work, name=f'watch-worker-{index}', daemon=True)
+            for index in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join(timeout)
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts, waiting=len(self._pending), queued=self._queue.qsize(), active=len(self._active))
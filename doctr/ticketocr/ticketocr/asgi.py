@@ -7,10 +7,36 @@ For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
 
+import asyncio
 import os
 
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ticketocr.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+
+async def application(scope, receive, send):
+    # Django ne gère pas le protocole lifespan : on l'utilise pour charger les
+    # moteurs OCR au démarrage du worker et les libérer à l'arrêt
+    if scope["type"] != "lifespan":
+        return await django_application(scope, receive, send)
+
+    from django.conf import settings
+    from ocrapp.ocr_registry import registry
+    from ocrapp.tesseract_pool import pool as tesseract_pool
+
+    loop = asyncio.get_running_loop()
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            if getattr(settings, "OCR_PRELOAD_ENGINES", False):
+                await loop.run_in_executor(None, registry.preload)
+                await loop.run_in_executor(None, tesseract_pool.warm_up)
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await loop.run_in_executor(None, registry.clear)
+            await loop.run_in_executor(None, tesseract_pool.close)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
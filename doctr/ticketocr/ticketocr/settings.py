@@ -134,3 +134,118 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 # Google API Key for Gemini
 GOOGLE_API_KEY = os.environ.get('GOOGLE_API_KEY', '')
+
+# Moteurs OCR partagés (doctr, docling) : préchargement et budget mémoire
+OCR_PRELOAD_ENGINES = os.environ.get('OCR_PRELOAD_ENGINES', 'True') == 'True'
+OCR_ENGINE_MEMORY_BUDGET_MB = int(os.environ.get('OCR_ENGINE_MEMORY_BUDGET_MB', '2048'))  # 0 = illimité
+OCR_ENGINE_IDLE_TIMEOUT = int(os.environ.get('OCR_ENGINE_IDLE_TIMEOUT', '3600'))  # secondes, 0 = jamais
+
+# Étape OCR concurrente : taille du pool et délai maximal par moteur (secondes)
+OCR_MAX_WORKERS = int(os.environ.get('OCR_MAX_WORKERS', '6'))
+OCR_ENGINE_TIMEOUTS = {
+    'tesseract': int(os.environ.get('OCR_TIMEOUT_TESSERACT', '60')),
+    'doctr': int(os.environ.get('OCR_TIMEOUT_DOCTR', '120')),
+    'docling': int(os.environ.get('OCR_TIMEOUT_DOCLING', '180')),
+}
+
+# Cache des résultats OCR (clé : SHA-256 de l'image + moteur/version/config)
+OCR_CACHE_ENABLED = os.environ.get('OCR_CACHE_ENABLED', 'True') == 'True'
+OCR_CACHE_MAX_ENTRIES = int(os.environ.get('OCR_CACHE_MAX_ENTRIES', '30000'))  # 0 = illimité
+OCR_CACHE_MAX_AGE_DAYS = int(os.environ.get('OCR_CACHE_MAX_AGE_DAYS', '180'))  # 0 = illimité
+
+# Cache des extractions LLM (clé : textes OCR normalisés + fournisseur/modèle/version du prompt)
+LLM_CACHE_ENABLED = os.environ.get('LLM_CACHE_ENABLED', 'True') == 'True'
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get('LLM_CACHE_MAX_ENTRIES', '10000'))  # 0 = illimité
+LLM_CACHE_TTL_HOURS = int(os.environ.get('LLM_CACHE_TTL_HOURS', str(24 * 30)))  # 0 = jamais
+
+# Client HTTP des serveurs LLM : connexions keep-alive par hôte, pool borné,
+# délai de connexion (s) distinct du délai de lecture, nouveaux essais avec jitter
+LLM_HTTP_POOL_SIZE = int(os.environ.get('LLM_HTTP_POOL_SIZE', '10'))
+LLM_HTTP_CONNECT_TIMEOUT = float(os.environ.get('LLM_HTTP_CONNECT_TIMEOUT', '3'))
+LLM_HTTP_RETRIES = int(os.environ.get('LLM_HTTP_RETRIES', '2'))
+LLM_HTTP_BACKOFF = float(os.environ.get('LLM_HTTP_BACKOFF', '0.25'))  # secondes, doublé à chaque essai
+
+# Sortie contrainte par le schéma du ticket (Ollama `format`, OpenAI `response_format`)
+LLM_STRUCTURED_OUTPUT = os.environ.get('LLM_STRUCTURED_OUTPUT', 'True') == 'True'
+
+# Réponses en flux, lues jusqu'à l'objet JSON du ticket complet ; raisonnement
+# désactivé pour les modèles qui le permettent (`/no_think` de Qwen3)
+LLM_STREAMING = os.environ.get('LLM_STREAMING', 'True') == 'True'
+LLM_SUPPRESS_REASONING = os.environ.get('LLM_SUPPRESS_REASONING', 'True') == 'True'
+
+# Routage LLM : 'hedge' (fournisseur suivant lancé après un échec ou LLM_HEDGE_DELAY s),
+# 'race' (tous en parallèle) ou 'waterfall' (ancienne cascade en série)
+LLM_ROUTER_MODE = os.environ.get('LLM_ROUTER_MODE', 'hedge')
+LLM_ROUTER_PROVIDERS = ['huggingface', 'ollama/mistral', 'ollama/llama2']
+LLM_HEDGE_DELAY = float(os.environ.get('LLM_HEDGE_DELAY', '4'))
+LLM_ROUTER_TIMEOUT = int(os.environ.get('LLM_ROUTER_TIMEOUT', '45'))  # secondes, toutes tentatives comprises
+LLM_ROUTER_WORKERS = int(os.environ.get('LLM_ROUTER_WORKERS', '6'))
+
+# Disjoncteurs par fournisseur LLM : ouverts au-delà du taux d'échec sur la fenêtre glissante,
+# puis semi-ouverts (requête de sonde) après LLM_BREAKER_OPEN_SECONDS
+LLM_BREAKER_WINDOW = int(os.environ.get('LLM_BREAKER_WINDOW', '60'))  # secondes
+LLM_BREAKER_MIN_CALLS = int(os.environ.get('LLM_BREAKER_MIN_CALLS', '3'))
+LLM_BREAKER_ERROR_RATE = float(os.environ.get('LLM_BREAKER_ERROR_RATE', '0.5'))
+LLM_BREAKER_OPEN_SECONDS = int(os.environ.get('LLM_BREAKER_OPEN_SECONDS', '30'))
+LLM_BREAKER_HALF_OPEN_PROBES = int(os.environ.get('LLM_BREAKER_HALF_OPEN_PROBES', '1'))
+
+# Prétraitement unique des images avant OCR (voir ocrapp/preprocessing.py)
+OCR_PREPROCESS = {
+    'max_side': int(os.environ.get('OCR_PREPROCESS_MAX_SIDE', '2000')),
+    'grayscale': True,
+    'deskew': os.environ.get('OCR_PREPROCESS_DESKEW', 'False') == 'True',
+    'binarize': os.environ.get('OCR_PREPROCESS_BINARIZE', 'False') == 'True',
+}
+
+# Mode OCR : 'all' (les 3 moteurs) ou 'adaptive' (premier moteur seul si sa lecture est suffisante)
+OCR_MODE = os.environ.get('OCR_MODE', 'adaptive')
+OCR_ADAPTIVE_ORDER = ['doctr', 'tesseract', 'docling']
+OCR_ADAPTIVE_THRESHOLD = float(os.environ.get('OCR_ADAPTIVE_THRESHOLD', '0.75'))
+
+# OCR doctr groupé : nombre de tickets par passe d'inférence (ingestion en masse)
+OCR_DOCTR_BATCH_SIZE = int(os.environ.get('OCR_DOCTR_BATCH_SIZE', '8'))
+
+# Micro-batching doctr entre requêtes concurrentes : lot vidé à MAX images ou après la fenêtre
+OCR_DOCTR_MICROBATCH = os.environ.get('OCR_DOCTR_MICROBATCH', 'True') == 'True'
+OCR_DOCTR_MICROBATCH_MAX = int(os.environ.get('OCR_DOCTR_MICROBATCH_MAX', str(OCR_DOCTR_BATCH_SIZE)))
+OCR_DOCTR_MICROBATCH_WINDOW_MS = int(os.environ.get('OCR_DOCTR_MICROBATCH_WINDOW_MS', '30'))
+
+# Pool Tesseract persistant (tesserocr) : instances gardées en mémoire par worker
+OCR_TESSERACT_POOL_SIZE = int(os.environ.get('OCR_TESSERACT_POOL_SIZE', '2'))
+TESSDATA_PREFIX = os.environ.get('TESSDATA_PREFIX') or None
+
+# PDF : rastérisation page par page (résolution en DPI) et nombre de pages lues en parallèle
+OCR_PDF_STREAMING = os.environ.get('OCR_PDF_STREAMING', 'True') == 'True'
+OCR_PDF_DPI = int(os.environ.get('OCR_PDF_DPI', '200'))
+OCR_PDF_PAGE_WORKERS = int(os.environ.get('OCR_PDF_PAGE_WORKERS', '2'))
+
+# File des traitements OCR/LLM en base : l'upload rend la main, des workers en arrière-plan traitent
+OCR_ASYNC_JOBS = os.environ.get('OCR_ASYNC_JOBS', 'True') == 'True'
+OCR_JOB_WORKERS = int(os.environ.get('OCR_JOB_WORKERS', '2'))  # threads par processus serveur
+OCR_JOB_POLL_INTERVAL = float(os.environ.get('OCR_JOB_POLL_INTERVAL', '2'))  # secondes
+OCR_JOB_STALE_SECONDS = int(os.environ.get('OCR_JOB_STALE_SECONDS', '900'))  # job 'running' sans battement (étape, événement) considéré abandonné
+OCR_JOB_MAX_ATTEMPTS = int(os.environ.get('OCR_JOB_MAX_ATTEMPTS', '2'))
+
+# Flux SSE d'avancement des jobs (/jobs/<id>/events/)
+OCR_PROGRESS_POLL_INTERVAL = float(os.environ.get('OCR_PROGRESS_POLL_INTERVAL', '0.3'))  # secondes
+OCR_PROGRESS_STREAM_TIMEOUT = int(os.environ.get('OCR_PROGRESS_STREAM_TIMEOUT', '600'))  # secondes
+# Sous WSGI chaque flux retient un thread du serveur : flux simultanés par processus (503 au-delà).
+# Sous ASGI (ticketocr.asgi) le flux est asynchrone et n'est pas plafonné
+OCR_PROGRESS_MAX_STREAMS = int(os.environ.get('OCR_PROGRESS_MAX_STREAMS', '8'))
+
+# Ingestion en masse (manage.py ingest_tickets) : nombre de processus OCR
+OCR_INGEST_WORKERS = int(os.environ.get('OCR_INGEST_WORKERS', '2'))
+
+# Dossier surveillé (manage.py watch_tickets) : délai sans écriture avant prise en charge,
+# traitements simultanés et taille de la file (au-delà, les fichiers attendent sur le disque)
+OCR_WATCH_DEBOUNCE_SECONDS = float(os.environ.get('OCR_WATCH_DEBOUNCE_SECONDS', '2'))
+OCR_WATCH_WORKERS = int(os.environ.get('OCR_WATCH_WORKERS', '2'))
+OCR_WATCH_QUEUE_SIZE = int(os.environ.get('OCR_WATCH_QUEUE_SIZE', '16'))
+
+# Points d'accès des LLM (surchargés par benchmark_pipeline.py vers son serveur factice)
+OLLAMA_BASE_URL = os.environ.get('OLLAMA_BASE_URL', 'http://localhost:11434')
+HF_BASE_URL = os.environ.get('HF_BASE_URL', 'https://router.huggingface.co/v1')
+
+# Contrôles de santé en arrière-plan (/health) : période et délai de l'appel à Ollama, en secondes
+OCR_HEALTH_INTERVAL = int(os.environ.get('OCR_HEALTH_INTERVAL', '30'))
+OCR_HEALTH_TIMEOUT = float(os.environ.get('OCR_HEALTH_TIMEOUT', '2'))